@@ -0,0 +1,96 @@
+'''
+Воспроизводимые синтетические наборы точек для замеров и нагрузочных тестов: большая часть
+точек — в плотных центрах городов, остальные рассеяны по обширным областям вне городов.
+Число точек у пользователей неравномерно: у немногих пользователей большая часть точек.
+При одинаковом seed генерируется та же последовательность.
+
+Область, доли точек вне городов, скрытых и удалённых точек задаются параметрами PointGenerator;
+в области region точки вне городов распределены по всей области, а города вне её не используются.
+'''
+import math
+import random
+from poim.points import geohash
+
+
+# Центры городов: широта, долгота, относительная доля точек
+CITIES = [
+    (55.7558, 37.6173, 25),  # Москва
+    (59.9343, 30.3351, 15),  # Санкт-Петербург
+    (55.0084, 82.9357, 5),  # Новосибирск
+    (56.8389, 60.6057, 5),  # Екатеринбург
+    (55.7963, 49.1088, 4),  # Казань
+    (48.8566, 2.3522, 8),  # Париж
+    (51.5074, -0.1278, 8),  # Лондон
+    (52.5200, 13.4050, 6),  # Берлин
+    (41.9028, 12.4964, 4),  # Рим
+    (40.7128, -74.0060, 8),  # Нью-Йорк
+    (35.6762, 139.6503, 8),  # Токио
+    (-33.8688, 151.2093, 4),  # Сидней
+]
+
+# Стандартное отклонение координат точек города от центра, в градусах широты
+CITY_SPREAD = 0.1
+
+# Доля точек вне городов и их области: юг, запад, север, восток
+RURAL_SHARE = 0.3
+RURAL_AREAS = [
+    (36, -10, 70, 60),
+    (42, 60, 65, 140),
+    (30, -120, 50, -75),
+    (-40, 115, -15, 150),
+]
+
+# Доли скрытых и удалённых точек
+UNLISTED_SHARE = 0.05
+DELETED_SHARE = 0.05
+
+
+class PointGenerator:
+    def __init__(self, seed=0, users=1, region=None, rural_share=RURAL_SHARE, unlisted_share=UNLISTED_SHARE,
+            deleted_share=DELETED_SHARE):
+        'region — (юг, запад, север, восток) или None'
+        self.random = random.Random(seed)
+        self.users = users
+        self.unlisted_share = unlisted_share
+        self.deleted_share = deleted_share
+
+        if region is None:
+            self.cities, self.rural_areas = CITIES, RURAL_AREAS
+        else:
+            south, west, north, east = region
+            self.cities = [city for city in CITIES if south <= city[0] <= north and west <= city[1] <= east]
+            self.rural_areas = [region]
+        self.rural_share = rural_share if self.cities else 1
+        self.city_weights = [weight for latitude, longitude, weight in self.cities]
+
+    def city(self):
+        'Центр города (широта, долгота) с вероятностью по доле точек'
+        latitude, longitude, weight = self.random.choices(self.cities, self.city_weights)[0]
+        return latitude, longitude
+
+    def location(self):
+        if self.random.random() < self.rural_share:
+            south, west, north, east = self.random.choice(self.rural_areas)
+            return self.random.uniform(south, north), self.random.uniform(west, east)
+
+        latitude, longitude = self.city()
+        latitude = min(max(self.random.gauss(latitude, CITY_SPREAD), -90), 90)
+        longitude = self.random.gauss(longitude, CITY_SPREAD / math.cos(math.radians(latitude)))
+        return latitude, min(max(longitude, -180), 180)
+
+    def user(self):
+        'Номер пользователя от 0 до users - 1'
+        return (int(self.random.paretovariate(1.2)) - 1) % self.users
+
+    def point(self, number):
+        'Поля точки с номером number; user — номер пользователя, deleted — признак удаления'
+        latitude, longitude = self.location()
+        return {
+            'user': self.user(),
+            'title': 'Point {}'.format(number),
+            'latitude': latitude,
+            'longitude': longitude,
+            'geohash': geohash.encode(latitude, longitude),
+            'unlisted': self.random.random() < self.unlisted_share,
+            'deleted': self.random.random() < self.deleted_share,
+        }
@@ -0,0 +1,90 @@
+from django.db import models
+
+
+# Выражения над функциями расширений cube и earthdistance (см. миграцию 0002_create_extensions).
+# Точка на поверхности Земли представляется типом earth — точкой cube в трёхмерных
+# декартовых координатах, поэтому earth_box корректен на любой широте.
+
+
+class LLToEarth(models.Func):
+    'll_to_earth(latitude, longitude)'
+
+    function = 'll_to_earth'
+    output_field = models.Field()
+
+
+class EarthBox(models.Func):
+    'earth_box(earth, radius_meters): куб, содержащий все точки в пределах радиуса'
+
+    function = 'earth_box'
+    output_field = models.Field()
+
+
+class EarthDistance(models.Func):
+    'earth_distance(earth, earth): расстояние по поверхности Земли в метрах'
+
+    function = 'earth_distance'
+    output_field = models.FloatField()
+
+
+class CubeContains(models.Func):
+    'cube @> cube; поддерживается GiST-индексом по второму аргументу'
+
+    template = '(%(expressions)s)'
+    arg_joiner = ' @> '
+    output_field = models.BooleanField()
+
+
+class CubeDistance(models.Func):
+    'cube <-> cube; сортировка по этому оператору выполняется обходом GiST-индекса (KNN)'
+
+    template = '(%(expressions)s)'
+    arg_joiner = ' <-> '
+    output_field = models.FloatField()
+
+
+class ShiftRight(models.Func):
+    'integer >> bits: деление на 2^bits с округлением вниз, в том числе для отрицательных чисел'
+
+    template = '(%(expressions)s)'
+    arg_joiner = ' >> '
+    output_field = models.IntegerField()
+
+    def __init__(self, expression, bits):
+        super().__init__(expression, models.Value(bits))
+
+
+# Полнотекстовый поиск по названиям точек. Конфигурация simple не зависит от языка: слова только
+# приводятся к нижнему регистру. Выражение TitleVector совпадает с выражением частичного GIN-индекса
+# points_point_visible_title (миграция 0009_point_title_search), иначе индекс не используется.
+
+
+class TitleVector(models.Func):
+    "to_tsvector('simple', text)"
+
+    template = "to_tsvector('simple', %(expressions)s)"
+    output_field = models.Field()
+
+
+class TitleQuery(models.Func):
+    "to_tsquery('simple', query)"
+
+    template = "to_tsquery('simple', %(expressions)s)"
+    output_field = models.Field()
+
+
+class TextMatch(models.Func):
+    'tsvector @@ tsquery; поддерживается GIN-индексом по первому аргументу'
+
+    template = '(%(expressions)s)'
+    arg_joiner = ' @@ '
+    output_field = models.BooleanField()
+
+
+class TextRank(models.Func):
+    'ts_rank(tsvector, tsquery): релевантность по числу и близости найденных слов'
+
+    # ts_rank возвращает real; в double precision значение из курсора постраничной выдачи
+    # сравнивается с вычисленным точно
+    template = 'ts_rank(%(expressions)s)::double precision'
+    output_field = models.FloatField()
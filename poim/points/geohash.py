@@ -0,0 +1,74 @@
+'''
+Геохэш: ключ ячейки Z-порядка в алфавите base32. Точки ячейки — строки с общим префиксом,
+поэтому поиск по ячейке сводится к диапазону по btree-индексу и не требует cube/earthdistance.
+
+Размер ячейки (широта × долгота) для длины префикса, на экваторе:
+
+    1 — 5000 × 5000 км       7 — 153 × 153 м
+    2 — 625 × 1250 км        8 — 19 × 38 м
+    3 — 156 × 156 км         9 — 4,8 × 4,8 м
+    4 — 19,5 × 39 км         10 — 0,6 × 1,2 м
+    5 — 4,9 × 4,9 км         11 — 15 × 15 см
+    6 — 0,61 × 1,2 км        12 — 1,9 × 3,7 см
+
+По долготе ячейки сужаются пропорционально косинусу широты.
+'''
+
+ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+MAX_PRECISION = 12
+
+
+def encode(latitude, longitude, precision=MAX_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    result = []
+    bits = 0
+    value = 0
+    even = True
+
+    while len(result) < precision:
+        # Биты долготы и широты чередуются, начиная с долготы
+        coordinate, bounds = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (bounds[0] + bounds[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+
+        bits += 1
+        if bits == 5:
+            result.append(ALPHABET[value])
+            bits = 0
+            value = 0
+
+    return ''.join(result)
+
+
+def bounds(cell):
+    'Границы ячейки: (south, west, north, east)'
+    value = 0
+    for char in cell:
+        value = value << 5 | ALPHABET.index(char)
+
+    # Разбор чередующихся битов, начиная со старшего бита долготы
+    bits = 5 * len(cell)
+    lat_bits, lon_bits = bits // 2, bits - bits // 2
+    lat_cell = lon_cell = 0
+    for shift in range(bits - 1, -1, -1):
+        bit = value >> shift & 1
+        if (bits - 1 - shift) % 2:
+            lat_cell = lat_cell << 1 | bit
+        else:
+            lon_cell = lon_cell << 1 | bit
+
+    lat_size, lon_size = 180 / (1 << lat_bits), 360 / (1 << lon_bits)
+    return (lat_cell * lat_size - 90, lon_cell * lon_size - 180,
+            (lat_cell + 1) * lat_size - 90, (lon_cell + 1) * lon_size - 180)
+
+
+def is_valid(cell):
+    return 0 < len(cell) <= MAX_PRECISION and all(c in ALPHABET for c in cell)
@@ -0,0 +1,271 @@
+import binascii
+import io
+import os
+import json
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils.timezone import now
+from rest_framework.authtoken.models import Token
+from poim.points.datasets import PointGenerator
+from poim.points.models import Point
+
+
+USERNAME_PREFIX = 'benchmark_'
+
+SCENARIOS = ['list', 'list_paginated', 'geo', 'detail', 'create', 'update', 'delete_undelete']
+
+# Ожидаемые коды ответов запросов сценариев
+EXPECTED_STATUS = {'GET': 200, 'POST': 201, 'PATCH': 200, 'DELETE': 204}
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный замер API точек через WSGI-приложение в процессе: создаёт пользователей и точки ' \
+        'с неравномерным размещением (см. poim.points.datasets), выполняет сценарии в нескольких потоках ' \
+        'и выводит задержки (p50, p95, p99) и пропускную способность в JSON для сравнения между версиями. ' \
+        'Запускается с настройками poim_api; созданные данные удаляются после замеров.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Число пользователей.')
+        parser.add_argument('--points', type=int, default=100000, help='Число точек.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--concurrency', type=int, default=8, help='Число потоков, выполняющих запросы.')
+        parser.add_argument('--requests', type=int, default=1000, help='Число запросов каждого сценария.')
+        parser.add_argument('--pages', type=int, default=5, help='Число страниц в сценарии list_paginated.')
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+            help='Сценарии через запятую: {}.'.format(', '.join(SCENARIOS)))
+        parser.add_argument('--output', help='Файл результатов; по умолчанию вывод в stdout.')
+        parser.add_argument('--keep', action='store_true', help='Не удалять созданные данные.')
+
+    def handle(self, *args, **options):
+        if settings.ROOT_URLCONF != 'poim_api.urls':
+            raise CommandError('Run with poim_api settings: --settings=poim_api.settings')
+
+        scenarios = options['scenarios'].split(',')
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError('Unknown scenarios: {}.'.format(', '.join(sorted(unknown))))
+
+        self.options = options
+        self.application = WSGIHandler()
+        self.generator = PointGenerator(options['seed'], options['users'])
+
+        self.delete_dataset()
+        started = time.perf_counter()
+        self.seed_dataset()
+        self.stderr.write('Seeded {} users and {} points in {:.0f} s'.format(
+            options['users'], options['points'], time.perf_counter() - started))
+
+        try:
+            results = {}
+            for name in scenarios:
+                cache.clear()
+                results[name] = self.run_scenario(name)
+                self.stderr.write('{}: {}'.format(name, json.dumps(results[name])))
+        finally:
+            if not options['keep']:
+                self.delete_dataset()
+
+        report = {
+            'commit': self.get_commit(),
+            'dataset': {name: options[name] for name in ['users', 'points', 'seed']},
+            'concurrency': options['concurrency'],
+            # Настройки, от которых заметно зависят результаты
+            'settings': {
+                'POINTS_LIST_CACHE_SECONDS': settings.POINTS_LIST_CACHE_SECONDS,
+                'CONN_MAX_AGE': settings.DATABASES['default'].get('CONN_MAX_AGE', 0),
+                'DATABASE_REPLICAS': settings.DATABASE_REPLICAS,
+            },
+            'scenarios': results,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def get_commit(self):
+        try:
+            return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR,
+                stderr=subprocess.DEVNULL).decode().strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def delete_dataset(self):
+        users = get_user_model().objects.filter(username__startswith=USERNAME_PREFIX)
+        Point.all_objects.filter(user__in=users).delete()
+        users.delete()
+
+    def seed_dataset(self):
+        options = self.options
+        User = get_user_model()
+        with transaction.atomic():
+            users = User.objects.bulk_create([
+                User(username='{}{}'.format(USERNAME_PREFIX, i), email='{}{}@example.com'.format(USERNAME_PREFIX, i))
+                for i in range(options['users'])
+            ])
+            tokens = Token.objects.bulk_create([
+                Token(key=binascii.hexlify(os.urandom(20)).decode(), user=user) for user in users])
+
+        # Видимые точки для чтения и пары (токен, id) точек пользователей для изменения
+        self.tokens = [token.key for token in tokens]
+        self.visible_ids = []
+        self.owned = []
+
+        batch_size = 5000
+        date_deleted = now()
+        for start in range(0, options['points'], batch_size):
+            fields = [self.generator.point(number) for number in range(start, min(start + batch_size, options['points']))]
+            with transaction.atomic():
+                points = Point.all_objects.bulk_create([Point(
+                    user=users[point['user']],
+                    title=point['title'],
+                    latitude=point['latitude'],
+                    longitude=point['longitude'],
+                    geohash=point['geohash'],
+                    unlisted=point['unlisted'],
+                    date_deleted=date_deleted if point['deleted'] else None,
+                ) for point in fields])
+
+            for point, values in zip(points, fields):
+                if not values['unlisted'] and not values['deleted']:
+                    self.visible_ids.append(point.id)
+                    self.owned.append((self.tokens[values['user']], point.id))
+
+    def run_scenario(self, name):
+        options = self.options
+        concurrency = options['concurrency']
+        scenario = getattr(self, 'scenario_' + name)
+        latencies, errors = [], []
+
+        def worker(index):
+            # Свой генератор и своя доля точек для изменения в каждом потоке
+            rnd = random.Random('{}-{}-{}'.format(options['seed'], name, index))
+            owned = self.owned[index::concurrency]
+            count = options['requests'] // concurrency + (index < options['requests'] % concurrency)
+            try:
+                done = 0
+                while done < count:
+                    for status, expected, latency in scenario(rnd, owned):
+                        latencies.append(latency)
+                        if status != expected:
+                            errors.append(status)
+                        done += 1
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            list(executor.map(worker, range(concurrency)))
+        duration = time.perf_counter() - started
+
+        latencies.sort()
+        return {
+            'requests': len(latencies),
+            'errors': len(errors),
+            'duration_s': round(duration, 3),
+            'throughput_rps': round(len(latencies) / duration, 1),
+            'latency_ms': {
+                'p50': self.percentile(latencies, 0.5),
+                'p95': self.percentile(latencies, 0.95),
+                'p99': self.percentile(latencies, 0.99),
+                'mean': round(sum(latencies) / len(latencies), 3),
+                'max': round(latencies[-1], 3),
+            },
+        }
+
+    def percentile(self, values, q):
+        return round(values[min(int(len(values) * q), len(values) - 1)], 3)
+
+    def request(self, method, path, token=None, data=None):
+        'Запрос к WSGI-приложению; (код ответа, ожидаемый код, задержка в мс, заголовки, тело)'
+        path, _, query = path.partition('?')
+        body = json.dumps(data).encode('utf-8') if data is not None else b''
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(body)),
+            'HTTP_ACCEPT': 'application/json',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        if token:
+            environ['HTTP_AUTHORIZATION'] = 'Token ' + token
+
+        result = {}
+
+        def start_response(status, headers, exc_info=None):
+            result['status'] = int(status.split(' ', 1)[0])
+            result['headers'] = dict(headers)
+
+        started = time.perf_counter()
+        response = self.application(environ, start_response)
+        try:
+            content = b''.join(response)
+        finally:
+            response.close()
+        latency = (time.perf_counter() - started) * 1000
+
+        return result['status'], EXPECTED_STATUS[method], latency, result['headers'], content
+
+    def scenario_list(self, rnd, owned):
+        yield self.request('GET', '/points')[:3]
+
+    def scenario_list_paginated(self, rnd, owned):
+        path = '/points?page_size=50'
+        token = rnd.choice(self.tokens)
+        for page in range(self.options['pages']):
+            status, expected, latency, headers, content = self.request('GET', path, token)
+            yield status, expected, latency
+            link = headers.get('Link')
+            if status != expected or not link:
+                return
+            path = link[link.index('/points'):link.index('>')]
+
+    def scenario_geo(self, rnd, owned):
+        latitude, longitude = self.generator.city()
+        latitude += rnd.uniform(-0.1, 0.1)
+        longitude += rnd.uniform(-0.1, 0.1)
+        yield self.request('GET', '/points?geo={:.6f},{:.6f},{}'.format(
+            latitude, longitude, rnd.randint(1000, 10000)))[:3]
+
+    def scenario_detail(self, rnd, owned):
+        yield self.request('GET', '/points/{}'.format(rnd.choice(self.visible_ids)))[:3]
+
+    def scenario_create(self, rnd, owned):
+        latitude, longitude = self.generator.city()
+        yield self.request('POST', '/points', rnd.choice(self.tokens), {
+            'title': 'Benchmark point',
+            'latitude': latitude + rnd.uniform(-0.1, 0.1),
+            'longitude': longitude + rnd.uniform(-0.1, 0.1),
+            'unlisted': False,
+        })[:3]
+
+    def scenario_update(self, rnd, owned):
+        token, id = rnd.choice(owned)
+        yield self.request('PATCH', '/points/{}'.format(id), token, {'title': 'Point {}'.format(rnd.random())})[:3]
+
+    def scenario_delete_undelete(self, rnd, owned):
+        token, id = rnd.choice(owned)
+        yield self.request('DELETE', '/points/{}'.format(id), token)[:3]
+        yield self.request('DELETE', '/points/{}/deleted'.format(id), token)[:3]
@@ -0,0 +1,192 @@
+import importlib
+import io
+import random
+import statistics
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils.timezone import now
+from poim.points import geohash
+
+
+migration = importlib.import_module('poim.points.migrations.0008_point_partial_indexes')
+
+TABLE = 'points_point_benchmark'
+COLUMNS = 'id, user_id, date_created, date_modified, unlisted, date_deleted, title, latitude, longitude, ' \
+    'geohash, change_txid'
+
+# Индексы, общие для обоих наборов
+COMMON_INDEXES = ['btree (user_id)', 'btree (date_modified)', 'btree (change_txid, id)']
+
+INDEX_SETS = [
+    ('before', [(definition, None) for name, definition in migration.OLD_INDEXES]),
+    ('after', [(definition, migration.VISIBLE) for name, definition in migration.INDEXES]),
+]
+
+SELECT = 'SELECT id, title, latitude, longitude, unlisted, user_id FROM {} ' \
+    'WHERE date_deleted IS NULL AND unlisted = false'.format(TABLE)
+
+EARTH = 'll_to_earth(latitude, longitude)'
+CENTER = 'll_to_earth(%(latitude)s, %(longitude)s)'
+
+# Запросы в форме, которую строят PointListView и фильтры
+QUERIES = [
+    ('list', SELECT + ' ORDER BY id DESC LIMIT 101'),
+    ('list, deep page', SELECT + ' AND id < %(id)s ORDER BY id DESC LIMIT 101'),
+    ('bbox', SELECT + ' AND latitude BETWEEN %(south)s AND %(north)s AND longitude BETWEEN %(west)s AND %(east)s '
+        'ORDER BY id DESC LIMIT 101'),
+    ('cell', SELECT + ' AND geohash LIKE %(cell)s ORDER BY id DESC LIMIT 101'),
+    ('geo', 'SELECT * FROM (' + SELECT.replace(' FROM', ', earth_distance({0}, {1}) AS distance FROM') +
+        ' AND earth_box({1}, 3000) @> {0}) t WHERE distance <= 3000 ORDER BY distance, id LIMIT 101'),
+    ('nearest', SELECT + ' ORDER BY {0} <-> {1} LIMIT 20'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Сравнение прежних одностолбцовых и частичных индексов точек (миграция 0008_point_partial_indexes) ' \
+        'на синтетической таблице: время выполнения запросов списка и скорость вставки. Таблица удаляется после замеров.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000, help='Число точек в таблице.')
+        parser.add_argument('--inserts', type=int, default=5000,
+            help='Число вставок по одной точке; при массовой вставке — в 10 раз больше.')
+        parser.add_argument('--repeat', type=int, default=20, help='Число повторов каждого запроса.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.centers = [(self.random.uniform(-40, 65), self.random.uniform(-120, 140)) for i in range(20)]
+
+        with connection.cursor() as cursor:
+            try:
+                self.create_table(cursor, options['rows'])
+                results = [self.measure(cursor, name, indexes, options) for name, indexes in INDEX_SETS]
+            finally:
+                cursor.execute('DROP TABLE IF EXISTS {}'.format(TABLE))
+
+        before, after = results
+        self.stdout.write('{} points, server execution time, median of {} runs, ms'.format(options['rows'], options['repeat']))
+        for name, query in QUERIES:
+            self.stdout.write('{:<20} {:>8.2f}  ->  {:>8.2f}   x{:.2f}'.format(
+                name, before[name], after[name], before[name] / after[name]))
+
+        for name in ['inserts', 'bulk inserts']:
+            self.stdout.write('{:<20} {:>8.0f}  ->  {:>8.0f}   x{:.2f}'.format(
+                name + ', 1/s', before[name], after[name], after[name] / before[name]))
+        self.stdout.write('{:<20} {:>8.1f}  ->  {:>8.1f}'.format(
+            'index size, MB', before['size'] / 2 ** 20, after['size'] / 2 ** 20))
+
+    def make_row(self, id, date):
+        # Большая часть точек — в плотных областях вокруг городов, остальные рассеяны
+        if self.random.random() < 0.7:
+            latitude, longitude = self.random.choice(self.centers)
+            latitude = min(max(self.random.gauss(latitude, 0.2), -90), 90)
+            longitude = min(max(self.random.gauss(longitude, 0.3), -180), 180)
+        else:
+            latitude, longitude = self.random.uniform(-60, 75), self.random.uniform(-180, 180)
+
+        deleted = self.random.random() < 0.1
+        return [
+            id,
+            int(self.random.paretovariate(1.2)) % 10000 + 1,
+            date,
+            date,
+            't' if self.random.random() < 0.05 else 'f',
+            date if deleted else None,
+            'Point {}'.format(id),
+            latitude,
+            longitude,
+            geohash.encode(latitude, longitude),
+            0,
+        ]
+
+    def create_table(self, cursor, rows):
+        cursor.execute('DROP TABLE IF EXISTS {}'.format(TABLE))
+        cursor.execute('CREATE TABLE {0} (LIKE points_point); ALTER TABLE {0} ADD PRIMARY KEY (id)'.format(TABLE))
+
+        started = now() - timedelta(seconds=rows)
+        self.copy(cursor, TABLE, (self.make_row(id, (started + timedelta(seconds=id)).isoformat())
+            for id in range(1, rows + 1)))
+
+    def copy(self, cursor, table, rows):
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write('\t'.join('\\N' if value is None else str(value) for value in row))
+            buffer.write('\n')
+
+        buffer.seek(0)
+        cursor.copy_expert('COPY {} ({}) FROM STDIN'.format(table, COLUMNS), buffer)
+
+    def measure(self, cursor, name, indexes, options):
+        cursor.execute('SELECT indexname FROM pg_indexes WHERE tablename = %s AND indexname != %s',
+            [TABLE, TABLE + '_pkey'])
+        for index, in cursor.fetchall():
+            cursor.execute('DROP INDEX {}'.format(index))
+
+        for definition in COMMON_INDEXES:
+            cursor.execute('CREATE INDEX ON {} USING {}'.format(TABLE, definition))
+        for definition, where in indexes:
+            where = ' WHERE ' + where if where else ''
+            cursor.execute('CREATE INDEX ON {} USING {}{}'.format(TABLE, definition, where))
+        cursor.execute('VACUUM ANALYZE {}'.format(TABLE))
+
+        results = {}
+        for query_name, query in QUERIES:
+            timings = []
+            # Время выполнения на сервере, без передачи строк; первый запрос — прогрев кэша
+            for i in range(options['repeat'] + 1):
+                cursor.execute('EXPLAIN (ANALYZE, TIMING OFF, FORMAT JSON) ' + query.format(EARTH, CENTER),
+                    self.query_params(options['rows']))
+                plan, = cursor.fetchone()
+                timings.append(plan[0]['Execution Time'])
+            results[query_name] = statistics.median(timings[1:])
+
+        results['inserts'], results['bulk inserts'] = self.measure_inserts(cursor, options)
+
+        cursor.execute('SELECT pg_indexes_size(%s)', [TABLE])
+        results['size'], = cursor.fetchone()
+        return results
+
+    def query_params(self, rows):
+        latitude, longitude = self.random.choice(self.centers)
+        latitude += self.random.uniform(-0.2, 0.2)
+        longitude += self.random.uniform(-0.2, 0.2)
+        return {
+            'id': self.random.randint(1, rows),
+            'latitude': latitude,
+            'longitude': longitude,
+            'south': latitude - 0.1,
+            'north': latitude + 0.1,
+            'west': longitude - 0.15,
+            'east': longitude + 0.15,
+            'cell': geohash.encode(latitude, longitude, 5) + '%',
+        }
+
+    def measure_inserts(self, cursor, options):
+        '''
+        Вставки в секунду: по одной строке, как при добавлении точек через API, и одной командой
+        из временной таблицы, как при массовой загрузке (PointLoader). Изменения откатываются.
+        '''
+        date = now().isoformat()
+        rows = [self.make_row(options['rows'] + i + 1, date) for i in range(options['inserts'] * 10)]
+        single_rows = rows[:options['inserts']]
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(TABLE, COLUMNS, ', '.join(['%s'] * len(rows[0])))
+
+        with transaction.atomic():
+            started = time.perf_counter()
+            for row in single_rows:
+                cursor.execute(sql, row)
+            single = len(single_rows) / (time.perf_counter() - started)
+            transaction.set_rollback(True)
+
+        with transaction.atomic():
+            cursor.execute('CREATE TEMPORARY TABLE {0}_import (LIKE {0}) ON COMMIT DROP'.format(TABLE))
+            self.copy(cursor, TABLE + '_import', rows)
+
+            started = time.perf_counter()
+            cursor.execute('INSERT INTO {0} SELECT * FROM {0}_import'.format(TABLE))
+            bulk = len(rows) / (time.perf_counter() - started)
+            transaction.set_rollback(True)
+
+        return single, bulk
@@ -0,0 +1,63 @@
+import statistics
+import time
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from poim.points.models import Point
+
+
+class Command(BaseCommand):
+    help = 'Сравнение выдачи списка точек через PointSerializer и PointValuesSerializer ' \
+        'и рендеринга через JSONRenderer и FastJSONRenderer. Запускается с настройками poim_api.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Число точек в списке.')
+        parser.add_argument('--repeat', type=int, default=5, help='Число повторов каждого замера.')
+
+    def handle(self, *args, **options):
+        try:
+            from poim_api.points.serializers import PointSerializer, PointValuesSerializer
+            from poim_api.utils import renderers
+        except ImportError as e:
+            raise CommandError('poim_api is required: {}'.format(e))
+
+        queryset = Point.objects.filter(unlisted=False).order_by('-id')[:options['rows']]
+        context = {'request': _Request(AnonymousUser())}
+
+        def model_serializer():
+            return PointSerializer(list(queryset), many=True, context=context).data
+
+        def values_serializer():
+            serializer = PointValuesSerializer(context)
+            return serializer.to_representation(list(serializer.get_rows(queryset)))
+
+        data = values_serializer()
+        if renderers.JSONRenderer().render(model_serializer()) != renderers.JSONRenderer().render(data):
+            raise CommandError('PointValuesSerializer output differs from PointSerializer.')
+
+        self.stdout.write('{} points, best and median of {} runs, ms; orjson {}installed'.format(
+            len(data), options['repeat'], '' if renderers.orjson else 'not '))
+
+        self.compare('query + serialize', options['repeat'], model_serializer, values_serializer)
+        self.compare(
+            'render', options['repeat'],
+            lambda: renderers.JSONRenderer().render(data),
+            lambda: renderers.FastJSONRenderer().render(data),
+        )
+
+    def compare(self, name, repeat, before, after):
+        before, after = self.measure(before, repeat), self.measure(after, repeat)
+        self.stdout.write('{:<20} {:>8.1f} {:>8.1f}  ->  {:>8.1f} {:>8.1f}   x{:.2f}'.format(
+            name, *before, *after, before[0] / after[0]))
+
+    def measure(self, function, repeat):
+        timings = []
+        for i in range(repeat):
+            started = time.perf_counter()
+            function()
+            timings.append((time.perf_counter() - started) * 1000)
+        return min(timings), statistics.median(timings)
+
+
+class _Request:
+    def __init__(self, user):
+        self.user = user
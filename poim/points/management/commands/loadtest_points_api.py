@@ -0,0 +1,160 @@
+import asyncio
+import random
+import time
+from urllib.parse import urlsplit
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест запущенного сервера poim_api клиентами карты: каждый клиент держит ' \
+        'keep-alive соединение и между паузами запрашивает точки области, точку или (с долей --slow) ' \
+        'медленный поиск по большому радиусу. Выводит задержки быстрых и медленных запросов отдельно.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8052', help='Адрес сервера.')
+        parser.add_argument('--clients', type=int, default=2000, help='Число одновременных клиентов.')
+        parser.add_argument('--duration', type=float, default=30, help='Длительность теста, в секундах.')
+        parser.add_argument('--ramp', type=float, default=5, help='Время подключения всех клиентов, в секундах.')
+        parser.add_argument('--think', type=float, default=2, help='Средняя пауза клиента между запросами, в секундах.')
+        parser.add_argument('--slow', type=float, default=0.01, help='Доля медленных запросов.')
+        parser.add_argument('--timeout', type=float, default=60, help='Время ожидания ответа, в секундах.')
+        parser.add_argument('--max-id', type=int, default=100000, help='Наибольший id точки в запросах точки.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError('Only http:// URLs are supported.')
+
+        self.options = options
+        self.host, self.port = url.hostname, url.port or 80
+        self.random = random.Random(options['seed'])
+        self.latencies = {'fast': [], 'slow': []}
+        self.errors = 0
+        self.connects = 0
+        self.open_connections = 0
+        self.max_open_connections = 0
+
+        loop = asyncio.get_event_loop()
+        started = time.monotonic()
+        self.deadline = started + options['ramp'] + options['duration']
+        loop.run_until_complete(asyncio.gather(*[self.client() for i in range(options['clients'])]))
+        elapsed = time.monotonic() - started
+
+        requests = sum(len(latencies) for latencies in self.latencies.values())
+        self.stdout.write('{} clients, {:.0f} s: {} requests, {:.0f} requests/s, {} errors'.format(
+            options['clients'], elapsed, requests, requests / elapsed, self.errors))
+        self.stdout.write('connections: {} opened, {} open at most'.format(self.connects, self.max_open_connections))
+        for kind, latencies in sorted(self.latencies.items()):
+            if latencies:
+                quantiles = self.quantiles(latencies)
+                self.stdout.write('{:<5} {:>7} requests, ms: p50 {:.1f}  p95 {:.1f}  p99 {:.1f}  max {:.1f}'.format(
+                    kind, len(latencies), *quantiles, max(latencies)))
+
+    def quantiles(self, values):
+        values = sorted(values)
+        return [values[min(int(len(values) * q), len(values) - 1)] for q in (0.5, 0.95, 0.99)]
+
+    def choose_request(self):
+        latitude, longitude = self.random.uniform(55, 60), self.random.uniform(30, 38)
+        if self.random.random() < self.options['slow']:
+            return 'slow', '/points?geo={:.5f},{:.5f},500000&page_size=1000'.format(latitude, longitude)
+        if self.random.random() < 0.5:
+            return 'fast', '/points/{}'.format(self.random.randint(1, self.options['max_id']))
+        return 'fast', '/points?bbox={:.5f},{:.5f},{:.5f},{:.5f}'.format(
+            latitude, longitude, latitude + 0.05, longitude + 0.1)
+
+    async def client(self):
+        await asyncio.sleep(self.random.uniform(0, self.options['ramp']))
+
+        connection = Connection(self)
+        while time.monotonic() < self.deadline:
+            kind, path = self.choose_request()
+            started = time.monotonic()
+            status = await connection.get(path)
+
+            if status is None or status >= 500:
+                self.errors += 1
+            else:
+                self.latencies[kind].append((time.monotonic() - started) * 1000)
+
+            think = self.random.expovariate(1 / self.options['think'])
+            await asyncio.sleep(min(think, max(self.deadline - time.monotonic(), 0)))
+
+        connection.close()
+
+
+class Connection:
+    'Keep-alive соединение клиента с сервером'
+
+    def __init__(self, command):
+        self.command = command
+        self.reader = self.writer = None
+
+    async def open(self):
+        command = self.command
+        self.reader, self.writer = await asyncio.open_connection(command.host, command.port)
+        command.connects += 1
+        command.open_connections += 1
+        command.max_open_connections = max(command.max_open_connections, command.open_connections)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+            self.command.open_connections -= 1
+
+    async def get(self, path):
+        'Статус ответа или None при ошибке'
+        # Сервер закрывает простаивающие соединения: запрос повторяется в новом соединении,
+        # как это делают браузеры
+        for retry in [self.writer is not None, False]:
+            try:
+                if self.writer is None:
+                    await self.open()
+                status, keep_alive = await asyncio.wait_for(self.request(path), self.command.options['timeout'])
+            except (ConnectionError, EOFError):
+                self.close()
+                if retry:
+                    continue
+                return None
+            except (OSError, asyncio.TimeoutError, ValueError):
+                self.close()
+                return None
+
+            if not keep_alive:
+                self.close()
+            return status
+
+    async def request(self, path):
+        'GET-запрос HTTP/1.1; (статус, соединение остаётся открытым)'
+        reader, writer = self.reader, self.writer
+        writer.write('GET {} HTTP/1.1\r\nHost: {}\r\nAccept: application/json\r\n\r\n'.format(
+            path, self.command.host).encode('latin-1'))
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise EOFError()
+        version, status = status_line.split()[:2]
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip().lower()
+
+        if 'content-length' in headers:
+            await reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding') == 'chunked':
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                await reader.readexactly(size + 2)
+                if not size:
+                    break
+        else:
+            await reader.read()
+            return int(status), False
+
+        return int(status), version == b'HTTP/1.1' and headers.get('connection') != 'close'
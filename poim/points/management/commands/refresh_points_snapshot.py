@@ -0,0 +1,31 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from poim.points.snapshot import refresh_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Построение и обновление снимка видимых точек в POINTS_SNAPSHOT_PATH.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Построить снимок заново.')
+        parser.add_argument('--interval', type=float, help='Обновлять снимок с заданным интервалом в секундах.')
+
+    def handle(self, *args, **options):
+        path = settings.POINTS_SNAPSHOT_PATH
+        if not path:
+            raise CommandError('POINTS_SNAPSHOT_PATH is not set.')
+
+        full = options['full']
+        while True:
+            changed = refresh_snapshot(path, full=full)
+            if changed is None:
+                self.stdout.write('Snapshot rebuilt.')
+            elif changed:
+                self.stdout.write('Snapshot updated: {} changed points.'.format(changed))
+
+            if not options['interval']:
+                break
+
+            full = False
+            time.sleep(options['interval'])
@@ -0,0 +1,231 @@
+import importlib
+import multiprocessing
+import random
+import time
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.utils.timezone import now
+from poim.points.datasets import DELETED_SHARE, RURAL_SHARE, UNLISTED_SHARE, PointGenerator
+from poim.points.models import PointCluster
+
+
+migration = importlib.import_module('poim.points.migrations.0008_point_partial_indexes')
+
+USER_COLUMNS = 'password, is_superuser, username, first_name, last_name, email, is_staff, is_active, date_joined'
+TOKEN_COLUMNS = 'key, created, user_id'
+POINT_COLUMNS = 'user_id, date_created, date_modified, unlisted, date_deleted, title, latitude, longitude, geohash'
+
+# Триггеры агрегатов кластеров (миграции 0004_pointcluster и 0010_pointcluster_min_stored_zoom) отключаются
+# на время загрузки с --drop-indexes и удаления, а агрегаты хранимых масштабов строятся заново тем же запросом,
+# что и в миграции
+REBUILD_CLUSTERS = '''
+    INSERT INTO points_pointcluster (zoom, cell_y, cell_x, count, sum_latitude, sum_longitude, sample_id)
+    SELECT z, floor(latitude * 2 ^ z / 45), floor(longitude * 2 ^ z / 45),
+        count(*), sum(latitude), sum(longitude), max(id)
+    FROM points_point, generate_series({}, {}) AS z
+    WHERE {}
+    GROUP BY 1, 2, 3
+'''.format(PointCluster.MIN_STORED_ZOOM, PointCluster.MAX_ZOOM, migration.VISIBLE)
+
+
+class RowStream:
+    'Файлоподобный объект для COPY FROM STDIN: строки формируются по мере чтения, в памяти только блок'
+
+    def __init__(self, lines):
+        self.lines = lines
+
+    def read(self, size=-1):
+        chunk, length = [], 0
+        for line in self.lines:
+            chunk.append(line)
+            length += len(line)
+            if 0 < size <= length:
+                break
+        return ''.join(chunk)
+
+
+def copy(cursor, table, columns, lines):
+    cursor.copy_expert('COPY {} ({}) FROM STDIN'.format(table, columns), RowStream(lines), size=1 << 16)
+
+
+def copy_points(task):
+    '''
+    Загрузка точек с номерами от start до stop одной командой COPY в отдельной транзакции.
+    Генератор точек свой у каждого блока, поэтому набор не зависит от числа процессов.
+    '''
+    start, stop, options, user_ids, started = task
+    generator = PointGenerator('{}-{}'.format(options['seed'], start), len(user_ids), options['region'],
+        options['rural_share'], options['unlisted'], options['deleted'])
+    span = timedelta(days=options['days'])
+    end = started + span
+
+    def lines():
+        for number in range(start, stop):
+            point = generator.point(number)
+            # Даты создания растут с номером точки, как у точек, добавленных через API
+            date_created = started + span * (number / options['points'])
+            date_deleted = date_created + (end - date_created) * generator.random.random() if point['deleted'] else None
+            yield '{}\t{}\t{}\t{}\t{}\t{}\t{!r}\t{!r}\t{}\n'.format(
+                user_ids[point['user']],
+                date_created.isoformat(),
+                (date_deleted or date_created).isoformat(),
+                't' if point['unlisted'] else 'f',
+                date_deleted.isoformat() if date_deleted else '\\N',
+                point['title'],
+                point['latitude'],
+                point['longitude'],
+                point['geohash'],
+            )
+
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            copy(cursor, 'points_point', POINT_COLUMNS, lines())
+    finally:
+        connection.close()
+    return stop - start
+
+
+class Command(BaseCommand):
+    help = 'Быстрое заполнение БД синтетическими пользователями, токенами и точками (см. poim.points.datasets) ' \
+        'командой COPY FROM STDIN: строки формируются по мере передачи, блоками по --batch точек в отдельных ' \
+        'транзакциях, при --jobs > 1 — в нескольких процессах. С --drop-indexes индексы точек, кроме первичного ' \
+        'ключа, и агрегаты кластеров строятся заново после загрузки. Имена пользователей начинаются с --prefix; ' \
+        'данные удаляются с --delete.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Число пользователей.')
+        parser.add_argument('--points', type=int, default=1000000, help='Число точек.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='seed_', help='Начало имён создаваемых пользователей.')
+        parser.add_argument('--region', type=self.parse_region,
+            help='Область точек: юг,запад,север,восток в градусах; по умолчанию — города и области poim.points.datasets.')
+        parser.add_argument('--rural-share', type=float, default=RURAL_SHARE, help='Доля точек вне городов.')
+        parser.add_argument('--unlisted', type=float, default=UNLISTED_SHARE, help='Доля скрытых точек.')
+        parser.add_argument('--deleted', type=float, default=DELETED_SHARE, help='Доля удалённых точек.')
+        parser.add_argument('--days', type=float, default=365,
+            help='Даты создания точек равномерно распределены по этому числу последних дней.')
+        parser.add_argument('--batch', type=int, default=500000, help='Число точек в одной транзакции.')
+        parser.add_argument('--jobs', type=int, default=1, help='Число процессов загрузки точек.')
+        parser.add_argument('--drop-indexes', action='store_true',
+            help='Удалить индексы точек на время загрузки и построить заново после неё.')
+        parser.add_argument('--delete', action='store_true',
+            help='Удалить пользователей с префиксом --prefix, их токены и точки.')
+
+    def parse_region(self, value):
+        try:
+            south, west, north, east = map(float, value.split(','))
+        except ValueError:
+            raise CommandError('Region must be south,west,north,east.')
+        if not (-90 <= south < north <= 90 and -180 <= west < east <= 180):
+            raise CommandError('Invalid region: {}.'.format(value))
+        return south, west, north, east
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.filter(username__startswith=options['prefix'])
+        if options['delete']:
+            self.delete_dataset(users)
+            return
+
+        if users.exists():
+            raise CommandError('Users with prefix {!r} already exist; use --delete or another --prefix.'.format(
+                options['prefix']))
+
+        started = time.perf_counter()
+        self.seed_users(options)
+        user_ids = list(users.order_by('id').values_list('id', flat=True))
+        self.stderr.write('Seeded {} users and tokens in {:.1f} s'.format(len(user_ids), time.perf_counter() - started))
+
+        if options['drop_indexes']:
+            indexes = self.drop_indexes()
+        try:
+            started = time.perf_counter()
+            self.seed_points(options, user_ids)
+            loaded = time.perf_counter() - started
+        finally:
+            if options['drop_indexes']:
+                self.rebuild(indexes)
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE points_point')
+
+        total = time.perf_counter() - started
+        self.stdout.write('Seeded {} points: load {:.0f} s ({:.0f} points/s), total {:.0f} s ({:.0f} points/s)'.format(
+            options['points'], loaded, options['points'] / loaded, total, options['points'] / total))
+
+    def seed_users(self, options):
+        # Пароль непригоден для входа; пользователи работают с API по токенам
+        password = make_password(None)
+        date_joined = now().isoformat()
+        rnd = random.Random(options['seed'])
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            copy(cursor, 'auth_user', USER_COLUMNS, ('{0}\tf\t{1}{2}\t\t\t{1}{2}@example.com\tf\tt\t{3}\n'.format(
+                password, options['prefix'], number, date_joined) for number in range(options['users'])))
+            cursor.execute('CREATE TEMPORARY TABLE seed_tokens (key varchar(40), number integer) ON COMMIT DROP')
+            copy(cursor, 'seed_tokens', 'key, number', ('{:040x}\t{}\n'.format(rnd.getrandbits(160), number)
+                for number in range(options['users'])))
+            cursor.execute('INSERT INTO authtoken_token ({}) SELECT t.key, %s, u.id FROM seed_tokens AS t '
+                'JOIN auth_user AS u ON u.username = %s || t.number'.format(TOKEN_COLUMNS),
+                [date_joined, options['prefix']])
+
+    def seed_points(self, options, user_ids):
+        started = now() - timedelta(days=options['days'])
+        tasks = [(start, min(start + options['batch'], options['points']), options, user_ids, started)
+            for start in range(0, options['points'], options['batch'])]
+
+        # Дочерние процессы открывают свои соединения
+        connections.close_all()
+        progress = time.perf_counter()
+        done = 0
+        with multiprocessing.Pool(options['jobs']) as pool:
+            for count in pool.imap_unordered(copy_points, tasks):
+                done += count
+                self.stderr.write('{}/{} points, {:.0f} points/s'.format(
+                    done, options['points'], done / (time.perf_counter() - progress)))
+
+    def drop_indexes(self):
+        'Удаление индексов точек, кроме первичного ключа, и отключение триггера кластеров; определения индексов'
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SELECT indexname, indexdef FROM pg_indexes WHERE tablename = 'points_point' "
+                "AND indexname != 'points_point_pkey' ORDER BY indexname")
+            indexes = cursor.fetchall()
+            for name, definition in indexes:
+                cursor.execute('DROP INDEX {}'.format(name))
+            cursor.execute('ALTER TABLE points_point DISABLE TRIGGER points_point_clusters_insert')
+        return indexes
+
+    def rebuild(self, indexes):
+        started = time.perf_counter()
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('ALTER TABLE points_point ENABLE TRIGGER points_point_clusters_insert')
+            self.rebuild_clusters(cursor)
+        self.stderr.write('Rebuilt point clusters in {:.0f} s'.format(time.perf_counter() - started))
+
+        with connection.cursor() as cursor:
+            cursor.execute("SET maintenance_work_mem = '1GB'")
+            for name, definition in indexes:
+                started = time.perf_counter()
+                cursor.execute(definition)
+                self.stderr.write('Created index {} in {:.0f} s'.format(name, time.perf_counter() - started))
+            cursor.execute('RESET maintenance_work_mem')
+
+    def rebuild_clusters(self, cursor):
+        # Изменения точек в других транзакциях ждут окончания построения
+        cursor.execute('LOCK TABLE points_point IN SHARE MODE')
+        cursor.execute('DELETE FROM points_pointcluster')
+        cursor.execute(REBUILD_CLUSTERS)
+
+    def delete_dataset(self, users):
+        user_ids, params = users.values('id').query.sql_with_params()
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('ALTER TABLE points_point DISABLE TRIGGER points_point_clusters_delete')
+            cursor.execute('DELETE FROM points_point WHERE user_id IN ({})'.format(user_ids), params)
+            points = cursor.rowcount
+            cursor.execute('ALTER TABLE points_point ENABLE TRIGGER points_point_clusters_delete')
+            self.rebuild_clusters(cursor)
+            cursor.execute('DELETE FROM authtoken_token WHERE user_id IN ({})'.format(user_ids), params)
+            cursor.execute('DELETE FROM auth_user WHERE id IN ({})'.format(user_ids), params)
+            self.stdout.write('Deleted {} users and {} points.'.format(cursor.rowcount, points))
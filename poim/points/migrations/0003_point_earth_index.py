@@ -0,0 +1,15 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('points', '0002_create_extensions'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX points_point_earth_gist ON points_point USING gist (ll_to_earth(latitude, longitude))',
+            reverse_sql='DROP INDEX points_point_earth_gist',
+        ),
+    ]
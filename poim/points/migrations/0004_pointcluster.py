@@ -0,0 +1,130 @@
+# Generated by Django 2.0.3 on 2026-10-18 16:56
+
+from django.db import migrations, models
+
+
+# Ячейка масштаба z: floor(coordinate * 2^z / 45), то есть 8 ячеек на тайл (PointCluster.CELLS_PER_TILE),
+# масштабы от 0 до 12 (PointCluster.MAX_ZOOM). Видимая точка — как в PointListView.queryset:
+# date_deleted IS NULL AND NOT unlisted.
+
+CREATE_FUNCTIONS = """
+CREATE FUNCTION points_pointcluster_apply(ids integer[], latitudes float8[], longitudes float8[], signs integer[])
+RETURNS void AS $$
+    INSERT INTO points_pointcluster AS c (zoom, cell_y, cell_x, count, sum_latitude, sum_longitude, sample_id)
+    SELECT z, floor(d.latitude * 2 ^ z / 45), floor(d.longitude * 2 ^ z / 45),
+        sum(d.sign), sum(d.sign * d.latitude), sum(d.sign * d.longitude),
+        max(d.id) FILTER (WHERE d.sign > 0)
+    FROM unnest(ids, latitudes, longitudes, signs) AS d (id, latitude, longitude, sign),
+        generate_series(0, 12) AS z
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3
+    ON CONFLICT (zoom, cell_y, cell_x) DO UPDATE SET
+        count = c.count + EXCLUDED.count,
+        sum_latitude = c.sum_latitude + EXCLUDED.sum_latitude,
+        sum_longitude = c.sum_longitude + EXCLUDED.sum_longitude,
+        sample_id = CASE WHEN c.count <= 0 OR c.sample_id = ANY(ids) THEN EXCLUDED.sample_id ELSE c.sample_id END;
+
+    -- Точка-образец убрана из ячейки, а другая не добавлена: выбирается любая из оставшихся
+    UPDATE points_pointcluster AS c SET sample_id = (
+        SELECT p.id FROM points_point AS p
+        WHERE p.date_deleted IS NULL AND NOT p.unlisted
+            AND p.latitude >= c.cell_y * 45 / 2 ^ c.zoom AND p.latitude < (c.cell_y + 1) * 45 / 2 ^ c.zoom
+            AND p.longitude >= c.cell_x * 45 / 2 ^ c.zoom AND p.longitude < (c.cell_x + 1) * 45 / 2 ^ c.zoom
+        LIMIT 1
+    )
+    WHERE c.sample_id IS NULL AND c.count > 0;
+$$ LANGUAGE sql;
+
+CREATE INDEX points_pointcluster_no_sample ON points_pointcluster (id) WHERE sample_id IS NULL AND count > 0;
+
+CREATE FUNCTION points_point_update_clusters() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM points_pointcluster_apply(array_agg(id), array_agg(latitude), array_agg(longitude), array_agg(1))
+        FROM new_points
+        WHERE date_deleted IS NULL AND NOT unlisted
+        HAVING count(*) > 0;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM points_pointcluster_apply(array_agg(id), array_agg(latitude), array_agg(longitude), array_agg(-1))
+        FROM old_points
+        WHERE date_deleted IS NULL AND NOT unlisted
+        HAVING count(*) > 0;
+    ELSE
+        PERFORM points_pointcluster_apply(array_agg(d.id), array_agg(d.latitude), array_agg(d.longitude), array_agg(d.sign))
+        FROM (
+            SELECT o.id, o.latitude, o.longitude, -1 AS sign, o.date_deleted IS NULL AND NOT o.unlisted AS visible
+            FROM old_points AS o JOIN new_points AS n USING (id)
+            WHERE (o.latitude, o.longitude, o.unlisted, o.date_deleted IS NULL)
+                IS DISTINCT FROM (n.latitude, n.longitude, n.unlisted, n.date_deleted IS NULL)
+            UNION ALL
+            SELECT n.id, n.latitude, n.longitude, 1, n.date_deleted IS NULL AND NOT n.unlisted
+            FROM old_points AS o JOIN new_points AS n USING (id)
+            WHERE (o.latitude, o.longitude, o.unlisted, o.date_deleted IS NULL)
+                IS DISTINCT FROM (n.latitude, n.longitude, n.unlisted, n.date_deleted IS NULL)
+        ) AS d
+        WHERE d.visible
+        HAVING count(*) > 0;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER points_point_clusters_insert AFTER INSERT ON points_point
+    REFERENCING NEW TABLE AS new_points
+    FOR EACH STATEMENT EXECUTE PROCEDURE points_point_update_clusters();
+CREATE TRIGGER points_point_clusters_update AFTER UPDATE ON points_point
+    REFERENCING OLD TABLE AS old_points NEW TABLE AS new_points
+    FOR EACH STATEMENT EXECUTE PROCEDURE points_point_update_clusters();
+CREATE TRIGGER points_point_clusters_delete AFTER DELETE ON points_point
+    REFERENCING OLD TABLE AS old_points
+    FOR EACH STATEMENT EXECUTE PROCEDURE points_point_update_clusters();
+
+INSERT INTO points_pointcluster (zoom, cell_y, cell_x, count, sum_latitude, sum_longitude, sample_id)
+SELECT z, floor(latitude * 2 ^ z / 45), floor(longitude * 2 ^ z / 45),
+    count(*), sum(latitude), sum(longitude), max(id)
+FROM points_point, generate_series(0, 12) AS z
+WHERE date_deleted IS NULL AND NOT unlisted
+GROUP BY 1, 2, 3;
+"""
+
+DROP_FUNCTIONS = """
+DROP TRIGGER points_point_clusters_insert ON points_point;
+DROP TRIGGER points_point_clusters_update ON points_point;
+DROP TRIGGER points_point_clusters_delete ON points_point;
+DROP FUNCTION points_point_update_clusters();
+DROP FUNCTION points_pointcluster_apply(integer[], float8[], float8[], integer[]);
+DROP INDEX points_pointcluster_no_sample;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('points', '0003_point_earth_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PointCluster',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('zoom', models.SmallIntegerField(verbose_name='масштаб')),
+                ('cell_y', models.IntegerField(verbose_name='ячейка по широте')),
+                ('cell_x', models.IntegerField(verbose_name='ячейка по долготе')),
+                ('count', models.IntegerField(default=0, verbose_name='количество точек')),
+                ('sum_latitude', models.FloatField(default=0)),
+                ('sum_longitude', models.FloatField(default=0)),
+                ('sample_id', models.IntegerField(null=True, verbose_name='id одной из точек')),
+            ],
+            options={
+                'verbose_name': 'кластер точек',
+                'verbose_name_plural': 'кластеры точек',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='pointcluster',
+            unique_together={('zoom', 'cell_y', 'cell_x')},
+        ),
+        migrations.RunSQL(CREATE_FUNCTIONS, reverse_sql=DROP_FUNCTIONS),
+    ]
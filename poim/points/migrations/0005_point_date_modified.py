@@ -0,0 +1,18 @@
+# Generated by Django 2.0.3 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('points', '0004_pointcluster'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='point',
+            name='date_modified',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='дата изменения'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+from django.db import migrations, models
+from poim.points import geohash
+
+
+BATCH_SIZE = 10000
+
+
+def fill_geohash(apps, schema_editor):
+    # Пакетами по id, каждый пакет в своей транзакции: таблица не блокируется целиком
+    last_id = 0
+    with schema_editor.connection.cursor() as cursor:
+        while True:
+            cursor.execute(
+                'SELECT id, latitude, longitude FROM points_point WHERE id > %s ORDER BY id LIMIT %s',
+                [last_id, BATCH_SIZE],
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+
+            values = []
+            for id, latitude, longitude in rows:
+                values += [id, geohash.encode(latitude, longitude)]
+            cursor.execute(
+                'UPDATE points_point AS p SET geohash = v.geohash FROM (VALUES {}) AS v (id, geohash) '
+                'WHERE p.id = v.id'.format(', '.join(['(%s, %s)'] * len(rows))),
+                values,
+            )
+            last_id = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('points', '0005_point_date_modified'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='point',
+            name='geohash',
+            field=models.CharField(default='', editable=False, max_length=12, verbose_name='геохэш'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_geohash, migrations.RunPython.noop),
+        # Индекс создаётся после заполнения
+        migrations.AlterField(
+            model_name='point',
+            name='geohash',
+            field=models.CharField(db_index=True, editable=False, max_length=12, verbose_name='геохэш'),
+        ),
+    ]
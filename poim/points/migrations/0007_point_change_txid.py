@@ -0,0 +1,45 @@
+# Generated by Django 2.0.3 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+
+# Номер транзакции (txid_current(), 64-битный, с эпохой) записывается при любом изменении строки,
+# в том числе QuerySet.update() и массовой вставке. Существующие строки получают 0 и выдаются
+# в ленте изменений первыми, по id.
+
+CREATE_TRIGGER = """
+CREATE FUNCTION points_point_set_change_txid() RETURNS trigger AS $$
+BEGIN
+    NEW.change_txid := txid_current();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER points_point_change_txid BEFORE INSERT OR UPDATE ON points_point
+    FOR EACH ROW EXECUTE PROCEDURE points_point_set_change_txid();
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER points_point_change_txid ON points_point;
+DROP FUNCTION points_point_set_change_txid();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('points', '0006_point_geohash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='point',
+            name='change_txid',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='транзакция изменения'),
+        ),
+        migrations.RunSQL(CREATE_TRIGGER, reverse_sql=DROP_TRIGGER),
+        migrations.AddIndex(
+            model_name='point',
+            index=models.Index(fields=['change_txid', 'id'], name='points_point_changes'),
+        ),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 2.0.3 on 2026-10-18 18:04
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+# Выборки списка, тайлов, кластеров и снимка точек всегда ограничены видимыми точками
+# (PointManager и unlisted=False), поэтому их индексы частичные по тому же условию:
+# меньше размер и дешевле запись скрытых и удалённых точек. Одностолбцовые индексы
+# по date_created, unlisted, date_deleted, latitude, longitude и geohash удаляются.
+# Индексы создаются и удаляются без блокировки записи (CONCURRENTLY), новые — до удаления прежних.
+
+VISIBLE = 'date_deleted IS NULL AND NOT unlisted'
+
+INDEXES = [
+    # Список: ORDER BY id DESC и курсор id < x
+    ('points_point_visible_id', 'btree (id)'),
+    # bbox, тайлы и поиск образца кластера: диапазон широты, долгота проверяется по индексу
+    ('points_point_visible_ll', 'btree (latitude, longitude)'),
+    # cell: LIKE 'prefix%'
+    ('points_point_visible_geohash', 'btree (geohash varchar_pattern_ops)'),
+    # geo (earth_box) и nearest (обход по <->)
+    ('points_point_visible_earth', 'gist (ll_to_earth(latitude, longitude))'),
+]
+
+# Прежние индексы: имена db_index=True полей, сформированные Django, и индекс миграции 0003
+OLD_INDEXES = [
+    ('points_point_date_created_00e290a3', 'btree (date_created)'),
+    ('points_point_unlisted_50bcd5f4', 'btree (unlisted)'),
+    ('points_point_date_deleted_641db29b', 'btree (date_deleted)'),
+    ('points_point_latitude_dffe1c6f', 'btree (latitude)'),
+    ('points_point_longitude_bc222698', 'btree (longitude)'),
+    ('points_point_geohash_3fbfc1f7', 'btree (geohash)'),
+    ('points_point_geohash_3fbfc1f7_like', 'btree (geohash varchar_pattern_ops)'),
+    ('points_point_earth_gist', 'gist (ll_to_earth(latitude, longitude))'),
+]
+
+
+def create_index(name, definition, where=None):
+    sql = 'CREATE INDEX CONCURRENTLY {} ON points_point USING {}'.format(name, definition)
+    return sql + ' WHERE ' + where if where else sql
+
+
+def drop_index(name):
+    return 'DROP INDEX CONCURRENTLY {}'.format(name)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('points', '0007_point_change_txid'),
+    ]
+
+    operations = [
+        migrations.RunSQL(create_index(name, definition, VISIBLE), reverse_sql=drop_index(name))
+        for name, definition in INDEXES
+    ] + [
+        migrations.RunSQL(drop_index(name), reverse_sql=create_index(name, definition))
+        for name, definition in OLD_INDEXES
+    ] + [
+        # Индексы полей уже удалены выше по именам: AlterField удалил бы и новые индексы тех же столбцов
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='point',
+                name='date_created',
+                field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='дата создания'),
+            ),
+            migrations.AlterField(
+                model_name='point',
+                name='date_deleted',
+                field=models.DateTimeField(blank=True, null=True, verbose_name='дата удаления'),
+            ),
+            migrations.AlterField(
+                model_name='point',
+                name='geohash',
+                field=models.CharField(editable=False, max_length=12, verbose_name='геохэш'),
+            ),
+            migrations.AlterField(
+                model_name='point',
+                name='latitude',
+                field=models.FloatField(),
+            ),
+            migrations.AlterField(
+                model_name='point',
+                name='longitude',
+                field=models.FloatField(),
+            ),
+            migrations.AlterField(
+                model_name='point',
+                name='unlisted',
+                field=models.BooleanField(default=False, verbose_name='скрыта'),
+            ),
+        ]),
+    ]
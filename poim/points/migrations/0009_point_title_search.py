@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+# Поиск по названиям (фильтр q списка точек) — только среди видимых точек, поэтому индекс частичный,
+# как индексы миграции 0008_point_partial_indexes. Выражение индекса совпадает с TitleVector
+# (poim.points.expressions).
+
+CREATE_INDEX = "CREATE INDEX CONCURRENTLY points_point_visible_title ON points_point " \
+    "USING gin (to_tsvector('simple', title)) WHERE date_deleted IS NULL AND NOT unlisted"
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('points', '0008_point_partial_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_INDEX, reverse_sql='DROP INDEX CONCURRENTLY points_point_visible_title'),
+    ]
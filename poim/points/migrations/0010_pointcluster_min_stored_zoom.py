@@ -0,0 +1,62 @@
+from django.db import migrations
+
+
+# Ячейки масштабов 0–2 покрывают целые регионы: их строки изменялись почти при каждом изменении точек,
+# и параллельные транзакции ждали друг друга на блокировках этих строк до фиксации. Триггер больше
+# не поддерживает эти масштабы, кластеры для них собираются при чтении из ячеек масштаба 3
+# (PointCluster.MIN_STORED_ZOOM, см. PointCluster.merge). Функция та же, что в миграции 0004_pointcluster,
+# кроме диапазона масштабов.
+
+APPLY_FUNCTION = """
+CREATE OR REPLACE FUNCTION points_pointcluster_apply(ids integer[], latitudes float8[], longitudes float8[], signs integer[])
+RETURNS void AS $$
+    INSERT INTO points_pointcluster AS c (zoom, cell_y, cell_x, count, sum_latitude, sum_longitude, sample_id)
+    SELECT z, floor(d.latitude * 2 ^ z / 45), floor(d.longitude * 2 ^ z / 45),
+        sum(d.sign), sum(d.sign * d.latitude), sum(d.sign * d.longitude),
+        max(d.id) FILTER (WHERE d.sign > 0)
+    FROM unnest(ids, latitudes, longitudes, signs) AS d (id, latitude, longitude, sign),
+        generate_series({min_zoom}, 12) AS z
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3
+    ON CONFLICT (zoom, cell_y, cell_x) DO UPDATE SET
+        count = c.count + EXCLUDED.count,
+        sum_latitude = c.sum_latitude + EXCLUDED.sum_latitude,
+        sum_longitude = c.sum_longitude + EXCLUDED.sum_longitude,
+        sample_id = CASE WHEN c.count <= 0 OR c.sample_id = ANY(ids) THEN EXCLUDED.sample_id ELSE c.sample_id END;
+
+    -- Точка-образец убрана из ячейки, а другая не добавлена: выбирается любая из оставшихся
+    UPDATE points_pointcluster AS c SET sample_id = (
+        SELECT p.id FROM points_point AS p
+        WHERE p.date_deleted IS NULL AND NOT p.unlisted
+            AND p.latitude >= c.cell_y * 45 / 2 ^ c.zoom AND p.latitude < (c.cell_y + 1) * 45 / 2 ^ c.zoom
+            AND p.longitude >= c.cell_x * 45 / 2 ^ c.zoom AND p.longitude < (c.cell_x + 1) * 45 / 2 ^ c.zoom
+        LIMIT 1
+    )
+    WHERE c.sample_id IS NULL AND c.count > 0;
+$$ LANGUAGE sql;
+"""
+
+DELETE_COARSE = "DELETE FROM points_pointcluster WHERE zoom < 3"
+
+REBUILD_COARSE = """
+INSERT INTO points_pointcluster (zoom, cell_y, cell_x, count, sum_latitude, sum_longitude, sample_id)
+SELECT z, floor(latitude * 2 ^ z / 45), floor(longitude * 2 ^ z / 45),
+    count(*), sum(latitude), sum(longitude), max(id)
+FROM points_point, generate_series(0, 2) AS z
+WHERE date_deleted IS NULL AND NOT unlisted
+GROUP BY 1, 2, 3
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('points', '0009_point_title_search'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            [APPLY_FUNCTION.replace('{min_zoom}', '3'), DELETE_COARSE],
+            reverse_sql=[APPLY_FUNCTION.replace('{min_zoom}', '0'), REBUILD_COARSE],
+        ),
+    ]
@@ -1,7 +1,10 @@
 from django.db import models
+from django.db.models import F, Max, Sum
 from django.conf import settings
 from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
+from poim.points import geohash
+from poim.points.expressions import ShiftRight
 
 
 class PointManager(models.Manager):
@@ -10,14 +13,27 @@ class PointManager(models.Manager):
 
 
 class Point(models.Model):
+    '''
+    Индексы для выборок видимых точек (date_deleted IS NULL AND NOT unlisted) — частичные,
+    задаются миграцией 0008_point_partial_indexes: по id для списка, по (latitude, longitude)
+    для bbox и тайлов, по geohash для cell и GiST по ll_to_earth для geo и nearest.
+    GIN-индекс по to_tsvector('simple', title) для поиска q — миграция 0009_point_title_search.
+    '''
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name=_('пользователь'))
-    date_created = models.DateTimeField(_('дата создания'), default=now, db_index=True)
-    unlisted = models.BooleanField(_('скрыта'), default=False, db_index=True)
-    date_deleted = models.DateTimeField(_('дата удаления'), null=True, blank=True, db_index=True)
+    date_created = models.DateTimeField(_('дата создания'), default=now)
+    unlisted = models.BooleanField(_('скрыта'), default=False)
+    date_deleted = models.DateTimeField(_('дата удаления'), null=True, blank=True)
+    # Обновляется при save(); при save(update_fields=...) поле нужно перечислять явно
+    date_modified = models.DateTimeField(_('дата изменения'), auto_now=True, db_index=True)
 
     title = models.TextField(_('название'))
-    latitude = models.FloatField(db_index=True)
-    longitude = models.FloatField(db_index=True)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    # Вычисляется в save() по координатам, см. poim.points.geohash
+    geohash = models.CharField(_('геохэш'), max_length=geohash.MAX_PRECISION, editable=False)
+    # Номер транзакции последнего изменения (txid_current()), задаётся триггером при любой
+    # вставке и изменении строки, см. миграцию 0007_point_change_txid
+    change_txid = models.BigIntegerField(_('транзакция изменения'), default=0, editable=False)
 
     objects = PointManager()
     all_objects = models.Manager()
@@ -25,10 +41,31 @@ class Point(models.Model):
     class Meta:
         verbose_name = _('точка')
         verbose_name_plural = _('точки')
+        indexes = [
+            models.Index(fields=['change_txid', 'id'], name='points_point_changes'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        self.geohash = geohash.encode(self.latitude, self.longitude)
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and ('latitude' in update_fields or 'longitude' in update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+
+        super().save(*args, **kwargs)
+
+    def soft_delete(self):
+        'Удаление с возможностью восстановления методом undelete()'
+        self.date_deleted = now()
+        self.save(update_fields=['date_deleted', 'date_modified'])
+
+    def undelete(self):
+        self.date_deleted = None
+        self.save(update_fields=['date_deleted', 'date_modified'])
+
     @classmethod
     def can_create(cls, user):
         if not user.is_authenticated:
@@ -42,17 +79,88 @@ class Point(models.Model):
 
         return True
 
-    def can_update(self, user):
+    @classmethod
+    def update_permission(cls, user):
+        '''
+        Права пользователя на изменение точек: (право изменять любые точки, id пользователя
+        для своих точек или None). Вычисляются один раз на запрос для выдачи многих точек.
+        '''
         if not user.is_authenticated:
-            return False
+            return False, None
 
         if user.is_superuser:
-            return True
+            return True, user.id
 
         if user.is_staff and user.has_perm('points.change_point'):
-            return True
+            return True, user.id
 
-        if user.id == self.user_id:
-            return True
+        return False, user.id
 
-        return False
+    def can_update(self, user):
+        can_update_all, user_id = self.update_permission(user)
+        return can_update_all or self.user_id == user_id
+
+
+class PointCluster(models.Model):
+    '''
+    Агрегаты видимых точек (не скрытых и не удалённых) по ячейкам сетки для масштабов карты
+    от MIN_STORED_ZOOM до MAX_ZOOM. Поддерживаются триггером на таблице точек, см. миграции
+    0004_pointcluster и 0010_pointcluster_min_stored_zoom. Кластеры масштабов от 0 до MIN_STORED_ZOOM
+    собираются при чтении из ячеек масштаба MIN_STORED_ZOOM (см. merge): строки таких крупных ячеек
+    изменялись бы почти каждой транзакцией с точками и задерживали бы параллельные изменения.
+    '''
+
+    MIN_STORED_ZOOM = 3
+    MAX_ZOOM = 12
+    # Тайл масштаба zoom занимает 360 / 2^zoom градусов и делится на CELLS_PER_TILE ячеек по стороне
+    CELLS_PER_TILE = 8
+
+    zoom = models.SmallIntegerField(_('масштаб'))
+    cell_y = models.IntegerField(_('ячейка по широте'))
+    cell_x = models.IntegerField(_('ячейка по долготе'))
+
+    count = models.IntegerField(_('количество точек'), default=0)
+    sum_latitude = models.FloatField(default=0)
+    sum_longitude = models.FloatField(default=0)
+    sample_id = models.IntegerField(_('id одной из точек'), null=True)
+
+    class Meta:
+        verbose_name = _('кластер точек')
+        verbose_name_plural = _('кластеры точек')
+        unique_together = [('zoom', 'cell_y', 'cell_x')]
+
+    @classmethod
+    def cell_size(cls, zoom):
+        'Сторона ячейки в градусах'
+        return 360 / 2 ** zoom / cls.CELLS_PER_TILE
+
+    @classmethod
+    def merge(cls, queryset, zoom):
+        '''
+        Кластеры масштаба zoom меньше MIN_STORED_ZOOM из ячеек масштаба MIN_STORED_ZOOM в queryset:
+        ячейка масштаба zoom объединяет 2^k × 2^k ячеек, k = MIN_STORED_ZOOM - zoom
+        '''
+        shift = cls.MIN_STORED_ZOOM - zoom
+        rows = queryset.annotate(
+            merged_y=ShiftRight(F('cell_y'), shift),
+            merged_x=ShiftRight(F('cell_x'), shift),
+        ).values('merged_y', 'merged_x').annotate(
+            merged_count=Sum('count'),
+            merged_latitude=Sum('sum_latitude'),
+            merged_longitude=Sum('sum_longitude'),
+            merged_sample_id=Max('sample_id'),
+        ).order_by('merged_y', 'merged_x')
+
+        return [cls(
+            zoom=zoom, cell_y=row['merged_y'], cell_x=row['merged_x'], count=row['merged_count'],
+            sum_latitude=row['merged_latitude'], sum_longitude=row['merged_longitude'],
+            sample_id=row['merged_sample_id'],
+        ) for row in rows]
+
+    @property
+    def latitude(self):
+        return self.sum_latitude / self.count
+
+    @property
+    def longitude(self):
+        return self.sum_longitude / self.count
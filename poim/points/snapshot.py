@@ -0,0 +1,208 @@
+'''
+Снимок видимых точек (id, широта, долгота) в файле .npy для поиска кандидатов без обращения к БД.
+
+Файл строится командой `refresh_points_snapshot` и открывается процессами через mmap только
+для чтения, поэтому все процессы сервера делят одну копию в страничном кэше ОС. Команда
+дополняет снимок изменениями с момента прошлого запуска (по `Point.change_txid`, как лента
+изменений `PointChangesView`) и атомарно заменяет файл; процессы замечают замену не чаще раза в POINTS_SNAPSHOT_CHECK_SECONDS.
+
+Снимок отстаёт от БД на интервал обновления: по найденным id точки всё равно выбираются
+из БД, где повторно проверяются видимость и расстояние.
+'''
+import math
+import os
+import threading
+import time
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+from poim.points.models import Point
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Радиус сферы earth() расширения earthdistance, в метрах
+EARTH_RADIUS = 6378168
+
+# Массив 3×N float64 по строкам id, широта, долгота; строки непрерывны в памяти,
+# поэтому поиск по широте и векторные вычисления не копируют данные. id точны до 2^53.
+_ID, _LATITUDE, _LONGITUDE = range(3)
+
+# Допуск при отборе кандидатов: точная проверка расстояния выполняется в БД
+_DISTANCE_TOLERANCE = 1.0
+
+
+class PointSnapshot:
+    'Точки, упорядоченные по широте'
+
+    def __init__(self, points, version=None):
+        self.points = points
+        self.ids, self.latitudes, self.longitudes = points
+        # Признак файла снимка, одинаковый во всех процессах
+        self.version = version
+
+    @classmethod
+    def load(cls, path, version=None):
+        return cls(numpy.load(path, mmap_mode='r'), version)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _band(self, south, north):
+        start = numpy.searchsorted(self.latitudes, south, side='left')
+        end = numpy.searchsorted(self.latitudes, north, side='right')
+        return self.points[:, start:end]
+
+    def _distances(self, points, latitude, longitude):
+        # Haversine на сфере earth(): то же расстояние по поверхности, что и earth_distance
+        lat1, lat2 = math.radians(latitude), numpy.radians(points[_LATITUDE])
+        half_dlat = (lat2 - lat1) / 2
+        half_dlon = numpy.radians(points[_LONGITUDE] - longitude) / 2
+        a = numpy.sin(half_dlat) ** 2 + math.cos(lat1) * numpy.cos(lat2) * numpy.sin(half_dlon) ** 2
+        return 2 * EARTH_RADIUS * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1)))
+
+    def within(self, latitude, longitude, distance_m):
+        'id точек не дальше distance_m метров от центра'
+        delta = math.degrees(distance_m / EARTH_RADIUS)
+        band = self._band(latitude - delta, latitude + delta)
+        distances = self._distances(band, latitude, longitude)
+        return band[_ID][distances <= distance_m + _DISTANCE_TOLERANCE].astype(int)
+
+    def in_bbox(self, south, west, north, east):
+        'id точек в области; при west > east область пересекает 180-й меридиан'
+        band = self._band(south, north)
+        longitudes = band[_LONGITUDE]
+        if west <= east:
+            mask = (longitudes >= west) & (longitudes <= east)
+        else:
+            mask = (longitudes >= west) | (longitudes <= east)
+        return band[_ID][mask].astype(int)
+
+    def nearest(self, latitude, longitude, k):
+        'id не более k ближайших точек по возрастанию расстояния'
+        # Полоса широт шириной ±delta содержит все точки ближе delta по дуге;
+        # полоса расширяется, пока в этом радиусе не наберётся k точек
+        delta = 0.01
+        while True:
+            band = self._band(latitude - delta, latitude + delta)
+            distances = self._distances(band, latitude, longitude)
+            radius = math.radians(delta) * EARTH_RADIUS
+            if delta >= 180 or numpy.count_nonzero(distances <= radius) >= k:
+                break
+            delta *= 4
+
+        if len(distances) > k:
+            selected = numpy.argpartition(distances, k - 1)[:k]
+            band, distances = band[:, selected], distances[selected]
+        return band[_ID][numpy.argsort(distances, kind='stable')].astype(int)
+
+
+_lock = threading.Lock()
+_loaded = {'snapshot': None, 'stat': None, 'checked': 0}
+
+
+def get_snapshot():
+    'Снимок из POINTS_SNAPSHOT_PATH либо None, если он не используется или ещё не построен'
+    path = settings.POINTS_SNAPSHOT_PATH
+    if not path:
+        return None
+
+    if numpy is None:
+        raise ImproperlyConfigured('POINTS_SNAPSHOT_PATH requires numpy to be installed.')
+
+    with _lock:
+        if time.monotonic() - _loaded['checked'] >= settings.POINTS_SNAPSHOT_CHECK_SECONDS:
+            _loaded['checked'] = time.monotonic()
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                _loaded.update(snapshot=None, stat=None)
+            else:
+                stat = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+                if stat != _loaded['stat']:
+                    _loaded.update(snapshot=PointSnapshot.load(path, '{}.{}.{}'.format(*stat)), stat=stat)
+
+        return _loaded['snapshot']
+
+
+def _to_array(rows):
+    points = numpy.array(list(rows), dtype=float).reshape(-1, 3).T
+    return _sorted(points)
+
+
+def _sorted(points):
+    return numpy.ascontiguousarray(points[:, numpy.argsort(points[_LATITUDE], kind='stable')])
+
+
+def _watermark_path(path):
+    return path + '.watermark'
+
+
+def _read_watermark(path):
+    try:
+        with open(_watermark_path(path)) as f:
+            return int(f.read().strip())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _current_watermark():
+    # Транзакции с номером не меньше xmin снимка транзакций могут быть ещё не зафиксированы:
+    # их изменения будут выбраны при следующем обновлении
+    with connections[Point.all_objects.db].cursor() as cursor:
+        cursor.execute('SELECT txid_snapshot_xmin(txid_current_snapshot())')
+        return cursor.fetchone()[0]
+
+
+def _write(path, content, mode='w'):
+    # Запись во временный файл и атомарная замена: открытые mmap остаются на прежнем файле
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, mode) as f:
+        if mode == 'wb':
+            numpy.save(f, content)
+        else:
+            f.write(content)
+    os.replace(tmp_path, path)
+
+
+def refresh_snapshot(path, full=False):
+    '''
+    Построение или обновление снимка. Без full к прежнему снимку применяются точки с change_txid
+    не меньше сохранённой границы — xmin снимка транзакций на начало прошлого обновления,
+    поэтому учитываются и транзакции, зафиксированные позже, и изменения через QuerySet.update.
+    Строки, удалённые из БД, убираются из снимка по списку id видимых точек.
+    Возвращает число изменённых и удалённых точек или None при полном построении.
+    '''
+    if numpy is None:
+        raise ImproperlyConfigured('Points snapshot requires numpy to be installed.')
+
+    # Граница берётся до выборки: изменения, зафиксированные во время обновления, выбираются повторно
+    started = _current_watermark()
+    watermark = None if full or not os.path.exists(path) else _read_watermark(path)
+
+    if watermark is None:
+        changed = None
+        points = _to_array(Point.objects.filter(unlisted=False).values_list('id', 'latitude', 'longitude'))
+    else:
+        rows = list(Point.all_objects.filter(change_txid__gte=watermark)
+                    .values_list('id', 'latitude', 'longitude', 'unlisted', 'date_deleted'))
+        visible = [row[:3] for row in rows if not row[3] and row[4] is None]
+
+        previous = numpy.load(path)
+        # Удаление строки не оставляет change_txid: сохраняются только id, по-прежнему видимые в БД
+        existing = numpy.fromiter(Point.objects.filter(unlisted=False).values_list('id', flat=True).iterator(),
+                                  dtype=float)
+        stale = ~numpy.isin(previous[_ID], existing)
+        updated = numpy.isin(previous[_ID], numpy.array([row[0] for row in rows], dtype=float))
+        changed = len(rows) + numpy.count_nonzero(stale & ~updated)
+        points = None
+        if changed:
+            points = _sorted(numpy.concatenate([previous[:, ~(stale | updated)], _to_array(visible)], axis=1))
+
+    if points is not None:
+        _write(path, points, mode='wb')
+    _write(_watermark_path(path), str(started))
+    return changed
@@ -22,6 +22,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'rest_framework.authtoken',
     'poim.points',
+    'poim.utils',
 ]
 
 
@@ -35,6 +36,17 @@ DATABASES = {
     }
 }
 
+# Реплики для чтения API (см. poim.utils.replicas): псевдонимы в DATABASES. Наибольшее отставание
+# реплики и интервал его проверки, время исключения недоступной реплики и время закрепления
+# клиента за основной БД после изменения, в секундах
+DATABASE_REPLICAS = []
+DATABASE_REPLICA_MAX_LAG_SECONDS = 5
+DATABASE_REPLICA_CHECK_SECONDS = 1
+DATABASE_REPLICA_RETRY_SECONDS = 30
+DATABASE_REPLICA_PIN_SECONDS = 10
+
+DATABASE_ROUTERS = ['poim.utils.replicas.ReplicaRouter']
+
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
@@ -43,6 +55,31 @@ CACHES = {
 
 CACHE_MIDDLEWARE_SECONDS = 86400
 
+# Общий ли кэш default для всех процессов сервера; None — по бэкенду: LocMemCache — кэш процесса.
+# Без общего кэша кэши с межпроцессным сбросом отключены, см. poim.utils.caches
+SHARED_CACHE = None
+
+
+# Снимок видимых точек для поиска кандидатов в фильтрах списка точек (см. poim.points.snapshot).
+# Путь к файлу .npy либо None, если снимок не используется; требуется numpy.
+POINTS_SNAPSHOT_PATH = None
+# Интервал проверки замены файла снимка процессами сервера, в секундах
+POINTS_SNAPSHOT_CHECK_SECONDS = 1
+# Максимальное число кандидатов из снимка, при большем числе поиск выполняется в БД
+POINTS_SNAPSHOT_MAX_IDS = 10000
+# Число дополнительных кандидатов nearest из снимка сверх k: запас на точки, удалённые
+# или скрытые после обновления снимка
+POINTS_SNAPSHOT_NEAREST_EXTRA = 10
+
+# Кэш токенов аутентификации API (см. poim.utils.tokens). Время жизни записей в общем кэше
+# ограничивает задержку изменений пользователей в обход сигналов (QuerySet.update); используется
+# только с общим кэшем, см. SHARED_CACHE. Время жизни записей в кэше процесса: 0 — кэш процесса
+# не используется, иначе выход и деактивация в других процессах действуют с задержкой до этого
+# времени. Число записей в кэше процесса.
+AUTH_TOKEN_CACHE_SECONDS = 300
+AUTH_TOKEN_CACHE_LOCAL_SECONDS = 0
+AUTH_TOKEN_CACHE_LOCAL_SIZE = 10000
+
 
 # Internationalization
 
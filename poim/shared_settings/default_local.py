@@ -6,6 +6,11 @@ from .base import *
 
 # DATABASES['default']['USER'] = ''
 
+# Реплика для чтения API, например второй экземпляр PostgreSQL, созданный
+# pg_basebackup -R из основного и запущенный на порту 5433
+# DATABASES['replica'] = dict(DATABASES['default'], PORT=5433)
+# DATABASE_REPLICAS = ['replica']
+
 TESTING = bool(len(sys.argv) > 1 and sys.argv[1] == 'test')
 
 
@@ -0,0 +1 @@
+default_app_config = 'poim.utils.apps.UtilsConfig'
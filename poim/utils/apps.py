@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+from django.core import checks
+
+
+class UtilsConfig(AppConfig):
+    name = 'poim.utils'
+    label = 'poim_utils'
+
+    def ready(self):
+        # Сброс кэша токенов API при изменениях, в том числе через административный сайт
+        from poim.utils import tokens
+        from poim.utils.caches import check_shared_cache
+        checks.register(check_shared_cache, checks.Tags.caches)
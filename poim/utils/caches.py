@@ -0,0 +1,36 @@
+'''
+Общий ли кэш Django для процессов сервера. Кэши, сброс которых должен доходить до всех процессов
+(токены API, выдача списка точек, тайлы), с кэшем процесса не используются: сброс в одном
+процессе не доходит до записей в кэшах других, и они выдавали бы устаревшие данные.
+'''
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+
+# Настройки времени жизни кэшей, требующих общего кэша
+SHARED_CACHE_SETTINGS = ['AUTH_TOKEN_CACHE_SECONDS', 'POINTS_LIST_CACHE_SECONDS', 'POINTS_TILE_CACHE_SECONDS']
+
+
+def is_shared(alias='default'):
+    'Общий ли кэш alias для всех процессов: SHARED_CACHE или по бэкенду, LocMemCache — кэш процесса'
+    if settings.SHARED_CACHE is not None:
+        return settings.SHARED_CACHE
+    return not isinstance(caches[alias], LocMemCache)
+
+
+def check_shared_cache(app_configs, **kwargs):
+    if is_shared():
+        return []
+
+    names = [name for name in SHARED_CACHE_SETTINGS if getattr(settings, name, None)]
+    if not names:
+        return []
+
+    return [checks.Warning(
+        'The default cache is local to the process, so caches set by {} are disabled.'.format(', '.join(names)),
+        hint='Configure a cache backend shared by all server processes (memcached, redis, database) '
+            'or set SHARED_CACHE = True.',
+        id='poim.W001',
+    )]
@@ -0,0 +1,202 @@
+'''
+Чтение с реплик БД (потоковая репликация PostgreSQL).
+
+Промежуточный слой poim_api.utils.middleware.ReplicaMiddleware выбирает реплику для запросов
+безопасными методами, маршрутизатор ReplicaRouter направляет на неё чтение моделей точек
+и аутентификации. Запись и остальное чтение, в том числе на административном сайте,
+выполняются в основной БД (default).
+
+Реплика выбирается, если она доступна и отстаёт не больше DATABASE_REPLICA_MAX_LAG_SECONDS;
+отставание проверяется в каждом процессе не чаще раза в DATABASE_REPLICA_CHECK_SECONDS.
+Недоступная реплика исключается на DATABASE_REPLICA_RETRY_SECONDS. Если подходящих реплик нет,
+чтение выполняется в основной БД.
+
+Клиент, выполнивший изменение, закрепляется за основной БД по токену на
+DATABASE_REPLICA_PIN_SECONDS и читает свои изменения. Для закрепления между процессами
+нужен общий бэкенд кэша (memcached, redis и т. п.).
+'''
+import hashlib
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+
+
+logger = logging.getLogger(__name__)
+
+PIN_KEY = 'db:pin:{}'
+
+# Приложения, модели которых читаются с реплик
+APPS = {'points', 'auth', 'authtoken'}
+
+# Отставание в секундах: 0, если БД не является репликой или реплика применила всё полученное
+# от основной БД; NULL, если реплика не получает изменения (приёмник WAL не подключён) —
+# равенство позиций тогда не означает отсутствия отставания
+LAG_SQL = '''
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN NULL
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+END
+'''
+
+_local = threading.local()
+
+# Состояние реплик в процессе: псевдоним -> (пригодна для чтения, время следующей проверки)
+_status = {}
+_status_lock = threading.Lock()
+
+# Повторные вызовы repeat_after_lag: куча (время вызова, номер, функция) и поток, выполняющий их
+_repeats = []
+_repeats_counter = itertools.count()
+_repeats_condition = threading.Condition()
+_repeats_worker = None
+
+
+class ReplicaRouter:
+    'Чтение моделей APPS с реплики, выбранной для текущего запроса (см. reading_from)'
+
+    def db_for_read(self, model, **hints):
+        alias = get_read_alias()
+        if alias is not None and model._meta.app_label in APPS:
+            return alias
+        # Объекты, прочитанные с реплики, не должны направлять последующее чтение на неё
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Схема реплик приходит с основной БД
+        return False if db in settings.DATABASE_REPLICAS else None
+
+
+def get_read_alias():
+    'Реплика, выбранная для чтения в текущем потоке, или None'
+    return getattr(_local, 'alias', None)
+
+
+@contextmanager
+def reading_from(alias):
+    'Чтение моделей APPS с реплики alias (None — с основной БД) в пределах блока'
+    previous = get_read_alias()
+    _local.alias = alias
+    try:
+        yield
+    finally:
+        _local.alias = previous
+
+
+def choose_replica():
+    'Случайная пригодная реплика или None, если чтение выполняется в основной БД'
+    aliases = list(settings.DATABASE_REPLICAS)
+    random.shuffle(aliases)
+    for alias in aliases:
+        if is_usable(alias):
+            return alias
+    return None
+
+
+def get_lag(alias):
+    with connections[alias].cursor() as cursor:
+        cursor.execute(LAG_SQL)
+        lag, = cursor.fetchone()
+    return float('inf') if lag is None else float(lag)
+
+
+def is_usable(alias):
+    now = time.monotonic()
+    with _status_lock:
+        entry = _status.get(alias)
+    if entry is not None and entry[1] > now:
+        return entry[0]
+
+    try:
+        lag = get_lag(alias)
+    except DatabaseError:
+        logger.warning('Replica %s is unavailable', alias, exc_info=True)
+        mark_unavailable(alias)
+        return False
+
+    usable = lag <= settings.DATABASE_REPLICA_MAX_LAG_SECONDS
+    if not usable:
+        logger.warning('Replica %s lags behind by %.1f s', alias, lag)
+
+    with _status_lock:
+        _status[alias] = (usable, now + settings.DATABASE_REPLICA_CHECK_SECONDS)
+    return usable
+
+
+def mark_unavailable(alias):
+    try:
+        connections[alias].close()
+    except DatabaseError:
+        pass
+
+    with _status_lock:
+        _status[alias] = (False, time.monotonic() + settings.DATABASE_REPLICA_RETRY_SECONDS)
+
+
+def reset():
+    with _status_lock:
+        _status.clear()
+
+
+def _pin_key(token):
+    # Ключи токенов не хранятся в кэше в открытом виде
+    return PIN_KEY.format(hashlib.sha256(token.encode('utf-8')).hexdigest())
+
+
+def pin(token):
+    'Закрепление клиента с токеном за основной БД после изменения'
+    cache.set(_pin_key(token), True, settings.DATABASE_REPLICA_PIN_SECONDS)
+
+
+def is_pinned(token):
+    return cache.get(_pin_key(token)) is not None
+
+
+def repeat_after_lag(func):
+    '''
+    Повторный вызов func (сброса кэша) после фиксации транзакции и наибольшего допустимого
+    отставания реплик: запрос, прочитавший с реплики прежние данные, мог вернуть их в кэш.
+    '''
+    if not settings.DATABASE_REPLICAS:
+        return
+
+    transaction.on_commit(lambda: _schedule(
+        func, settings.DATABASE_REPLICA_MAX_LAG_SECONDS + settings.DATABASE_REPLICA_CHECK_SECONDS))
+
+
+def _schedule(func, delay):
+    # Один поток на процесс выполняет все повторные вызовы по времени; после fork поток создаётся заново
+    global _repeats_worker
+    with _repeats_condition:
+        heapq.heappush(_repeats, (time.monotonic() + delay, next(_repeats_counter), func))
+        if _repeats_worker is None or not _repeats_worker.is_alive():
+            _repeats_worker = threading.Thread(target=_run_repeats, name='replica-lag-repeats', daemon=True)
+            _repeats_worker.start()
+        _repeats_condition.notify()
+
+
+def _run_repeats():
+    while True:
+        with _repeats_condition:
+            while not _repeats or _repeats[0][0] > time.monotonic():
+                _repeats_condition.wait(_repeats[0][0] - time.monotonic() if _repeats else None)
+            due, number, func = heapq.heappop(_repeats)
+
+        try:
+            func()
+        except Exception:
+            logger.exception('Repeated call after replica lag failed')
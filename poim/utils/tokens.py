@@ -0,0 +1,166 @@
+'''
+Кэш токенов аутентификации API (rest_framework.authtoken): снимки токена и пользователя
+в общем кэше Django и в ограниченном LRU-кэше процесса.
+
+Обработчики сигналов (подключаются приложением poim.utils) сбрасывают записи при удалении
+токена и при изменении пользователя, в том числе деактивации, в любом процессе обоих сайтов:
+в общем кэше и в LRU-кэше этого процесса — сразу и повторно после фиксации транзакции,
+а при чтении с реплик БД ещё раз после наибольшего допустимого отставания реплик.
+Записи LRU-кэшей других процессов живут не дольше AUTH_TOKEN_CACHE_LOCAL_SECONDS (по умолчанию
+кэш процесса выключен). Общий кэш используется, только если бэкенд кэша общий для процессов
+(см. poim.utils.caches), иначе сброс не доходил бы до других процессов.
+
+Изменения в обход сигналов — QuerySet.update, QuerySet.delete токенов без загрузки объектов,
+SQL-запросы — записи не сбрасывают: после них нужно вызвать invalidate_users или invalidate,
+иначе прежние данные действуют до истечения AUTH_TOKEN_CACHE_SECONDS.
+'''
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from poim.utils import caches, replicas
+
+
+KEY = 'auth:token:{}'
+
+
+class LRUCache:
+    'Кэш процесса с ограничением числа записей и временем жизни записей'
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout, size):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + timeout)
+            self.entries.move_to_end(key)
+            while len(self.entries) > size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_cache = LRUCache()
+
+
+def _user_fields():
+    # Хэш пароля в кэш не записывается, поле загружается из БД при обращении
+    return [field.attname for field in get_user_model()._meta.concrete_fields if field.name != 'password']
+
+
+def _cache_key(key):
+    # Ключи токенов не хранятся в кэше в открытом виде
+    return KEY.format(hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+
+def make_snapshot(token):
+    user = token.user
+    return token.created, tuple(getattr(user, name) for name in _user_fields())
+
+
+def restore(key, snapshot):
+    'Новые экземпляры (user, token) из снимка'
+    created, values = snapshot
+    user = get_user_model().from_db(DEFAULT_DB_ALIAS, _user_fields(), values)
+    token = Token.from_db(DEFAULT_DB_ALIAS, ['key', 'user_id', 'created'], [key, user.pk, created])
+    token.user = user
+    return user, token
+
+
+def get_cached(key):
+    '''
+    Пара (снимок, источник): источник 'local' — кэш процесса, 'shared' — общий кэш;
+    (None, None), если токена нет в кэше.
+    '''
+    cache_key = _cache_key(key)
+    snapshot = local_cache.get(cache_key)
+    if snapshot is not None:
+        return snapshot, 'local'
+
+    snapshot = cache.get(cache_key) if _shared_seconds() else None
+    if snapshot is not None:
+        _set_local(cache_key, snapshot)
+        return snapshot, 'shared'
+
+    return None, None
+
+
+def set_cached(key, snapshot):
+    cache_key = _cache_key(key)
+    seconds = _shared_seconds()
+    if seconds:
+        cache.set(cache_key, snapshot, seconds)
+    _set_local(cache_key, snapshot)
+
+
+def _shared_seconds():
+    return settings.AUTH_TOKEN_CACHE_SECONDS if caches.is_shared() else 0
+
+
+def _set_local(cache_key, snapshot):
+    if settings.AUTH_TOKEN_CACHE_LOCAL_SECONDS and settings.AUTH_TOKEN_CACHE_LOCAL_SIZE:
+        local_cache.set(
+            cache_key, snapshot, settings.AUTH_TOKEN_CACHE_LOCAL_SECONDS, settings.AUTH_TOKEN_CACHE_LOCAL_SIZE)
+
+
+def invalidate(keys):
+    cache_keys = [_cache_key(key) for key in keys]
+    if not cache_keys:
+        return
+
+    def delete():
+        cache.delete_many(cache_keys)
+        for cache_key in cache_keys:
+            local_cache.delete(cache_key)
+
+    # Повтор после фиксации: запрос, прочитавший прежние данные до фиксации, мог вернуть запись в кэш
+    delete()
+    transaction.on_commit(delete)
+    replicas.repeat_after_lag(delete)
+
+
+def invalidate_users(user_ids):
+    'Сброс записей всех токенов пользователей'
+    invalidate(Token.objects.filter(user_id__in=user_ids).values_list('key', flat=True))
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    invalidate([instance.key])
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    # Время входа (django.contrib.auth.models.update_last_login) на аутентификацию не влияет
+    if created or update_fields == frozenset(['last_login']):
+        return
+
+    invalidate_users([instance.pk])
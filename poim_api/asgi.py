@@ -0,0 +1,23 @@
+import os
+import sys
+
+sys.dont_write_bytecode = True
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "poim_api.settings.asgi")
+
+django.setup(set_prefix=False)
+
+from poim_api.utils.asgi import ASGIHandler
+
+application = ASGIHandler()
+
+
+# Preload app
+
+from django.urls import resolve
+try:
+    resolve('/')
+except Exception:
+    pass
@@ -0,0 +1,83 @@
+import logging
+import threading
+from collections import Counter
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from poim.utils import replicas, tokens
+
+
+__all__ = [
+    'CachedTokenAuthentication',
+]
+
+logger = logging.getLogger(__name__)
+
+
+class TokenCacheStats:
+    '''
+    Счётчики обращений к кэшу токенов процесса: попадания в кэш процесса (local),
+    в общий кэш (shared) и промахи (miss). Сводка выводится в журнал каждые
+    AUTH_TOKEN_CACHE_STATS_INTERVAL обращений.
+    '''
+    sources = ['local', 'shared', 'miss']
+
+    def __init__(self):
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    def record(self, source):
+        with self.lock:
+            self.counts[source] += 1
+            total = sum(self.counts.values())
+
+        interval = settings.AUTH_TOKEN_CACHE_STATS_INTERVAL
+        if interval and total % interval == 0:
+            stats = self.get()
+            logger.info('Token cache: %d lookups, hit rate %.1f%% (local %d, shared %d, miss %d)',
+                stats['total'], stats['hit_rate'] * 100, stats['local'], stats['shared'], stats['miss'])
+
+    def get(self):
+        with self.lock:
+            stats = {source: self.counts[source] for source in self.sources}
+
+        stats['total'] = sum(stats.values())
+        stats['hit_rate'] = (stats['local'] + stats['shared']) / stats['total'] if stats['total'] else 0.0
+        return stats
+
+    def reset(self):
+        with self.lock:
+            self.counts.clear()
+
+
+stats = TokenCacheStats()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    '''
+    TokenAuthentication со снимками токена и пользователя в кэше (см. poim.utils.tokens):
+    запрос токена с пользователем к БД выполняется только при промахе.
+    '''
+
+    def authenticate_credentials(self, key):
+        snapshot, source = tokens.get_cached(key)
+        stats.record(source or 'miss')
+
+        if snapshot is None:
+            try:
+                user, token = super().authenticate_credentials(key)
+            except exceptions.AuthenticationFailed:
+                if replicas.get_read_alias() is None:
+                    raise
+                # Недавно созданный токен или изменение пользователя могли ещё не дойти до реплики
+                with replicas.reading_from(None):
+                    user, token = super().authenticate_credentials(key)
+            tokens.set_cached(key, tokens.make_snapshot(token))
+            return user, token
+
+        user, token = tokens.restore(key, snapshot)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        return user, token
@@ -1,5 +1,11 @@
 from copy import copy, deepcopy
 from unittest import skip
+from django.contrib.auth import get_user_model
+from django.test import RequestFactory, override_settings
+from rest_framework.exceptions import AuthenticationFailed
+from poim.utils import tokens
+from poim.utils.caches import check_shared_cache
+from poim_api.auth.authentication import CachedTokenAuthentication, stats
 from poim_api.utils.tests import TestCase, MultipleUsersTestMixin
 
 
@@ -214,3 +220,119 @@ class AuthenticationTestCase(MultipleUsersTestMixin, TestCase):
 
         response = self.client.options(self.logout_path, HTTP_ACCESS_CONTROL_REQUEST_METHOD='POST')
         self.assertEqual(response.status_code, 200)
+
+
+@override_settings(SHARED_CACHE=True, AUTH_TOKEN_CACHE_LOCAL_SECONDS=5)
+class CachedTokenAuthenticationTestCase(MultipleUsersTestMixin, TestCase):
+    login_path = '/login'
+    logout_path = '/logout'
+
+    def setUp(self):
+        super().setUp()
+        stats.reset()
+
+    def authenticate(self, name):
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION='Token '+self.auth_tokens[name])
+        return CachedTokenAuthentication().authenticate(request)
+
+    def test_cached(self):
+        with self.assertNumQueries(1):
+            user, token = self.authenticate('alice')
+
+        with self.assertNumQueries(0):
+            cached_user, cached_token = self.authenticate('alice')
+        self.assertEqual(cached_user, user)
+        self.assertEqual(cached_user.username, 'alice')
+        self.assertEqual(cached_token.key, token.key)
+        self.assertEqual(cached_token.user, cached_user)
+
+        # Пароль не кэшируется и загружается при обращении
+        with self.assertNumQueries(1):
+            self.assertTrue(cached_user.check_password('password alice'))
+
+        tokens.local_cache.clear()
+        with self.assertNumQueries(0):
+            self.authenticate('alice')
+
+        self.assertEqual(stats.get(), {'local': 1, 'shared': 1, 'miss': 1, 'total': 3, 'hit_rate': 2 / 3})
+
+    def test_without_local_cache(self):
+        self.authenticate('alice')
+        with override_settings(AUTH_TOKEN_CACHE_LOCAL_SECONDS=0):
+            tokens.local_cache.clear()
+            self.authenticate('alice')
+            self.authenticate('alice')
+        self.assertEqual(stats.get()['shared'], 2)
+
+    @override_settings(SHARED_CACHE=None, AUTH_TOKEN_CACHE_LOCAL_SECONDS=0)
+    def test_process_local_cache(self):
+        # С кэшем процесса (LocMemCache) записи не кэшируются: сброс не дошёл бы до других процессов
+        for i in range(2):
+            with self.assertNumQueries(1):
+                self.authenticate('alice')
+        self.assertEqual(stats.get()['miss'], 2)
+
+        messages = check_shared_cache(None)
+        self.assertEqual([message.id for message in messages], ['poim.W001'])
+        self.assertIn('AUTH_TOKEN_CACHE_SECONDS', messages[0].msg)
+
+        with override_settings(SHARED_CACHE=True):
+            self.assertEqual(check_shared_cache(None), [])
+
+    def test_logout(self):
+        self.authenticate('alice')
+
+        response = self.alice_client.post(self.logout_path)
+        self.assertEqual(response.status_code, 204)
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate('alice')
+
+        response = self.alice_client.post(self.logout_path)
+        self.assertEqual(response.status_code, 401)
+
+    def test_user_change(self):
+        self.authenticate('bob')
+        self.authenticate('carol')
+
+        User = get_user_model()
+        User.objects.filter(username='carol').update(is_staff=True)
+        user = User.objects.get(username='carol')
+        user.save()
+        self.assertTrue(self.authenticate('carol')[0].is_staff)
+
+        user = User.objects.get(username='bob')
+        user.is_active = False
+        user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate('bob')
+
+        response = self.bob_client.post(self.logout_path)
+        self.assertEqual(response.status_code, 401)
+
+    def test_user_queryset_update(self):
+        self.authenticate('bob')
+
+        # QuerySet.update не отправляет сигналов: запись сбрасывается явно
+        User = get_user_model()
+        User.objects.filter(username='bob').update(is_active=False)
+        with self.assertNumQueries(0):
+            self.assertTrue(self.authenticate('bob')[0].is_active)
+
+        tokens.invalidate_users(User.objects.filter(username='bob').values_list('id', flat=True))
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate('bob')
+
+        response = self.bob_client.post(self.logout_path)
+        self.assertEqual(response.status_code, 401)
+
+    def test_login(self):
+        self.authenticate('alice')
+
+        response = self.client.post(self.login_path, data={'username': 'alice', 'password': 'password alice'})
+        self.assertEqual(response.status_code, 200)
+
+        # Сохранение времени входа не сбрасывает кэш
+        with self.assertNumQueries(0):
+            self.authenticate('alice')
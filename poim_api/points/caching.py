@@ -0,0 +1,141 @@
+'''
+Кэш выдачи списка точек (PointListView) в кэше Django.
+
+Хранится не зависящая от пользователя часть ответа: строки values_list(), заголовок Link
+и валидаторы ETag; can_edit вычисляется при каждом запросе (см. PointValuesSerializer).
+Ключ записи — нормализованные параметры запроса и поколения (poim_api.utils.generations):
+
+- запросы с областью (geo, bbox, cell) зависят от поколений покрывающих её ячеек сетки
+  POINTS_LIST_CACHE_REGION_DEGREES, их сбрасывает изменение точек внутри ячеек;
+- остальные запросы (без области, nearest, области больше POINTS_LIST_CACHE_MAX_REGIONS ячеек)
+  зависят от общего поколения, его сбрасывает любое изменение точек;
+- все записи зависят от эпохи, её сбрасывает изменение точек в большом числе ячеек.
+
+Для сброса между процессами сервера нужен общий бэкенд кэша (memcached, redis и т. п.),
+с кэшем процесса кэш списка не используется (см. poim.utils.caches).
+При чтении с реплик БД сброс повторяется после наибольшего допустимого отставания реплик.
+'''
+import hashlib
+import math
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import urlencode
+from poim.points import geohash
+from poim.points.models import Point
+from poim.points.snapshot import EARTH_RADIUS, get_snapshot
+from poim.utils import caches, replicas
+from poim_api.points.tiles import invalidate_tiles
+from poim_api.utils.generations import get_generations, bump_generations
+
+
+EPOCH_KEY = 'points:list:epoch'
+GENERATION_KEY = 'points:list:generation'
+REGION_KEY = 'points:list:region:{}:{}'
+
+
+def _region(latitude, longitude):
+    size = settings.POINTS_LIST_CACHE_REGION_DEGREES
+    rows, columns = math.ceil(180 / size), math.ceil(360 / size)
+    return min(int((latitude + 90) // size), rows - 1), min(int((longitude + 180) // size), columns - 1)
+
+
+def _bbox_regions(south, west, north, east):
+    first_row, first_column = _region(south, west)
+    last_row, last_column = _region(north, east)
+    if west <= east:
+        columns = list(range(first_column, last_column + 1))
+    else:
+        columns = list(range(first_column, _region(0, 180)[1] + 1)) + list(range(0, last_column + 1))
+
+    if (last_row - first_row + 1) * len(columns) > settings.POINTS_LIST_CACHE_MAX_REGIONS:
+        return None
+    return [(row, column) for row in range(first_row, last_row + 1) for column in columns]
+
+
+def _geo_bbox(latitude, longitude, distance_m):
+    delta = math.degrees(distance_m / EARTH_RADIUS)
+    south, north = latitude - delta, latitude + delta
+    if south < -90 or north > 90:
+        return None
+
+    delta = delta / math.cos(math.radians(max(abs(south), abs(north))))
+    if delta >= 180:
+        return None
+
+    west, east = longitude - delta, longitude + delta
+    return south, west + 360 if west < -180 else west, north, east - 360 if east > 180 else east
+
+
+def _query_regions(query_params):
+    'Ячейки сетки, покрывающие область запроса, или None для запросов без области'
+    if query_params.get('nearest'):
+        return None
+
+    try:
+        if query_params.get('geo'):
+            latitude, longitude, distance_m = (float(v) for v in query_params['geo'].split(','))
+            bbox = _geo_bbox(latitude, longitude, distance_m) if distance_m >= 0 else None
+        elif query_params.get('bbox'):
+            bbox = tuple(float(v) for v in query_params['bbox'].split(','))
+            south, west, north, east = bbox
+            if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+                bbox = None
+        elif query_params.get('cell') and geohash.is_valid(query_params['cell']):
+            bbox = geohash.bounds(query_params['cell'])
+        else:
+            bbox = None
+
+        if bbox is None or not all(math.isfinite(v) for v in bbox):
+            return None
+        return _bbox_regions(*bbox)
+    except ValueError:
+        # Неверные параметры отклоняются фильтром, такие ответы не кэшируются
+        return None
+
+
+def get_list_cache_key(request):
+    'Ключ записи кэша для запроса или None, если кэш не используется'
+    if not settings.POINTS_LIST_CACHE_SECONDS or not caches.is_shared():
+        return None
+
+    regions = _query_regions(request.query_params)
+    keys = [EPOCH_KEY]
+    keys += [GENERATION_KEY] if regions is None else [REGION_KEY.format(*region) for region in regions]
+
+    # Заголовок Link содержит адрес запроса; от версии снимка точек зависит выборка в фильтрах
+    snapshot = get_snapshot()
+    params = sorted((name, value) for name, values in request.query_params.lists() for value in values)
+    query = '{}\n{}\n{}'.format(request.build_absolute_uri('/'), snapshot and snapshot.version, urlencode(params))
+
+    return 'points:list:{}:{}'.format(
+        '.'.join(str(generation) for generation in get_generations(keys)),
+        hashlib.md5(query.encode('utf-8')).hexdigest(),
+    )
+
+
+def invalidate_points(*points):
+    '''
+    Сброс кэшей, зависящих от точек (`Point` или пары координат): выдачи списка и тайлов.
+    Для изменённой точки передаются прежние и новые координаты.
+    '''
+    locations = [(point.latitude, point.longitude) if isinstance(point, Point) else point for point in points]
+    _invalidate(locations)
+    replicas.repeat_after_lag(lambda: _invalidate(locations))
+
+
+def _invalidate(locations):
+    invalidate_tiles(*locations)
+
+    regions = {_region(*location) for location in locations}
+    if len(regions) > settings.POINTS_LIST_CACHE_INVALIDATE_MAX_REGIONS:
+        bump_generations([EPOCH_KEY])
+    elif regions:
+        bump_generations([GENERATION_KEY] + [REGION_KEY.format(*region) for region in sorted(regions)])
+
+
+def get_cached_list(key):
+    return cache.get(key) if key else None
+
+
+def set_cached_list(key, entry):
+    cache.set(key, entry, settings.POINTS_LIST_CACHE_SECONDS)
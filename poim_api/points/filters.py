@@ -1,32 +1,87 @@
+import math
+import re
+from django.conf import settings
+from django.db.models import Q, Value
+from django.utils.text import format_lazy
 from django.utils.translation import gettext_lazy as _
 from django_filters import rest_framework as filters
-from poim.points.models import Point
+from poim.points import geohash
+from poim.points.expressions import LLToEarth, EarthBox, EarthDistance, CubeContains, CubeDistance, \
+    TitleVector, TitleQuery, TextMatch, TextRank
+from poim.points.models import Point, PointCluster
+from poim.points.snapshot import get_snapshot
 from poim_api.utils import exceptions
-from poim_api.utils.filters import IntegerCSVFilter, DecimalCSVFilter
+from poim_api.utils.filters import IntegerFilter, IntegerCSVFilter, DecimalCSVFilter
 
 # update after django-filter 2.0 release
 from django_filters import STRICTNESS
 
 
-class PointFilter(filters.FilterSet):
+class BBoxFilterMixin:
+    def _parse_bbox(self, name, value):
+        if len(value) != 4:
+            raise exceptions.ValidationError({name: [_('Неверный формат области.')]})
+
+        south, west, north, east = (float(v) for v in value)
+        if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+            raise exceptions.ValidationError({name: [_('Неверные границы области.')]})
+
+        return south, west, north, east
+
+
+class PointFilter(BBoxFilterMixin, filters.FilterSet):
     geo = DecimalCSVFilter(method='filter_geo', help_text=_('Координаты для фильтрации в формате '
             '"latitude,longitude,distance_meters", например "59.923932,30.315181,100000".'))
+    bbox = DecimalCSVFilter(method='filter_bbox', help_text=_('Прямоугольная область карты в формате '
+            '"south,west,north,east", например "59.8,30.1,60.0,30.5". Если west больше east, '
+            'область пересекает 180-й меридиан.'))
+    nearest = DecimalCSVFilter(method='filter_nearest', help_text=_('Координаты в формате "latitude,longitude" '
+            'для выдачи ближайших точек по возрастанию расстояния, например "59.923932,30.315181". '
+            'Количество точек задаётся параметром k.'))
+    cell = filters.CharFilter(method='filter_cell', help_text=_('Ячейка геохэша длиной от 1 до 12 символов, '
+            'например "udts". Ячейка длины 5 — около 4,9×4,9 км, 6 — 0,6×1,2 км, 7 — 150×150 м; '
+            'каждый следующий символ уменьшает ячейку в 4–8 раз.'))
+    q = filters.CharFilter(method='filter_q', max_length=100, help_text=_('Поиск по словам названия, '
+            'например "кафе". Каждое слово запроса ищется как начало слова названия. Точки отсортированы '
+            'по релевантности, при geo и nearest — по расстоянию.'))
+    k = IntegerFilter(method='filter_k', min_value=1, max_value=settings.POINTS_NEAREST_MAX_K,
+            help_text=_('Количество ближайших точек для nearest.'))
 
     class Meta:
         model = Point
         fields = []
+        strict = STRICTNESS.RAISE_VALIDATION_ERROR
+
+    def _snapshot_ids(self, method, *args):
+        # Кандидаты из снимка точек (см. poim.points.snapshot), если он включён
+        # и кандидатов не слишком много для выборки по id
+        snapshot = get_snapshot()
+        if snapshot is None:
+            return None
+
+        ids = getattr(snapshot, method)(*args)
+        if len(ids) > settings.POINTS_SNAPSHOT_MAX_IDS:
+            return None
+        return ids.tolist()
 
     def _filter_geo(self, queryset, point, distance_m):
-        # 0.018 градуса с запада на восток на каждый километр радиуса (2 км с севера на юг в широтах Санкт-Петербурга)
-        circle_radius = float(distance_m) * 0.018 / 1000
-        # TODO переписать на Expression
-        queryset = queryset.extra(where=[
-                'circle(point(%s, %s), %s) @> point(latitude, longitude)',
-                'earth_distance(ll_to_earth(latitude, longitude), ll_to_earth(%s, %s)) <= %s'
-            ], params=[
-                point[0], point[1], circle_radius,
-                point[0], point[1], distance_m,
-            ])
+        center = LLToEarth(Value(float(point[0])), Value(float(point[1])))
+        earth = LLToEarth('latitude', 'longitude')
+
+        ids = self._snapshot_ids('within', float(point[0]), float(point[1]), float(distance_m))
+        if ids is not None:
+            queryset = queryset.filter(id__in=ids)
+        else:
+            # earth_box отсекает кандидатов по частичному GiST-индексу points_point_visible_earth
+            queryset = queryset.annotate(
+                in_earth_box=CubeContains(EarthBox(center, Value(float(distance_m))), earth),
+            ).filter(in_earth_box=True)
+
+        # Точное расстояние проверяется уже по отобранным строкам.
+        # Сортировка по расстоянию, id — для однозначного ключа постраничной выдачи.
+        queryset = queryset.annotate(
+            distance=EarthDistance(earth, center),
+        ).filter(distance__lte=float(distance_m)).order_by('distance', 'id')
         return queryset
 
     def filter_geo(self, queryset, name, value):
@@ -34,3 +89,134 @@ class PointFilter(filters.FilterSet):
             raise exceptions.ValidationError({name: [_('Неверный формат координат.')]})
 
         return self._filter_geo(queryset, value[:2], value[2])
+
+    def filter_bbox(self, queryset, name, value):
+        south, west, north, east = self._parse_bbox(name, value)
+
+        ids = self._snapshot_ids('in_bbox', south, west, north, east)
+        if ids is not None:
+            queryset = queryset.filter(id__in=ids)
+
+        # Диапазон по индексу points_point_visible_ll (latitude, longitude)
+        queryset = queryset.filter(latitude__range=(south, north))
+        if west <= east:
+            return queryset.filter(longitude__range=(west, east))
+        return queryset.filter(Q(longitude__gte=west) | Q(longitude__lte=east))
+
+    def filter_nearest(self, queryset, name, value):
+        if len(value) != 2:
+            raise exceptions.ValidationError({name: [_('Неверный формат координат.')]})
+
+        if self.data.get('geo'):
+            raise exceptions.ValidationError({name: [_('Не совмещается с фильтром geo.')]})
+
+        center = LLToEarth(Value(float(value[0])), Value(float(value[1])))
+        earth = LLToEarth('latitude', 'longitude')
+
+        k = self.form.cleaned_data.get('k') or settings.POINTS_NEAREST_DEFAULT_K
+        ids = self._snapshot_nearest_ids(queryset, float(value[0]), float(value[1]), k)
+        if ids is not None:
+            queryset = queryset.filter(id__in=ids)
+
+        # Сортировка только по <-> выполняется обходом индекса points_point_visible_earth
+        # по возрастанию расстояния, поэтому стоимость зависит от k, а не от плотности
+        # точек вокруг. Выборка ограничивается k в PointListView.filter_queryset.
+        queryset = queryset.annotate(
+            knn=CubeDistance(earth, center),
+            distance=EarthDistance(earth, center),
+        ).order_by('knn')
+        return queryset
+
+    def _snapshot_nearest_ids(self, queryset, latitude, longitude, k):
+        # Кандидаты из снимка — ближайшие среди всех видимых точек: с другими фильтрами
+        # после отбора их могло бы остаться меньше k, поиск выполняется по индексу
+        if any(self.data.get(name) for name in self.filters if name not in ('nearest', 'k')):
+            return None
+
+        ids = self._snapshot_ids('nearest', latitude, longitude, k + settings.POINTS_SNAPSHOT_NEAREST_EXTRA)
+        # Точки снимка, удалённые или скрытые после его обновления, занимают места кандидатов;
+        # если видимых осталось меньше k, ближайшие ищутся по индексу
+        if ids is None or queryset.filter(id__in=ids).count() < k:
+            return None
+        return ids
+
+    def filter_cell(self, queryset, name, value):
+        if not geohash.is_valid(value):
+            raise exceptions.ValidationError({name: [_('Неверная ячейка геохэша.')]})
+
+        # LIKE 'prefix%' выполняется по индексу с varchar_pattern_ops
+        return queryset.filter(geohash__startswith=value)
+
+    def filter_q(self, queryset, name, value):
+        # Слова запроса — префиксы слов названия: «каф» находит «Кафе»
+        words = re.findall(r'[^\W_]+', value)
+        if not words:
+            raise exceptions.ValidationError({name: [_('Запрос не содержит слов.')]})
+
+        vector = TitleVector('title')
+        query = TitleQuery(Value(' & '.join("'{}':*".format(word) for word in words)))
+        # Совпадение проверяется по частичному GIN-индексу points_point_visible_title
+        queryset = queryset.annotate(title_match=TextMatch(vector, query)).filter(title_match=True)
+
+        # С geo и nearest точки отсортированы по расстоянию, а поиск только отбирает их;
+        # планировщик выбирает более избирательный из GIN- и GiST-индексов
+        if self.data.get('geo') or self.data.get('nearest'):
+            return queryset
+
+        # id — для однозначного ключа постраничной выдачи при равной релевантности
+        return queryset.annotate(rank=TextRank(vector, query)).order_by('-rank', '-id')
+
+    def filter_k(self, queryset, name, value):
+        return queryset
+
+
+class PointClusterFilter(BBoxFilterMixin, filters.FilterSet):
+    bbox = DecimalCSVFilter(method='filter_bbox', required=True, help_text=_('Прямоугольная область карты '
+            'в формате "south,west,north,east", как в списке точек.'))
+    zoom = IntegerFilter(method='filter_zoom', required=True, min_value=0, max_value=PointCluster.MAX_ZOOM,
+            help_text=format_lazy(_('Масштаб карты от 0 до {}.'), PointCluster.MAX_ZOOM))
+
+    class Meta:
+        model = PointCluster
+        fields = []
+        strict = STRICTNESS.RAISE_VALIDATION_ERROR
+
+    @property
+    def qs(self):
+        # Кластеры мелких масштабов собираются из выбранных ячеек хранимого масштаба
+        queryset = super().qs
+        zoom = self.form.cleaned_data.get('zoom') if self.is_bound else None
+        if zoom is not None and zoom < PointCluster.MIN_STORED_ZOOM:
+            return PointCluster.merge(queryset, zoom)
+        return queryset
+
+    def _cell_range(self, start, end, size):
+        return math.floor(start / size), math.floor(end / size)
+
+    def _stored_range(self, cell_range):
+        # Диапазон ячеек масштаба zoom в ячейках хранимого масштаба, см. filter_zoom
+        shift = max(PointCluster.MIN_STORED_ZOOM - self.form.cleaned_data['zoom'], 0)
+        return cell_range[0] << shift, ((cell_range[1] + 1) << shift) - 1
+
+    def filter_bbox(self, queryset, name, value):
+        south, west, north, east = self._parse_bbox(name, value)
+        size = PointCluster.cell_size(self.form.cleaned_data['zoom'])
+
+        y_range = self._cell_range(south, north, size)
+        if west <= east:
+            x_ranges = [self._cell_range(west, east, size)]
+        else:
+            x_ranges = [self._cell_range(west, 180, size), self._cell_range(-180, east, size)]
+
+        cells = (y_range[1] - y_range[0] + 1) * sum(r[1] - r[0] + 1 for r in x_ranges)
+        if cells > settings.POINTS_CLUSTER_MAX_CELLS:
+            raise exceptions.ValidationError({name: [_('Слишком большая область для заданного масштаба.')]})
+
+        x_filter = Q()
+        for x_range in x_ranges:
+            x_filter |= Q(cell_x__range=self._stored_range(x_range))
+        return queryset.filter(x_filter, cell_y__range=self._stored_range(y_range))
+
+    def filter_zoom(self, queryset, name, value):
+        # Мелкие масштабы не хранятся: кластеры собираются из ячеек масштаба PointCluster.MIN_STORED_ZOOM в qs
+        return queryset.filter(zoom=max(value, PointCluster.MIN_STORED_ZOOM))
@@ -0,0 +1,183 @@
+'''
+Массовая загрузка точек: чтение из тела запроса (CSV, NDJSON и путевые точки GPX)
+и вставка через COPY.
+
+Тело читается потоком порциями, каждый формат выдаёт записи (словари полей) по мере чтения.
+Ошибка формата файла в целом (не записи) — исключение ImportFormatError.
+'''
+import codecs
+import csv
+import io
+import json
+from xml.parsers import expat
+from django.db import connection
+from django.utils.timezone import now
+from django.utils.translation import gettext_lazy as _
+from poim.points import geohash
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ImportFormatError(Exception):
+    pass
+
+
+def _read_chunks(stream):
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _read_lines(stream):
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    tail = ''
+    try:
+        for chunk in _read_chunks(stream):
+            lines = (tail + decoder.decode(chunk)).split('\n')
+            tail = lines.pop()
+            yield from lines
+        tail += decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        raise ImportFormatError(_('Файл должен быть в кодировке UTF-8.'))
+
+    if tail:
+        yield tail
+
+
+def read_csv(stream):
+    'CSV с заголовком; пустые значения считаются отсутствующими'
+    reader = csv.reader(_read_lines(stream))
+    try:
+        header = next(reader, None)
+        if header is None:
+            return
+
+        header = [name.strip() for name in header]
+        for row in reader:
+            if row:
+                yield {name: value for name, value in zip(header, row) if value != ''}
+    except csv.Error as e:
+        raise ImportFormatError(_('Неверный формат CSV: {}.').format(e))
+
+
+def read_ndjson(stream):
+    'По одному JSON-объекту на строку, пустые строки пропускаются; неверная строка — None'
+    for line in _read_lines(stream):
+        if not line.strip():
+            continue
+
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield row if isinstance(row, dict) else None
+
+
+def read_gpx(stream):
+    'Путевые точки wpt: атрибуты lat и lon, название из name'
+    rows = []
+    state = {'row': None, 'text': None}
+
+    def start(name, attributes):
+        tag = name.rpartition(' ')[2]
+        if tag == 'wpt':
+            state['row'] = {'latitude': attributes.get('lat'), 'longitude': attributes.get('lon')}
+        elif tag == 'name' and state['row'] is not None:
+            state['text'] = []
+
+    def end(name):
+        tag = name.rpartition(' ')[2]
+        if tag == 'wpt':
+            rows.append({k: v for k, v in state['row'].items() if v is not None})
+            state['row'] = None
+        elif tag == 'name' and state['text'] is not None:
+            state['row']['title'] = ''.join(state['text'])
+            state['text'] = None
+
+    def data(text):
+        if state['text'] is not None:
+            state['text'].append(text)
+
+    def forbid_entities(*args):
+        # Объявления сущностей запрещены: защита от экспоненциального раскрытия и внешних файлов
+        raise ImportFormatError(_('Объявления сущностей в GPX не поддерживаются.'))
+
+    parser = expat.ParserCreate(namespace_separator=' ')
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = data
+    parser.EntityDeclHandler = forbid_entities
+    parser.ExternalEntityRefHandler = forbid_entities
+
+    try:
+        for chunk in _read_chunks(stream):
+            parser.Parse(chunk, False)
+            yield from rows
+            rows.clear()
+        parser.Parse(b'', True)
+    except expat.ExpatError as e:
+        raise ImportFormatError(_('Неверный формат GPX: {}.').format(expat.ErrorString(e.code)))
+    yield from rows
+
+
+READERS = {
+    'text/csv': read_csv,
+    'application/x-ndjson': read_ndjson,
+    'application/gpx+xml': read_gpx,
+}
+
+
+def _copy_text(value):
+    # Экранирование для текстового формата COPY
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+class PointLoader:
+    '''
+    Вставка проверенных записей точек пользователя. Пакеты записываются командой COPY
+    во временную таблицу, в points_point они переносятся одной командой в insert():
+    триггер кластеров (миграция 0004_pointcluster) срабатывает один раз на всю загрузку.
+
+    COPY минует построение экземпляров модели и SQL-компилятор, поэтому поля, которые
+    заполняет Point.save(), и значения по умолчанию задаются здесь.
+    '''
+    columns = 'user_id, date_created, date_modified, unlisted, title, latitude, longitude, geohash'
+
+    def __init__(self, user):
+        self.user = user
+        self.date = now().isoformat()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE IF NOT EXISTS points_point_import ('
+                'user_id integer, date_created timestamptz, date_modified timestamptz, unlisted boolean, '
+                'title text, latitude double precision, longitude double precision, geohash varchar(12)'
+                ') ON COMMIT DROP')
+            cursor.execute('TRUNCATE points_point_import')
+
+    def copy(self, rows):
+        user_id = str(self.user.pk)
+        buffer = io.StringIO()
+        for values in rows:
+            buffer.write('\t'.join([
+                user_id,
+                self.date,
+                self.date,
+                't' if values['unlisted'] else 'f',
+                _copy_text(values['title']),
+                repr(values['latitude']),
+                repr(values['longitude']),
+                geohash.encode(values['latitude'], values['longitude']),
+            ]))
+            buffer.write('\n')
+
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert('COPY points_point_import ({}) FROM STDIN'.format(self.columns), buffer)
+
+    def insert(self):
+        with connection.cursor() as cursor:
+            cursor.execute('INSERT INTO points_point ({0}) SELECT {0} FROM points_point_import'.format(self.columns))
+            cursor.execute('TRUNCATE points_point_import')
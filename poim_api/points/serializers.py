@@ -1,21 +1,47 @@
+import math
+from django.conf import settings
+from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 from rest_framework import fields, serializers
 from rest_framework.exceptions import ValidationError
 from poim.points.models import Point
+from poim_api.utils.timing import timed
 
 
 __all__ = [
     'PointSerializer',
+    'PointValuesSerializer',
+    'PointChangeValuesSerializer',
+    'PointClusterSerializer',
+    'PointBatchSerializer',
 ]
 
 
+class CoordinateField(fields.FloatField):
+    'Координата в градусах: FloatField принимает также NaN и бесконечность'
+    default_error_messages = {
+        'not_finite': _('Требуется конечное число.'),
+    }
+
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data)
+        if not math.isfinite(value):
+            self.fail('not_finite')
+        return value
+
+
 class PointSerializer(serializers.ModelSerializer):
     title = fields.CharField(max_length=100, label=_('Название'))
+    # Поля проверяются и при массовой загрузке, см. PointImportView.validate_row
+    latitude = CoordinateField(min_value=-90, max_value=90)
+    longitude = CoordinateField(min_value=-180, max_value=180)
     can_edit = fields.SerializerMethodField()
+    # Только при фильтрации по geo и nearest
+    distance_m = fields.FloatField(source='distance', read_only=True)
 
     class Meta:
         model = Point
-        fields = ['id', 'title', 'latitude', 'longitude', 'unlisted', 'can_edit']
+        fields = ['id', 'title', 'latitude', 'longitude', 'unlisted', 'can_edit', 'distance_m']
         extra_kwargs = {f: {'required': True} for f in fields}
         extra_kwargs['title'].update({
             'max_length': 100,
@@ -26,6 +52,140 @@ class PointSerializer(serializers.ModelSerializer):
         assert 'request' in self.context, 'request must be in context of {}'.format(type(self))
         return self.context['request'].user
 
+    @cached_property
+    def _update_permission(self):
+        # Одно вычисление прав на весь список: ListSerializer использует один экземпляр для всех точек.
+        # Представление может передать уже вычисленные права в контексте.
+        if 'update_permission' in self.context:
+            return self.context['update_permission']
+        return Point.update_permission(self._get_user())
+
+    @timed('serialize')
+    def to_representation(self, instance):
+        return super().to_representation(instance)
+
     def get_can_edit(self, instance):
-        user = self._get_user()
-        return instance.can_update(user)
+        can_update_all, user_id = self._update_permission
+        return can_update_all or instance.user_id == user_id
+
+
+class PointValuesSerializer:
+    '''
+    Выдача точек на чтение без экземпляров модели и полей сериализатора: строки values_list()
+    преобразуются в словари с теми же полями, значениями и порядком ключей, что у PointSerializer.
+    При изменении полей PointSerializer их нужно повторить здесь: побайтовое совпадение выдачи обоих
+    сериализаторов проверяет PointValuesSerializerTestCase.
+    '''
+    columns = ['id', 'title', 'latitude', 'longitude', 'unlisted', 'user_id']
+
+    def __init__(self, context):
+        self.context = context
+
+    def get_rows(self, queryset):
+        '''
+        Строки для выдачи; именованные кортежи, так как KeysetPagination читает из них
+        поля сортировки. distance есть в queryset только при фильтрах geo и nearest,
+        rank — при поиске q; rank в выдачу не входит.
+        '''
+        self.with_distance = 'distance' in queryset.query.annotations
+        columns = self.columns + ['distance'] if self.with_distance else self.columns
+        if 'rank' in queryset.query.annotations:
+            columns = columns + ['rank']
+        return queryset.values_list(*columns, named=True)
+
+    def get_converter(self, with_distance=None):
+        '''
+        Функция преобразования строки в словарь. Права на изменение вычисляются один раз,
+        как в PointSerializer.get_can_edit. with_distance по умолчанию — из get_rows().
+        '''
+        if with_distance is None:
+            with_distance = self.with_distance
+
+        if 'update_permission' in self.context:
+            can_update_all, user_id = self.context['update_permission']
+        else:
+            can_update_all, user_id = Point.update_permission(self.context['request'].user)
+
+        if with_distance:
+            return lambda row: {
+                'id': row[0],
+                'title': row[1],
+                'latitude': row[2],
+                'longitude': row[3],
+                'unlisted': row[4],
+                'can_edit': can_update_all or row[5] == user_id,
+                'distance_m': row[6],
+            }
+
+        return lambda row: {
+            'id': row[0],
+            'title': row[1],
+            'latitude': row[2],
+            'longitude': row[3],
+            'unlisted': row[4],
+            'can_edit': can_update_all or row[5] == user_id,
+        }
+
+    @timed('serialize')
+    def to_representation(self, rows, with_distance=None):
+        return list(map(self.get_converter(with_distance), rows))
+
+
+class PointChangeValuesSerializer(PointValuesSerializer):
+    '''
+    Выдача ленты изменений точек: видимые точки — как в PointValuesSerializer и с полем
+    deleted, удалённые и скрытые — только id и deleted (tombstone).
+    '''
+    columns = PointValuesSerializer.columns + ['date_deleted', 'change_txid']
+
+    def get_converter(self, with_distance=None):
+        convert = super().get_converter(with_distance=False)
+
+        def converter(row):
+            if row.date_deleted is not None or row.unlisted:
+                return {'id': row.id, 'deleted': True}
+
+            data = convert(row)
+            data['deleted'] = False
+            return data
+
+        return converter
+
+
+class PointClusterSerializer(serializers.Serializer):
+    count = fields.IntegerField(label=_('Количество точек'))
+    latitude = fields.FloatField(label=_('Широта центра'))
+    longitude = fields.FloatField(label=_('Долгота центра'))
+    sample_id = fields.IntegerField(label=_('id одной из точек'))
+
+
+class PointBatchOperationSerializer(serializers.Serializer):
+    # Операции соответствуют запросам к /points и /points/{id}:
+    # POST, PUT, PATCH, DELETE и DELETE к /points/{id}/deleted
+    OPERATIONS = ['create', 'update', 'partial_update', 'destroy', 'undelete']
+    DATA_OPERATIONS = ['create', 'update', 'partial_update']
+
+    op = fields.ChoiceField(OPERATIONS, label=_('Операция'))
+    id = fields.IntegerField(required=False, label=_('id точки'))
+    data = fields.DictField(required=False, label=_('Поля точки'))
+
+    def validate(self, attrs):
+        errors = {}
+        if attrs['op'] != 'create' and 'id' not in attrs:
+            errors['id'] = [self.fields['id'].error_messages['required']]
+        if attrs['op'] in self.DATA_OPERATIONS and 'data' not in attrs:
+            errors['data'] = [self.fields['data'].error_messages['required']]
+
+        if errors:
+            raise ValidationError(errors)
+        return attrs
+
+
+class PointBatchSerializer(serializers.Serializer):
+    operations = fields.ListField(child=PointBatchOperationSerializer(), min_length=1, label=_('Операции'))
+
+    def validate_operations(self, value):
+        if len(value) > settings.POINTS_BATCH_MAX_OPERATIONS:
+            raise ValidationError(_('Превышено максимальное число операций: {}.').format(
+                settings.POINTS_BATCH_MAX_OPERATIONS))
+        return value
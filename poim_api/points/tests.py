@@ -1,8 +1,35 @@
+import asyncio
+import base64
+import io
+import json
+import math
+import os
+import tempfile
+import threading
+from collections import OrderedDict
 from copy import copy, deepcopy
-from unittest import skip
+from urllib.parse import parse_qs, urlsplit
+from xml.etree import ElementTree
+from unittest import mock, skip, skipIf
 from django.contrib.auth import get_user_model
-from django.contrib.auth.models import Permission
-from poim_api.utils.tests import TestCase, MultipleUsersTestMixin
+from django.contrib.auth.models import AnonymousUser, Permission
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+from django.utils.translation import gettext_lazy
+from poim.points import geohash, snapshot
+from poim.points.models import Point, PointCluster
+from poim.utils import replicas
+from poim_api.points import caching, tiles
+from poim_api.points.filters import PointFilter
+from poim_api.points.serializers import PointSerializer, PointValuesSerializer
+from poim_api.utils import mvt, renderers, timing
+from poim_api.utils.asgi import ASGIHandler
+from poim_api.utils.pagination import ChangesPagination
+from poim_api.utils.tests import TestCase, TransactionTestCase, MultipleUsersTestMixin, ReplicaTestMixin
 
 
 User = get_user_model()
@@ -86,6 +113,19 @@ class PointCreationTestCase(PointGenericMixin, MultipleUsersTestMixin, TestCase)
         self.assertEqual(response.status_code, 400)
         self.assertEqual(set(response.json().keys()), set(overhead_data.keys()))
 
+    def test_coordinate_range(self):
+        for latitude, longitude in [(91, 0), (-90.5, 0), (0, 180.5), (0, -181), ('NaN', 0), (0, 'Infinity'),
+                                    ('-inf', 0)]:
+            data = copy(self.point_data)
+            data.update({'latitude': latitude, 'longitude': longitude})
+            response = self.alice_client.post(self.point_create_path, data=data)
+            self.assertEqual(response.status_code, 400, msg='for {}, {}'.format(latitude, longitude))
+
+        data = copy(self.point_data)
+        data.update({'latitude': -90, 'longitude': 180})
+        response = self.alice_client.post(self.point_create_path, data=data)
+        self.assertEqual(response.status_code, 201)
+
     def test_anonymous(self):
         data = self.point_data
         response = self.client.post(self.point_create_path, data=data)
@@ -329,6 +369,1546 @@ class PointListTestCase(CreatePointMixin, ModeratorsMixin, PointGenericMixin, Mu
         self.check_list(self.eve_client, expected_data)
         self.check_list(self.client, expected_data)
 
+    def test_can_edit(self):
+        response = self.bob_client.post(self.point_create_path, data=self.point_data)
+        self.assertEqual(response.status_code, 201)
+        bob_point = response.json()
+
+        def check(client, can_edit):
+            response = client.get(self.point_list_path)
+            self.assertEqual([point['id'] for point in response.json()], [bob_point['id'], self.point['id']])
+            self.assertEqual([point['can_edit'] for point in response.json()], can_edit)
+
+        check(self.alice_client, [False, True])
+        check(self.bob_client, [True, False])
+        check(self.dave_client, [False, False])
+        check(self.client, [False, False])
+        check(self.faythe_client, [True, True])
+
+        # Права модератора проверяются один раз на список
+        with mock.patch.object(User, 'has_perm', autospec=True, return_value=True) as has_perm:
+            check(self.carol_client, [True, True])
+        self.assertEqual(has_perm.call_count, 1)
+
     def check_list_filters(self):
         self.check_list(self.alice_client, [self.point], {'geo': '59.878,30.321,10000'})
         self.check_list(self.alice_client, [], {'geo': '59.878,30.321,100'})
+
+
+class CreatePointsMixin:
+    def setUp(self):
+        super().setUp()
+
+        self.points = []
+        for i in range(5):
+            data = copy(self.point_data)
+            data['title'] = 'Point {}'.format(i)
+            data['latitude'] += i * 0.001
+            response = self.alice_client.post(self.point_create_path, data=data)
+            self.assertEqual(response.status_code, 201)
+            self.points.append(response.json())
+
+    def next_link(self, response):
+        link = response.get('Link')
+        if not link:
+            return None
+        self.assertRegex(link, r'^<.+>; rel="next"$')
+        return link[1:link.index('>')]
+
+    def collect(self, client, query_params):
+        response = client.get(self.point_list_path, query_params)
+        pages = []
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.json())
+            next_link = self.next_link(response)
+            if not next_link:
+                return pages
+            response = client.get(next_link)
+
+
+class PointPaginationTestCase(CreatePointsMixin, PointGenericMixin, MultipleUsersTestMixin, TestCase):
+    def test_pages(self):
+        pages = self.collect(self.client, {'page_size': 2})
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+
+        ids = [point['id'] for page in pages for point in page]
+        self.assertEqual(ids, [point['id'] for point in reversed(self.points)])
+
+    def test_last_page_without_link(self):
+        response = self.client.get(self.point_list_path, {'page_size': 5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 5)
+        self.assertIsNone(self.next_link(response))
+
+    def test_geo_pages(self):
+        pages = self.collect(self.client, {'page_size': 2, 'geo': '59.8804,30.32522,10000'})
+        ids = [point['id'] for page in pages for point in page]
+        expected_ids = [self.points[i]['id'] for i in [4, 3, 2, 1, 0]]
+        self.assertEqual(ids, expected_ids)
+
+    def test_new_points_do_not_shift_pages(self):
+        response = self.client.get(self.point_list_path, {'page_size': 2})
+        next_link = self.next_link(response)
+
+        response = self.alice_client.post(self.point_create_path, data=self.point_data)
+        self.assertEqual(response.status_code, 201)
+
+        response = self.client.get(next_link)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p['id'] for p in response.json()], [self.points[2]['id'], self.points[1]['id']])
+
+    def test_invalid_cursor(self):
+        for cursor in ['invalid', 'W10=', 'e30=', 'eyJwIjpbImEiXSwibiI6MH0=', 'eyJwIjpbMV0sIm4iOi0xfQ==']:
+            response = self.client.get(self.point_list_path, {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, msg='for cursor {}'.format(cursor))
+
+
+class PointGeoFilterTestCase(PointGenericMixin, MultipleUsersTestMixin, TestCase):
+    def create_point(self, latitude, longitude):
+        data = copy(self.point_data)
+        data.update({'latitude': latitude, 'longitude': longitude})
+        response = self.alice_client.post(self.point_create_path, data=data)
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def get_ids(self, geo):
+        response = self.client.get(self.point_list_path, {'geo': geo})
+        self.assertEqual(response.status_code, 200)
+        return [point['id'] for point in response.json()]
+
+    def test_radius(self):
+        point = self.create_point(59.876364, 30.32522)
+        self.assertEqual(self.get_ids('59.878,30.321,10000'), [point['id']])
+        self.assertEqual(self.get_ids('59.878,30.321,100'), [])
+
+    def test_high_latitude(self):
+        # ~7.7 км к востоку на 80° с. ш.
+        point = self.create_point(80, 0.4)
+        self.assertEqual(self.get_ids('80,0,10000'), [point['id']])
+        self.assertEqual(self.get_ids('80,0,5000'), [])
+
+    def test_invalid_format(self):
+        response = self.client.get(self.point_list_path, {'geo': '59.878,30.321'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_index_scan(self):
+        queryset = PointFilter({'geo': '59.878,30.321,1000'}, queryset=Point.objects.filter(unlisted=False)).qs
+        sql, params = queryset.query.sql_with_params()
+
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('EXPLAIN ' + sql, params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+
+        self.assertIn('points_point_visible_earth', plan)
+
+
+class PointBBoxFilterTestCase(CreatePointsMixin, PointGenericMixin, MultipleUsersTestMixin, TestCase):
+    def test_bbox(self):
+        ids = [point['id'] for page in self.collect(self.client, {'bbox': '59.877,30.3,59.879,30.4'}) for point in page]
+        self.assertEqual(ids, [self.points[2]['id'], self.points[1]['id']])
+
+    def test_antimeridian(self):
+        ids = []
+        for longitude in [179.9, -179.9, 0]:
+            data = copy(self.point_data)
+            data.update({'latitude': 0, 'longitude': longitude})
+            response = self.alice_client.post(self.point_create_path, data=data)
+            self.assertEqual(response.status_code, 201)
+            ids.append(response.json()['id'])
+
+        response = self.client.get(self.point_list_path, {'bbox': '-1,179,1,-179'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([point['id'] for point in response.json()], [ids[1], ids[0]])
+
+    def test_invalid_bbox(self):
+        for bbox in ['59,30,60', '60,30,59,31', '59,30,91,31', '59,-181,60,31']:
+            response = self.client.get(self.point_list_path, {'bbox': bbox})
+            self.assertEqual(response.status_code, 400, msg='for bbox {}'.format(bbox))
+
+    @override_settings(POINTS_BBOX_MAX_RESULTS=3)
+    def test_max_results(self):
+        pages = self.collect(self.client, {'bbox': '59,30,60,31', 'page_size': 2})
+        self.assertEqual([len(page) for page in pages], [2, 1])
+
+        response = self.client.get(self.point_list_path, {'bbox': '59,30,60,31', 'page_size': 10})
+        self.assertEqual(len(response.json()), 3)
+        self.assertIsNone(self.next_link(response))
+
+        response = self.client.get(self.point_list_path, {'page_size': 10})
+        self.assertEqual(len(response.json()), 5)
+
+    @override_settings(POINTS_BBOX_MAX_RESULTS=3)
+    def test_forged_cursor(self):
+        # Счётчик выданных точек в курсоре не может быть сброшен клиентом
+        response = self.client.get(self.point_list_path, {'bbox': '59,30,60,31', 'page_size': 2})
+        cursor = parse_qs(urlsplit(self.next_link(response)).query)['cursor'][0]
+        payload, signature = cursor.split(':', 1)
+        data = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)).decode())
+        self.assertEqual(data['n'], 2)
+
+        data['n'] = 0
+        payload = base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode()).decode().rstrip('=')
+        response = self.client.get(self.point_list_path, {
+            'bbox': '59,30,60,31', 'page_size': 2, 'cursor': '{}:{}'.format(payload, signature)})
+        self.assertEqual(response.status_code, 404)
+
+
+class PointNearestTestCase(CreatePointsMixin, PointGenericMixin, MultipleUsersTestMixin, TestCase):
+    def test_nearest(self):
+        response = self.client.get(self.point_list_path, {'nearest': '59.8784,30.32522', 'k': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(self.next_link(response))
+
+        response_data = response.json()
+        self.assertEqual([point['id'] for point in response_data], [self.points[i]['id'] for i in [2, 3, 1]])
+
+        distances = [point['distance_m'] for point in response_data]
+        self.assertAlmostEqual(distances[0], 4, delta=1)
+        self.assertAlmostEqual(distances[1], 107, delta=1)
+        self.assertAlmostEqual(distances[2], 115, delta=1)
+
+    def test_integral_float_k(self):
+        response = self.client.get(self.point_list_path, {'nearest': '59.8784,30.32522', 'k': '3.0'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 3)
+
+    def test_default_k(self):
+        with override_settings(POINTS_NEAREST_DEFAULT_K=2):
+            response = self.client.get(self.point_list_path, {'nearest': '59.8784,30.32522'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+    def test_no_distance_without_center(self):
+        response = self.client.get(self.point_list_path)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('distance_m', response.json()[0])
+
+    def test_invalid_params(self):
+        for params in [{'nearest': '59.8'}, {'nearest': '59.8,30.3', 'k': 0}, {'nearest': '59.8,30.3', 'k': 'a'},
+                       {'nearest': '59.8,30.3', 'k': 1001}, {'nearest': '59.8,30.3', 'geo': '59.8,30.3,100'},
+                       {'nearest': 'a,b'}]:
+            response = self.client.get(self.point_list_path, params)
+            self.assertEqual(response.status_code, 400, msg='for {}'.format(params))
+
+    def test_index_scan(self):
+        queryset = PointFilter({'nearest': '59.878,30.321'}, queryset=Point.objects.filter(unlisted=False)).qs[:20]
+        sql, params = queryset.query.sql_with_params()
+
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_sort = off')
+            cursor.execute('EXPLAIN ' + sql, params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+
+        self.assertIn('Index Scan using points_point_visible_earth', plan)
+        self.assertNotIn('Sort', plan)
+
+
+class PointValuesSerializerTestCase(CreatePointsMixin, ModeratorsMixin, PointGenericMixin, MultipleUsersTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        # Скрытые точки выдаются так же, в том числе владельцу и модераторам
+        for title, latitude, longitude, unlisted in [('Bob\u2028 "point"', 59.87, 30.33, False),
+                                                     ('Near zero', 0.00001, -1e-7, False),
+                                                     ('Unlisted', 59.877, 30.324, True)]:
+            data = dict(self.point_data, title=title, latitude=latitude, longitude=longitude, unlisted=unlisted)
+            response = self.bob_client.post(self.point_create_path, data=data)
+            self.assertEqual(response.status_code, 201)
+
+    def check(self, user, query_params):
+        context = {'request': mock.Mock(user=user)}
+        queryset = PointFilter(query_params, queryset=Point.objects.order_by('-id')).qs
+        if 'nearest' in query_params:
+            queryset = queryset[:3]
+
+        expected = renderers.JSONRenderer().render(PointSerializer(list(queryset), many=True, context=context).data)
+
+        serializer = PointValuesSerializer(context)
+        data = serializer.to_representation(serializer.get_rows(queryset))
+        self.assertEqual(renderers.FastJSONRenderer().render(data), expected, msg=query_params)
+        self.assertEqual(renderers.JSONRenderer().render(data), expected, msg=query_params)
+        self.assertEqual(len(data), queryset.count())
+        return data
+
+    def test_compatibility(self):
+        users = [AnonymousUser()] + [User.objects.get(email=self.profiles[name]['email'])
+                                     for name in ['alice', 'bob', 'carol', 'dave', 'faythe']]
+        for user in users:
+            for query_params in [{}, {'geo': '59.878,30.321,10000'}, {'nearest': '0,0'},
+                                 {'bbox': '-1,-1,1,1'}, {'cell': geohash.encode(59.877, 30.325, 4)}]:
+                data = self.check(user, query_params)
+                if not query_params:
+                    self.assertIn(True, [point['unlisted'] for point in data])
+
+    @skipIf(renderers.orjson is None, 'orjson is not installed')
+    def test_fast_json_renderer(self):
+        data = [{'title': 'a\u2028b\u2029\x1f/é', 'value': value, 'none': None, 'flag': True}
+                for value in [0.0001, 0.00001, 1.5e-7, 1e16, 1.5e300, 1.2345678901234567e+17, -0.0, 59.876364, 2 ** 62]]
+        data.append({'date': now(), 'title': gettext_lazy('точка')})
+        for item in data:
+            self.assertEqual(renderers.FastJSONRenderer().render([item]), renderers.JSONRenderer().render([item]))
+
+
+class PointServerTimingTestCase(CreatePointsMixin, PointGenericMixin, MultipleUsersTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        timing.stats.reset()
+
+    def server_timing(self, response):
+        'Метрики заголовка Server-Timing: имя -> (длительность, описание)'
+        metrics = OrderedDict()
+        for metric in response['Server-Timing'].split(', '):
+            name, *params = metric.split(';')
+            params = dict(param.split('=', 1) for param in params)
+            metrics[name] = (float(params['dur']), params.get('desc'))
+        return metrics
+
+    @override_settings(REQUEST_TIMING_SAMPLE_RATE=1)
+    def test_server_timing(self):
+        with CaptureQueriesContext(connection) as queries, self.assertLogs('poim_api.timing') as logs:
+            response = self.bob_client.get(self.point_list_path, {'bbox': '59,30,60,31'})
+        self.assertEqual(response.status_code, 200)
+
+        metrics = self.server_timing(response)
+        self.assertEqual(list(metrics), ['total', 'db', 'filter', 'serialize', 'render'])
+        self.assertEqual(metrics['db'][1], '"{} queries"'.format(len(queries)))
+        for name, (duration, description) in metrics.items():
+            self.assertTrue(0 <= duration <= metrics['total'][0], name)
+
+        record, = logs.records
+        self.assertEqual(record.timing['view'], 'PointListView')
+        self.assertEqual(record.timing['status'], 200)
+        self.assertEqual(record.timing['db_queries'], len(queries))
+
+    @override_settings(REQUEST_TIMING_SAMPLE_RATE=1, POINTS_LIST_CACHE_SECONDS=0)
+    def test_queries_per_page(self):
+        # Число запросов не зависит от числа точек: can_edit вычисляется без запросов на каждую точку.
+        # Первый запрос загружает токен в кэш.
+        self.bob_client.get(self.point_list_path)
+        queries = set()
+        for page_size in [1, len(self.points)]:
+            response = self.bob_client.get(self.point_list_path, {'page_size': page_size})
+            self.assertEqual(len(response.json()), page_size)
+            queries.add(self.server_timing(response)['db'][1])
+        self.assertEqual(len(queries), 1)
+
+    @override_settings(REQUEST_TIMING_SAMPLE_RATE=1, REQUEST_TIMING_STATS_INTERVAL=3)
+    def test_view_stats(self):
+        path = self.point_detail_path.format(id=self.points[0]['id'])
+        with self.assertLogs('poim_api.utils.timing') as logs:
+            self.client.get(self.point_list_path)
+            self.client.get(self.point_list_path)
+            self.client.get(path)
+
+        stats = timing.stats.get()
+        self.assertEqual({view: values['requests'] for view, values in stats.items()},
+            {'PointListView': 2, 'PointDetailView': 1})
+        self.assertEqual(list(stats['PointListView']), ['requests'] + timing.FIELDS)
+        self.assertEqual(len(logs.records), 2)
+
+    def test_disabled(self):
+        response = self.client.get(self.point_list_path)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(timing.stats.get(), {})
+
+
+class PointConditionalGetTestCase(CreatePointsMixin, PointGenericMixin, MultipleUsersTestMixin, TestCase):
+    def revalidate(self, client, path, response, query_params=None):
+        return client.get(path, query_params, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_detail(self):
+        path = self.point_detail_path.format(id=self.points[0]['id'])
+        response = self.alice_client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['ETag'], r'^"[^"]+"$')
+        self.assertIn('Last-Modified', response)
+        self.assertIn('Authorization', response['Vary'])
+
+        not_modified = self.revalidate(self.alice_client, path, response)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+
+        response = self.client.get(path, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        # can_edit у другого пользователя иное
+        self.assertEqual(self.revalidate(self.bob_client, path, not_modified).status_code, 200)
+
+        response = self.alice_client.patch(path, {'title': 'Updated'})
+        self.assertEqual(response.status_code, 200)
+        response = self.revalidate(self.alice_client, path, not_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['title'], 'Updated')
+
+    @override_settings(SHARED_CACHE=True)
+    def test_list(self):
+        query_params = {'page_size': 2}
+        response = self.client.get(self.point_list_path, query_params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'].startswith('W/"'))
+
+        with self.assertNumQueries(1), override_settings(POINTS_LIST_CACHE_SECONDS=0):
+            not_modified = self.revalidate(self.client, self.point_list_path, response, query_params)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+
+        # Из кэша выдачи — без запросов к БД
+        with self.assertNumQueries(0):
+            not_modified = self.revalidate(self.client, self.point_list_path, response, query_params)
+        self.assertEqual(not_modified.status_code, 304)
+
+        # Изменение точки за пределами страницы и её следующей строки страницу не меняет
+        path = self.point_detail_path.format(id=self.points[0]['id'])
+        self.assertEqual(self.alice_client.patch(path, {'title': 'Updated'}).status_code, 200)
+        self.assertEqual(self.revalidate(self.client, self.point_list_path, response, query_params).status_code, 304)
+
+        # Удаление сдвигает страницу
+        path = self.point_detail_path.format(id=self.points[3]['id'])
+        self.assertEqual(self.alice_client.delete(path).status_code, 204)
+        response = self.revalidate(self.client, self.point_list_path, response, query_params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([point['id'] for point in response.json()], [self.points[4]['id'], self.points[2]['id']])
+
+        self.assertEqual(self.revalidate(self.alice_client, self.point_list_path, response, query_params).status_code, 200)
+
+        self.assertEqual(self.alice_client.post(self.point_create_path, data=self.point_data).status_code, 201)
+        self.assertEqual(self.revalidate(self.client, self.point_list_path, response, query_params).status_code, 200)
+
+    def test_filters(self):
+        for query_params in [{'geo': '59.878,30.321,10000'}, {'nearest': '59.878,30.321', 'k': 2},
+                             {'bbox': '59,30,60,31'}, {'geo': '0,0,1'}]:
+            response = self.client.get(self.point_list_path, query_params)
+            self.assertEqual(response.status_code, 200)
+            not_modified = self.revalidate(self.client, self.point_list_path, response, query_params)
+            self.assertEqual(not_modified.status_code, 304, msg=query_params)
+
+        response = self.client.get(self.point_list_path, {'geo': '59.878,30.321,10000'})
+        path = self.point_detail_path.format(id=self.points[1]['id'])
+        self.assertEqual(self.alice_client.patch(path, {'latitude': 59.88}).status_code, 200)
+        response = self.revalidate(self.client, self.point_list_path, response, {'geo': '59.878,30.321,10000'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_docs(self):
+        # Генератор схемы API создаёт сериализаторы без запроса и без прав пользователя в контексте
+        response = self.client.get('/docs/', HTTP_ACCEPT='text/html')
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(SHARED_CACHE=True)
+class PointListCacheTestCase(CreatePointsMixin, PointGenericMixin, MultipleUsersTestMixin, TestCase):
+    geo_params = {'geo': '59.876,30.325,10000'}
+
+    def get_ids(self, client, query_params, queries=None):
+        if queries is None:
+            response = client.get(self.point_list_path, query_params)
+        else:
+            with self.assertNumQueries(queries):
+                response = client.get(self.point_list_path, query_params)
+        self.assertEqual(response.status_code, 200)
+        return [point['id'] for point in response.json()]
+
+    def create(self, latitude, longitude):
+        data = dict(self.point_data, latitude=latitude, longitude=longitude)
+        response = self.alice_client.post(self.point_create_path, data=data)
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def test_cached(self):
+        ids = self.get_ids(self.client, self.geo_params)
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(self.get_ids(self.client, self.geo_params, queries=0), ids)
+
+        # Тот же ответ для другого порядка параметров
+        response = self.client.get(self.point_list_path, {'page_size': 2})
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.point_list_path + '?page_size=2&')
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached['Link'], response['Link'])
+
+    @override_settings(SHARED_CACHE=False)
+    def test_process_local_cache(self):
+        # С кэшем процесса сброс не доходит до других процессов, выдача не кэшируется
+        ids = self.get_ids(self.client, self.geo_params, queries=2)
+        self.assertEqual(self.get_ids(self.client, self.geo_params, queries=2), ids)
+
+    def test_can_edit_overlay(self):
+        response = self.alice_client.get(self.point_list_path)
+        self.assertEqual({point['can_edit'] for point in response.json()}, {True})
+
+        # Запрос токена при аутентификации, выдача из кэша
+        with self.assertNumQueries(1):
+            response = self.bob_client.get(self.point_list_path)
+        self.assertEqual({point['can_edit'] for point in response.json()}, {False})
+
+    def test_region_invalidation(self):
+        ids = self.get_ids(self.client, self.geo_params)
+        self.get_ids(self.client, {})
+
+        # Точка в другой области не сбрасывает кэш запроса с областью, но сбрасывает общий
+        far_id = self.create(55.75, 37.62)
+        self.assertEqual(self.get_ids(self.client, self.geo_params, queries=0), ids)
+        self.assertEqual(self.get_ids(self.client, {})[0], far_id)
+
+        near_id = self.create(59.877, 30.326)
+        self.assertIn(near_id, self.get_ids(self.client, self.geo_params))
+
+        # Перенос точки сбрасывает прежнюю и новую области
+        path = self.point_detail_path.format(id=near_id)
+        self.get_ids(self.client, {'bbox': '55,37,56,38'})
+        response = self.alice_client.patch(path, {'latitude': 55.76, 'longitude': 37.63})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(near_id, self.get_ids(self.client, self.geo_params))
+        self.assertIn(near_id, self.get_ids(self.client, {'bbox': '55,37,56,38'}))
+
+        response = self.alice_client.delete(path)
+        self.assertEqual(response.status_code, 204)
+        self.assertNotIn(near_id, self.get_ids(self.client, {'bbox': '55,37,56,38'}))
+
+    def test_epoch_invalidation(self):
+        self.get_ids(self.client, self.geo_params)
+        with override_settings(POINTS_LIST_CACHE_INVALIDATE_MAX_REGIONS=0):
+            point_id = self.create(59.877, 30.326)
+        self.assertIn(point_id, self.get_ids(self.client, self.geo_params))
+
+    def test_query_regions(self):
+        def regions(**query_params):
+            return caching._query_regions(query_params)
+
+        self.assertEqual(regions(bbox='59.8,30.1,60.1,30.5'), [(149, 210), (150, 210)])
+        self.assertEqual(regions(bbox='10,179.5,10.5,-179.5'), [(100, 359), (100, 0)])
+        self.assertEqual(regions(geo='59.876,30.325,1000'), [(149, 210)])
+        self.assertEqual(regions(cell='udts'), [(149, 210)])
+        self.assertIsNone(regions(bbox='0,0,10,10'))
+        self.assertIsNone(regions(geo='89.99,0,10000'))
+        self.assertIsNone(regions(geo='nan,0,10'))
+        self.assertIsNone(regions(bbox='1,2,3'))
+        self.assertIsNone(regions(nearest='59.876,30.325'))
+        self.assertIsNone(regions())
+
+
+class PointClusterTestCase(CreatePointMixin, PointGenericMixin, MultipleUsersTestMixin, TestCase):
+    point_clusters_path = '/points/clusters'
+
+    def get_clusters(self, bbox='59,30,61,31', zoom=3):
+        response = self.client.get(self.point_clusters_path, {'bbox': bbox, 'zoom': zoom})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def create_point(self, **kwargs):
+        data = copy(self.point_data)
+        data.update(kwargs)
+        response = self.alice_client.post(self.point_create_path, data=data)
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def test_clusters(self):
+        point = self.create_point(latitude=59.95, longitude=30.45)
+        self.create_point(latitude=-59.95, longitude=30.45)
+
+        clusters = self.get_clusters()
+        self.assertEqual(len(clusters), 1)
+        self.assertEqual(clusters[0]['count'], 2)
+        self.assertAlmostEqual(clusters[0]['latitude'], (self.point['latitude'] + 59.95) / 2)
+        self.assertAlmostEqual(clusters[0]['longitude'], (self.point['longitude'] + 30.45) / 2)
+        self.assertIn(clusters[0]['sample_id'], [self.point['id'], point['id']])
+
+        clusters = self.get_clusters(bbox='59.8,30.2,60,30.5', zoom=12)
+        self.assertEqual([cluster['count'] for cluster in clusters], [1, 1])
+
+    def test_visibility(self):
+        self.create_point(unlisted=True)
+        self.assertEqual(self.get_clusters()[0]['count'], 1)
+
+        path = self.point_detail_path.format(id=self.point['id'])
+        response = self.alice_client.delete(path)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.get_clusters(), [])
+
+        response = self.alice_client.delete(self.point_undelete_path.format(id=self.point['id']))
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.get_clusters()[0]['count'], 1)
+
+        response = self.alice_client.patch(path, {'unlisted': True})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_clusters(), [])
+
+    def test_update(self):
+        path = self.point_detail_path.format(id=self.point['id'])
+        response = self.alice_client.patch(path, {'title': 'Renamed'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_clusters()[0]['count'], 1)
+
+        response = self.alice_client.patch(path, {'latitude': -10, 'longitude': -10})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_clusters(), [])
+
+        clusters = self.get_clusters(bbox='-11,-11,-9,-9')
+        self.assertEqual(len(clusters), 1)
+        self.assertEqual(clusters[0]['sample_id'], self.point['id'])
+
+    def test_sample_replaced(self):
+        point = self.create_point()
+        clusters = self.get_clusters()
+        self.assertEqual(clusters[0]['sample_id'], self.point['id'])
+
+        response = self.alice_client.delete(self.point_detail_path.format(id=self.point['id']))
+        self.assertEqual(response.status_code, 204)
+
+        clusters = self.get_clusters()
+        self.assertEqual(clusters[0]['count'], 1)
+        self.assertEqual(clusters[0]['sample_id'], point['id'])
+
+    def test_antimeridian(self):
+        self.create_point(latitude=0, longitude=179.9)
+        self.create_point(latitude=0, longitude=-179.9)
+        clusters = self.get_clusters(bbox='-1,179,1,-179', zoom=5)
+        self.assertEqual(sorted(cluster['longitude'] for cluster in clusters), [-179.9, 179.9])
+
+    def test_coarse_zoom(self):
+        for latitude, longitude in [(59.95, 30.45), (-59.95, 30.45), (-10, -10), (-0.5, -0.5), (10, 179.9)]:
+            self.create_point(latitude=latitude, longitude=longitude)
+        points = list(Point.objects.values_list('latitude', 'longitude'))
+
+        # Масштабы мельче хранимого триггером не поддерживаются
+        self.assertFalse(PointCluster.objects.filter(zoom__lt=PointCluster.MIN_STORED_ZOOM).exists())
+
+        for zoom in range(PointCluster.MIN_STORED_ZOOM + 1):
+            size = PointCluster.cell_size(zoom)
+            expected = {}
+            for latitude, longitude in points:
+                cell = expected.setdefault((math.floor(latitude / size), math.floor(longitude / size)), [])
+                cell.append((latitude, longitude))
+
+            clusters = self.get_clusters(bbox='-90,-180,90,180', zoom=zoom)
+            self.assertEqual(len(clusters), len(expected), msg='zoom {}'.format(zoom))
+            for cluster, (cell, cell_points) in zip(clusters, sorted(expected.items())):
+                self.assertEqual(cluster['count'], len(cell_points))
+                self.assertAlmostEqual(cluster['latitude'], sum(p[0] for p in cell_points) / len(cell_points))
+                self.assertAlmostEqual(cluster['longitude'], sum(p[1] for p in cell_points) / len(cell_points))
+
+        # Область ограничивает выдачу ячейками масштаба запроса
+        clusters = self.get_clusters(bbox='50,20,60,40', zoom=1)
+        self.assertEqual([cluster['count'] for cluster in clusters], [2])
+
+    def test_invalid_params(self):
+        for params in [{'bbox': '59,30,61,31'}, {'zoom': 3}, {'bbox': '59,30,61,31', 'zoom': 13},
+                       {'bbox': '-80,-180,80,180', 'zoom': 12}]:
+            response = self.client.get(self.point_clusters_path, params)
+            self.assertEqual(response.status_code, 400, msg='for {}'.format(params))
+
+
+
+
+class PointCellFilterTestCase(CreatePointsMixin, PointGenericMixin, MultipleUsersTestMixin, TestCase):
+    def get_ids(self, cell):
+        response = self.client.get(self.point_list_path, {'cell': cell})
+        self.assertEqual(response.status_code, 200)
+        return [point['id'] for point in response.json()]
+
+    def test_geohash(self):
+        point = Point.objects.get(id=self.points[0]['id'])
+        self.assertEqual(point.geohash, 'udtsdh4jhg4z')
+        self.assertEqual(geohash.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+
+        point.latitude = -10
+        point.save(update_fields=['latitude'])
+        self.assertEqual(Point.objects.get(id=point.id).geohash, geohash.encode(-10, point.longitude))
+
+    def test_cell(self):
+        ids = [point['id'] for point in reversed(self.points)]
+        self.assertEqual(self.get_ids('udts'), ids)
+        self.assertEqual(self.get_ids('udtsdhd'), ids[1:3])
+        self.assertEqual(self.get_ids('u4pr'), [])
+
+        response = self.alice_client.patch(self.point_detail_path.format(id=ids[0]), {'latitude': -10})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_ids('udts'), ids[1:])
+
+    def test_invalid_cell(self):
+        for cell in ['udtsa', 'UDTS', 'udtsdh4jhg4zu']:
+            response = self.client.get(self.point_list_path, {'cell': cell})
+            self.assertEqual(response.status_code, 400, msg='for {}'.format(cell))
+
+
+
+class PointSearchTestCase(CreatePointsMixin, PointGenericMixin, MultipleUsersTestMixin, TestCase):
+    def create_point(self, title, latitude=59.876364):
+        data = copy(self.point_data)
+        data.update({'title': title, 'latitude': latitude})
+        response = self.alice_client.post(self.point_create_path, data=data)
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def get_ids(self, params):
+        response = self.client.get(self.point_list_path, params)
+        self.assertEqual(response.status_code, 200)
+        return [point['id'] for point in response.json()]
+
+    def test_search(self):
+        cafe = self.create_point('Cafe "Pushkin"')
+        cafes = self.create_point('Cafe, cafe and bar')
+        self.create_point('Restaurant')
+
+        self.assertEqual(self.get_ids({'q': 'cafe'}), [cafes, cafe])
+        self.assertEqual(self.get_ids({'q': 'CAF'}), [cafes, cafe])
+        self.assertEqual(self.get_ids({'q': 'cafe pushkin'}), [cafe])
+        self.assertEqual(self.get_ids({'q': 'cafe-bar'}), [cafes])
+        self.assertEqual(self.get_ids({'q': 'museum'}), [])
+
+        response = self.alice_client.delete(self.point_detail_path.format(id=cafes))
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.get_ids({'q': 'cafe'}), [cafe])
+
+    def test_pages(self):
+        pages = self.collect(self.client, {'q': 'point', 'page_size': 2})
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        ids = [point['id'] for page in pages for point in page]
+        self.assertEqual(ids, [point['id'] for point in reversed(self.points)])
+
+    def test_geo(self):
+        far = self.create_point('Point far', latitude=60.5)
+        response = self.client.get(self.point_list_path, {'q': 'point', 'geo': '59.8784,30.32522,1000'})
+        self.assertEqual(response.status_code, 200)
+
+        response_data = response.json()
+        self.assertEqual([point['id'] for point in response_data], [self.points[i]['id'] for i in [2, 3, 1, 4, 0]])
+        self.assertNotIn(far, [point['id'] for point in response_data])
+        self.assertIn('distance_m', response_data[0])
+
+    def test_invalid_query(self):
+        for q in ['!!!', '_', 'a' * 101]:
+            response = self.client.get(self.point_list_path, {'q': q})
+            self.assertEqual(response.status_code, 400, msg='for {}'.format(q))
+
+    def explain(self, data):
+        queryset = PointFilter(data, queryset=Point.objects.filter(unlisted=False)).qs
+        sql, params = queryset.query.sql_with_params()
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE points_point')
+            cursor.execute('EXPLAIN ' + sql, params)
+            return '\n'.join(row[0] for row in cursor.fetchall())
+
+    def test_index_scan(self):
+        # На нескольких строках планировщик выбирает любой из частичных индексов
+        alice = User.objects.get(email=self.profiles['alice']['email'])
+        Point.objects.bulk_create([Point(user=alice, title='Point {}'.format(i), latitude=59.878, longitude=30.321)
+            for i in range(1000)])
+
+        self.assertIn('points_point_visible_title', self.explain({'q': 'cafe'}))
+        # С geo — по более избирательному из индексов points_point_visible_title и points_point_visible_earth
+        self.assertNotIn('Seq Scan', self.explain({'q': 'cafe', 'geo': '59.878,30.321,2000'}))
+
+
+class PointExportTestCase(CreatePointsMixin, PointGenericMixin, MultipleUsersTestMixin, TestCase):
+    point_export_path = '/points/export'
+
+    def export(self, client, query_params=None):
+        response = client.get(self.point_export_path, query_params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        content = b''.join(response.streaming_content).decode()
+        self.assertTrue(content.endswith('\n'))
+        return [json.loads(line) for line in content.splitlines()]
+
+    @override_settings(POINTS_EXPORT_CHUNK_SIZE=2)
+    def test_export(self):
+        self.assertEqual(self.export(self.alice_client), list(reversed(self.points)))
+        self.assertEqual(self.export(self.client), [dict(p, can_edit=False) for p in reversed(self.points)])
+
+    def test_filters(self):
+        response = self.client.get(self.point_list_path, {'geo': '59.876,30.325,300'})
+        self.assertEqual(self.export(self.client, {'geo': '59.876,30.325,300'}), response.json())
+
+        points = self.export(self.client, {'nearest': '59.88,30.33', 'k': 2})
+        self.assertEqual(len(points), 2)
+
+        response = self.client.get(self.point_export_path, {'geo': '59.876,30.325'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_unlisted(self):
+        response = self.alice_client.patch(self.point_detail_path.format(id=self.points[0]['id']), {'unlisted': True})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.export(self.alice_client)), 4)
+
+    def get_content(self, content_type, query_params=None, **extra):
+        response = self.client.get(self.point_export_path, query_params, **extra)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], content_type)
+        return b''.join(response.streaming_content).decode()
+
+    @override_settings(POINTS_EXPORT_CHUNK_SIZE=2)
+    def test_geojson(self):
+        for params, extra in [({'format': 'geojson'}, {}), (None, {'HTTP_ACCEPT': 'application/geo+json'})]:
+            collection = json.loads(self.get_content('application/geo+json', params, **extra))
+            self.assertEqual(collection['type'], 'FeatureCollection')
+            self.assertEqual(len(collection['features']), 5)
+            point = self.points[-1]
+            self.assertEqual(collection['features'][0], {
+                'type': 'Feature',
+                'id': point['id'],
+                'geometry': {'type': 'Point', 'coordinates': [point['longitude'], point['latitude']]},
+                'properties': {'title': point['title'], 'unlisted': False, 'can_edit': False},
+            })
+
+        collection = json.loads(self.get_content('application/geo+json', {'format': 'geojson', 'cell': 'u4pr'}))
+        self.assertEqual(collection, {'type': 'FeatureCollection', 'features': []})
+
+    def test_gpx(self):
+        Point.objects.filter(id=self.points[0]['id']).update(title='<A & "B">\x01')
+        for params, extra in [({'format': 'gpx'}, {}), (None, {'HTTP_ACCEPT': 'application/gpx+xml'})]:
+            root = ElementTree.fromstring(self.get_content('application/gpx+xml', params, **extra))
+            namespace = '{http://www.topografix.com/GPX/1/1}'
+            self.assertEqual(root.tag, namespace + 'gpx')
+            waypoints = root.findall(namespace + 'wpt')
+            self.assertEqual(len(waypoints), 5)
+            self.assertEqual(float(waypoints[0].get('lat')), self.points[-1]['latitude'])
+            self.assertEqual(float(waypoints[0].get('lon')), self.points[-1]['longitude'])
+            self.assertEqual(waypoints[-1].find(namespace + 'name').text, '<A & "B">')
+
+    def test_format_errors(self):
+        response = self.client.get(self.point_export_path, {'format': 'kml'})
+        self.assertEqual(response.status_code, 404)
+
+        response = self.client.get(self.point_export_path, {'format': 'gpx', 'geo': '59.876,30.325'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('geo', response.json())
+
+
+
+class PointChangesTestCase(CreatePointsMixin, PointGenericMixin, MultipleUsersTestMixin, TransactionTestCase):
+    point_changes_path = '/points/changes'
+
+    def sync(self, client, link):
+        'Изменения по ссылке до пустой страницы и ссылка для следующей синхронизации'
+        changes = []
+        while True:
+            response = client.get(link)
+            self.assertEqual(response.status_code, 200)
+            link = self.next_link(response)
+            self.assertIsNotNone(link)
+            if not response.json():
+                return changes, link
+            changes += response.json()
+
+    def test_changes(self):
+        changes, link = self.sync(self.alice_client, self.point_changes_path + '?page_size=2')
+        self.assertEqual(changes, [dict(point, deleted=False) for point in self.points])
+
+        # Нет изменений — та же ссылка, один запрос по индексу
+        with self.assertNumQueries(1):
+            response = self.client.get(link)
+        self.assertEqual(response.json(), [])
+        self.assertEqual(self.next_link(response), link)
+
+        ids = [point['id'] for point in self.points]
+        path = self.point_detail_path.format(id=ids[3])
+        self.assertEqual(self.alice_client.patch(path, {'title': 'Renamed'}).status_code, 200)
+        path = self.point_detail_path.format(id=ids[1])
+        self.assertEqual(self.alice_client.delete(path).status_code, 204)
+        path = self.point_detail_path.format(id=ids[0])
+        self.assertEqual(self.alice_client.patch(path, {'unlisted': True}).status_code, 200)
+        response = self.alice_client.post(self.point_create_path, data=self.point_data)
+        self.assertEqual(response.status_code, 201)
+        created = response.json()
+
+        changes, link = self.sync(self.bob_client, link)
+        self.assertEqual(changes, [
+            dict(self.points[3], title='Renamed', can_edit=False, deleted=False),
+            {'id': ids[1], 'deleted': True},
+            {'id': ids[0], 'deleted': True},
+            dict(created, can_edit=False, deleted=False),
+        ])
+
+        path = self.point_undelete_path.format(id=ids[1])
+        self.assertEqual(self.alice_client.delete(path).status_code, 204)
+        changes, link = self.sync(self.client, link)
+        self.assertEqual(changes, [dict(self.points[1], can_edit=False, deleted=False)])
+
+    def test_uncommitted(self):
+        changes, link = self.sync(self.client, self.point_changes_path)
+
+        # Изменения незавершённой транзакции не выдаются, курсор не переходит через них
+        with transaction.atomic():
+            Point.objects.filter(id=self.points[0]['id']).update(title='Renamed')
+            self.assertEqual(self.client.get(link).json(), [])
+
+        changes, link = self.sync(self.client, link)
+        self.assertEqual([point['title'] for point in changes], ['Renamed'])
+
+    def test_cursor_condition(self):
+        # Условие курсора — сравнение строк: диапазон по индексу (change_txid, id); в строки выборки не входит
+        pagination = ChangesPagination()
+        queryset = Point.all_objects.order_by('change_txid', 'id')
+        pagination.ordering = pagination.get_ordering(queryset)
+        queryset = pagination.filter_position(queryset.values_list('id', named=True), [0, 0])
+
+        sql, params = queryset.query.sql_with_params()
+        self.assertIn('(("points_point"."change_txid", "points_point"."id") > (%s, %s))', sql)
+        rows = list(queryset)
+        self.assertEqual({row._fields for row in rows}, {('id',)})
+        self.assertEqual([row.id for row in rows], [point['id'] for point in self.points])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.point_changes_path, {'since': 'abc'})
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], DATABASE_REPLICA_MAX_LAG_SECONDS=0,
+    DATABASE_REPLICA_CHECK_SECONDS=0, POINTS_LIST_CACHE_SECONDS=0)
+class PointReplicaTestCase(ReplicaTestMixin, CreatePointsMixin, PointGenericMixin, MultipleUsersTestMixin,
+        TransactionTestCase):
+    def get(self, client, path, alias):
+        'Запрос с проверкой, что точки прочитаны только из БД alias'
+        with CaptureQueriesContext(connections['default']) as default, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = client.get(path)
+        self.assertEqual(response.status_code, 200)
+
+        reads = {
+            name: any('"points_point"' in query['sql'] for query in queries.captured_queries)
+            for name, queries in [('default', default), ('replica', replica)]
+        }
+        self.assertEqual(reads, {'default': alias == 'default', 'replica': alias == 'replica'})
+        return response
+
+    def test_read_your_writes(self):
+        path = self.point_detail_path.format(id=self.points[0]['id'])
+        self.get(self.client, path, 'replica')
+        self.get(self.bob_client, self.point_list_path, 'replica')
+        # Клиент, создававший точки, закреплён за основной БД
+        self.get(self.alice_client, self.point_list_path, 'default')
+
+        response = self.bob_client.post(self.point_create_path, data=self.point_data)
+        self.assertEqual(response.status_code, 201)
+        created = response.json()
+
+        response = self.get(self.bob_client, self.point_list_path, 'default')
+        self.assertEqual(response.json()[0]['id'], created['id'])
+        self.get(self.carol_client, self.point_list_path, 'replica')
+
+        with override_settings(DATABASE_REPLICA_PIN_SECONDS=0):
+            self.assertEqual(self.carol_client.delete(self.point_detail_path.format(id=created['id'])).status_code, 403)
+            self.get(self.carol_client, self.point_list_path, 'replica')
+
+    def test_lagging_replica(self):
+        with mock.patch.object(replicas, 'get_lag', return_value=10):
+            self.get(self.bob_client, self.point_list_path, 'default')
+        self.get(self.bob_client, self.point_list_path, 'replica')
+
+    def test_unavailable_replica(self):
+        with mock.patch.object(replicas, 'get_lag', side_effect=OperationalError) as get_lag:
+            self.get(self.client, self.point_list_path, 'default')
+            self.get(self.client, self.point_list_path, 'default')
+        # Недоступная реплика не проверяется до истечения DATABASE_REPLICA_RETRY_SECONDS
+        self.assertEqual(get_lag.call_count, 1)
+        self.get(self.client, self.point_list_path, 'default')
+
+    def test_lag(self):
+        # Основная БД не является репликой
+        self.assertEqual(replicas.get_lag('replica'), 0)
+        # Реплика, приёмник WAL которой не подключён, считается отстающей
+        with mock.patch.object(replicas, 'LAG_SQL', 'SELECT NULL'):
+            self.assertEqual(replicas.get_lag('replica'), float('inf'))
+            self.assertFalse(replicas.is_usable('replica'))
+
+    @override_settings(DATABASE_REPLICA_MAX_LAG_SECONDS=0.05)
+    def test_repeat_after_lag(self):
+        calls = []
+        done = threading.Event()
+        with self.assertLogs('poim.utils.replicas', 'ERROR'):
+            replicas.repeat_after_lag(lambda: 1 / 0)
+            for number in range(10):
+                replicas.repeat_after_lag(lambda number=number: calls.append(number))
+            replicas.repeat_after_lag(done.set)
+            self.assertTrue(done.wait(5))
+        self.assertEqual(calls, list(range(10)))
+        # Все вызовы выполняются одним потоком
+        self.assertEqual(len([thread for thread in threading.enumerate() if thread.name == 'replica-lag-repeats']), 1)
+
+    def test_replica_failure(self):
+        # Реплика отказала после проверки: запрос повторяется в основной БД
+        with mock.patch.object(replicas, 'get_lag', return_value=0), \
+                mock.patch.dict(connections['replica'].settings_dict, NAME='poi_manager_missing'):
+            response = self.client.get(self.point_list_path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), len(self.points))
+        self.assertFalse(replicas.is_usable('replica'))
+
+
+class PointASGITestCase(CreatePointsMixin, PointGenericMixin, MultipleUsersTestMixin, TransactionTestCase):
+    'Запросы через ASGI-приложение: представления выполняются в потоках пулов со своими соединениями с БД'
+
+    def setUp(self):
+        super().setUp()
+        self.handler = ASGIHandler()
+
+    def tearDown(self):
+        self.handler.read_executor.shutdown()
+        self.handler.write_executor.shutdown()
+        super().tearDown()
+
+    def scope(self, method, path, query_string=b'', headers=()):
+        return {
+            'type': 'http',
+            'method': method,
+            'path': path,
+            'query_string': query_string,
+            'headers': [(b'accept', b'application/json')] + list(headers),
+            'server': ('testserver', 80),
+            'client': ('127.0.0.1', 50000),
+        }
+
+    def call(self, scope, messages, send=None):
+        'Сообщения ответа приложения на сообщения запроса messages'
+        messages = list(messages)
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def append(message):
+            sent.append(message)
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self.handler(scope, receive, send or append))
+        finally:
+            loop.close()
+        return sent
+
+    def test_environ(self):
+        scope = dict(self.scope('POST', '/точки', b'a=1&b=%D1%82', [
+            (b'content-type', b'application/json'),
+            (b'content-length', b'2'),
+            (b'x-forwarded-for', b'10.0.0.1'),
+            (b'X-Forwarded-For', b'10.0.0.2'),
+        ]), root_path='/api', scheme='https', http_version='2')
+        environ = self.handler.get_environ(scope, io.BytesIO(b'{}'))
+
+        self.assertEqual(environ['REQUEST_METHOD'], 'POST')
+        self.assertEqual(environ['SCRIPT_NAME'], '/api')
+        self.assertEqual(environ['PATH_INFO'].encode('latin-1').decode('utf-8'), '/точки')
+        self.assertEqual(environ['QUERY_STRING'], 'a=1&b=%D1%82')
+        self.assertEqual((environ['SERVER_NAME'], environ['SERVER_PORT']), ('testserver', '80'))
+        self.assertEqual(environ['SERVER_PROTOCOL'], 'HTTP/2')
+        self.assertEqual(environ['wsgi.url_scheme'], 'https')
+        self.assertEqual(environ['REMOTE_ADDR'], '127.0.0.1')
+        # Заголовки тела без префикса HTTP_, повторяющиеся заголовки объединяются
+        self.assertEqual((environ['CONTENT_TYPE'], environ['CONTENT_LENGTH']), ('application/json', '2'))
+        self.assertNotIn('HTTP_CONTENT_TYPE', environ)
+        self.assertEqual(environ['HTTP_X_FORWARDED_FOR'], '10.0.0.1,10.0.0.2')
+        self.assertEqual(environ['wsgi.input'].read(), b'{}')
+
+        environ = self.handler.get_environ(self.scope('POST', '/'), io.BytesIO(b'abc'))
+        self.assertEqual(environ['CONTENT_LENGTH'], '3')
+        self.assertEqual(environ['wsgi.input'].read(), b'abc')
+
+    def test_request_body(self):
+        body = json.dumps(dict(self.point_data, title='Через ASGI')).encode('utf-8')
+        scope = self.scope('POST', self.point_create_path, headers=[
+            (b'content-type', b'application/json'),
+            (b'authorization', 'Token {}'.format(self.auth_tokens['alice']).encode('latin-1')),
+        ])
+        # Тело приходит несколькими сообщениями, без Content-Length (chunked)
+        sent = self.call(scope, [
+            {'type': 'http.request', 'body': body[:5], 'more_body': True},
+            {'type': 'http.request', 'body': b'', 'more_body': True},
+            {'type': 'http.request', 'body': body[5:]},
+        ])
+
+        self.assertEqual(sent[0]['type'], 'http.response.start')
+        self.assertEqual(sent[0]['status'], 201)
+        content = b''.join(message.get('body', b'') for message in sent[1:])
+        self.assertEqual(json.loads(content.decode('utf-8'))['title'], 'Через ASGI')
+        self.assertTrue(Point.objects.filter(title='Через ASGI').exists())
+
+    @override_settings(POINTS_EXPORT_CHUNK_SIZE=2)
+    def test_streaming(self):
+        sent = self.call(self.scope('GET', '/points/export', headers=[(b'accept', b'application/x-ndjson')]),
+            [{'type': 'http.request'}])
+
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertIn((b'content-type', b'application/x-ndjson'), sent[0]['headers'])
+        # Выгрузка передаётся по частям, последнее сообщение завершает ответ
+        self.assertGreater(len(sent), 3)
+        self.assertTrue(all(message['more_body'] for message in sent[1:-1]))
+        self.assertEqual(sent[-1], {'type': 'http.response.body', 'body': b''})
+        lines = b''.join(message['body'] for message in sent[1:]).decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], [point['id'] for point in reversed(self.points)])
+
+    def test_disconnect_during_body(self):
+        sent = self.call(self.scope('POST', self.point_create_path), [
+            {'type': 'http.request', 'body': b'{"title": ', 'more_body': True},
+            {'type': 'http.disconnect'},
+        ])
+        self.assertEqual(sent, [])
+
+    @override_settings(POINTS_EXPORT_CHUNK_SIZE=1)
+    def test_disconnect_during_response(self):
+        sent = []
+
+        async def send(message):
+            # Клиент отключается после первой части ответа
+            if len(sent) == 2:
+                raise OSError('Connection lost')
+            sent.append(message)
+
+        self.call(self.scope('GET', '/points/export', headers=[(b'accept', b'application/x-ndjson')]),
+            [{'type': 'http.request'}], send)
+        self.assertEqual(len(sent), 2)
+        self.assertTrue(sent[1]['more_body'])
+
+        # Потоки пула продолжают обслуживать запросы
+        sent = self.call(self.scope('GET', self.point_list_path), [{'type': 'http.request'}])
+        self.assertEqual(sent[0]['status'], 200)
+
+
+class PointImportTestCase(PointGenericMixin, MultipleUsersTestMixin, TestCase):
+    point_import_path = '/points/import'
+
+    csv_data = 'title,latitude,longitude,unlisted\nFirst,59.9,30.3,true\n"Second, quoted",-10,-20.5,\n'
+    ndjson_data = '{"title": "First", "latitude": 59.9, "longitude": 30.3, "unlisted": true}\n\n' \
+        '{"title": "Second, quoted", "latitude": -10, "longitude": -20.5}\n'
+    gpx_data = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<gpx version="1.1" creator="test" xmlns="http://www.topografix.com/GPX/1/1">'
+        '<wpt lat="59.9" lon="30.3"><ele>10</ele><name>First</name></wpt>'
+        '<wpt lat="-10" lon="-20.5"><name>Second, &amp; quoted</name></wpt>'
+        '</gpx>'
+    )
+
+    def post(self, client, data, content_type):
+        return client.post(self.point_import_path, data, content_type=content_type)
+
+    def imported(self):
+        return list(Point.objects.order_by('id').values_list('title', 'latitude', 'longitude', 'unlisted', 'geohash'))
+
+    def test_csv(self):
+        response = self.post(self.alice_client, self.csv_data, 'text/csv; charset=utf-8')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'created': 2})
+        self.assertEqual(self.imported(), [
+            ('First', 59.9, 30.3, True, geohash.encode(59.9, 30.3)),
+            ('Second, quoted', -10, -20.5, False, geohash.encode(-10, -20.5)),
+        ])
+
+        response = self.client.get(self.point_list_path)
+        self.assertEqual([point['title'] for point in response.json()], ['Second, quoted'])
+
+    def test_ndjson(self):
+        response = self.post(self.alice_client, self.ndjson_data, 'application/x-ndjson')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([row[:4] for row in self.imported()], [
+            ('First', 59.9, 30.3, True),
+            ('Second, quoted', -10, -20.5, False),
+        ])
+
+    def test_gpx(self):
+        response = self.post(self.alice_client, self.gpx_data, 'application/gpx+xml')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([row[:4] for row in self.imported()], [
+            ('First', 59.9, 30.3, False),
+            ('Second, & quoted', -10, -20.5, False),
+        ])
+
+    def test_escaping(self):
+        title = 'Tab\there \\N back\\slash'
+        response = self.post(self.alice_client, json.dumps({'title': title, 'latitude': 1, 'longitude': 2}),
+                             'application/x-ndjson')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Point.objects.get().title, title)
+
+    def test_row_errors(self):
+        data = self.csv_data + ',1,2\n{},x,3\nLast,1,2,maybe\nNaN,NaN,inf\nFar,-91,200\n'.format('1' * 101)
+        response = self.post(self.alice_client, data, 'text/csv')
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()['errors']
+        self.assertEqual([error['row'] for error in errors], [3, 4, 5, 6, 7])
+        self.assertEqual(set(errors[0]['errors']), {'title'})
+        self.assertEqual(set(errors[1]['errors']), {'title', 'latitude'})
+        self.assertEqual(set(errors[2]['errors']), {'unlisted'})
+        self.assertEqual(set(errors[3]['errors']), {'latitude', 'longitude'})
+        self.assertEqual(set(errors[4]['errors']), {'latitude', 'longitude'})
+        self.assertEqual(self.imported(), [])
+
+        response = self.post(self.alice_client, self.ndjson_data + '[1]\n', 'application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'][0]['row'], 3)
+
+    @override_settings(POINTS_IMPORT_MAX_ROWS=3, POINTS_IMPORT_BATCH_SIZE=2)
+    def test_limits(self):
+        response = self.post(self.alice_client, self.csv_data + 'Third,1,1\nFourth,1,1\n', 'text/csv')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'][0]['row'], 4)
+        self.assertEqual(self.imported(), [])
+
+        response = self.post(self.alice_client, self.csv_data + 'Third,1,1\n', 'text/csv')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(self.imported()), 3)
+
+    def test_format_errors(self):
+        for data in ['<gpx><wpt lat="1" lon="2"></gpx>',
+                     '<!DOCTYPE gpx [<!ENTITY a "aaaaaaaaaa">]><gpx><wpt lat="1" lon="2"><name>&a;</name></wpt></gpx>']:
+            response = self.post(self.alice_client, data, 'application/gpx+xml')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('non_field_errors', response.json())
+
+        response = self.post(self.alice_client, b'title,latitude,longitude\n\xff,1,2\n', 'text/csv')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.post(self.alice_client, self.csv_data, 'application/xml')
+        self.assertEqual(response.status_code, 415)
+        self.assertEqual(self.imported(), [])
+
+    def test_permissions(self):
+        response = self.post(self.client, self.csv_data, 'text/csv')
+        self.assertEqual(response.status_code, 401)
+
+
+class PointBatchTestCase(CreatePointMixin, ModeratorsMixin, PointGenericMixin, MultipleUsersTestMixin, TestCase):
+    point_batch_path = '/points/batch'
+
+    def setUp(self):
+        super().setUp()
+        response = self.bob_client.post(self.point_create_path, data=self.point_data)
+        self.assertEqual(response.status_code, 201)
+        self.bob_point = response.json()
+
+    def batch(self, client, operations, status_code=200):
+        response = client.post(self.point_batch_path, {'operations': operations})
+        self.assertEqual(response.status_code, status_code)
+        return response.json()
+
+    def test_operations(self):
+        results = self.batch(self.alice_client, [
+            {'op': 'create', 'data': dict(self.point_data, title='New')},
+            {'op': 'partial_update', 'id': self.point['id'], 'data': {'title': 'Patched'}},
+            {'op': 'update', 'id': self.point['id'], 'data': dict(self.point_data, unlisted=True)},
+            {'op': 'destroy', 'id': self.point['id']},
+            {'op': 'undelete', 'id': self.point['id']},
+            {'op': 'destroy', 'id': self.point['id']},
+        ])['results']
+
+        self.assertEqual([result['status'] for result in results], [201, 200, 200, 204, 204, 204])
+        self.assertEqual(results[0]['data']['title'], 'New')
+        self.assertEqual(results[1]['data']['title'], 'Patched')
+        self.assertEqual(results[2]['data'], dict(self.point, unlisted=True))
+
+        response = self.alice_client.get(self.point_detail_path.format(id=self.point['id']))
+        self.assertEqual(response.status_code, 404)
+        instance = Point.all_objects.get(id=self.point['id'])
+        self.assertEqual((instance.title, instance.unlisted), ('My point', True))
+
+        response = self.alice_client.get(self.point_detail_path.format(id=results[0]['data']['id']))
+        self.assertEqual(response.json(), results[0]['data'])
+
+    def test_operation_errors(self):
+        results = self.batch(self.alice_client, [
+            {'op': 'partial_update', 'id': self.bob_point['id'], 'data': {'title': 'Not mine'}},
+            {'op': 'create', 'data': {'title': ''}},
+            {'op': 'undelete', 'id': self.point['id']},
+            {'op': 'destroy', 'id': 0},
+            {'op': 'partial_update', 'id': self.point['id'], 'data': {'title': 'Mine'}},
+        ])['results']
+
+        self.assertEqual([result['status'] for result in results], [403, 400, 404, 404, 200])
+        self.assertEqual(set(results[1]['errors']), {'title', 'latitude', 'longitude', 'unlisted'})
+        self.assertIn('detail', results[0]['errors'])
+
+        self.assertEqual(Point.objects.get(id=self.bob_point['id']).title, 'My point')
+        self.assertEqual(Point.objects.get(id=self.point['id']).title, 'Mine')
+
+    def test_database_errors(self):
+        save = Point.save
+
+        def failing_save(instance, *args, **kwargs):
+            save(instance, *args, **kwargs)
+            if instance.title in errors:
+                raise errors[instance.title]
+
+        errors = {'Conflict': IntegrityError('conflict'), 'Failure': OperationalError('failure')}
+        with mock.patch.object(Point, 'save', failing_save), \
+                mock.patch('poim_api.points.views.invalidate_points') as invalidate_points, \
+                self.assertLogs('poim_api.points.views', 'ERROR'):
+            results = self.batch(self.alice_client, [
+                {'op': 'partial_update', 'id': self.point['id'], 'data': {'title': 'Conflict', 'unlisted': True}},
+                {'op': 'create', 'data': dict(self.point_data, title='Failure')},
+                {'op': 'partial_update', 'id': self.point['id'], 'data': {'title': 'Patched'}},
+            ])['results']
+
+        self.assertEqual([result['status'] for result in results], [409, 500, 200])
+        self.assertIn('detail', results[0]['errors'])
+
+        # Изменения операций с ошибкой откачены, в том числе в памяти
+        instance = Point.objects.get(id=self.point['id'])
+        self.assertEqual((instance.title, instance.unlisted), ('Patched', False))
+        self.assertFalse(Point.all_objects.filter(title='Failure').exists())
+
+        locations = invalidate_points.call_args[0]
+        self.assertEqual([location.id for location in locations if isinstance(location, Point)], [self.point['id']])
+
+    def test_moderator(self):
+        results = self.batch(self.carol_client, [
+            {'op': 'destroy', 'id': self.point['id']},
+            {'op': 'destroy', 'id': self.bob_point['id']},
+        ])['results']
+        self.assertEqual([result['status'] for result in results], [204, 204])
+
+        results = self.batch(self.dave_client, [{'op': 'undelete', 'id': self.point['id']}])['results']
+        self.assertEqual(results[0]['status'], 403)
+
+    def test_single_permissions_query(self):
+        operations = [{'op': 'partial_update', 'id': id, 'data': {'title': 'Batch'}}
+                      for id in [self.point['id'], self.bob_point['id']] * 5]
+
+        with CaptureQueriesContext(connection) as queries:
+            results = self.batch(self.faythe_client, operations)['results']
+        self.assertEqual({result['status'] for result in results}, {200})
+
+        selects = [query['sql'] for query in queries.captured_queries
+                   if query['sql'].startswith('SELECT') and 'FROM "points_point"' in query['sql']]
+        self.assertEqual(len(selects), 1)
+
+    def test_invalid_batch(self):
+        for operations in [[], [{'op': 'move', 'id': self.point['id']}], [{'op': 'destroy'}],
+                           [{'op': 'destroy', 'id': self.point['id']}, {'op': 'update', 'id': self.point['id']}]]:
+            response = self.alice_client.post(self.point_batch_path, {'operations': operations})
+            self.assertEqual(response.status_code, 400, msg=operations)
+            self.assertIn('operations', response.json())
+
+        self.assertTrue(Point.objects.filter(id=self.point['id']).exists())
+
+        with override_settings(POINTS_BATCH_MAX_OPERATIONS=1):
+            self.batch(self.alice_client, [{'op': 'destroy', 'id': self.point['id']}] * 2, status_code=400)
+
+    def test_anonymous(self):
+        self.batch(self.client, [{'op': 'destroy', 'id': self.point['id']}], status_code=401)
+
+
+def decode_varints(data):
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            values.append(value)
+            value = shift = 0
+    return values
+
+
+def decode_protobuf(data):
+    'Поля сообщения protobuf: {номер: [значения]}; вложенные сообщения и упакованные поля остаются bytes'
+    fields = {}
+    position = 0
+
+    def varint():
+        nonlocal position
+        end = position
+        while data[end] & 0x80:
+            end += 1
+        value = decode_varints(data[position:end + 1])[0]
+        position = end + 1
+        return value
+
+    while position < len(data):
+        key = varint()
+        if key & 7 == 0:
+            value = varint()
+        elif key & 7 == 1:
+            value = data[position:position + 8]
+            position += 8
+        else:
+            length = varint()
+            value = data[position:position + length]
+            position += length
+        fields.setdefault(key >> 3, []).append(value)
+
+    return fields
+
+
+@override_settings(SHARED_CACHE=True)
+class PointTileTestCase(CreatePointMixin, PointGenericMixin, MultipleUsersTestMixin, TestCase):
+    # Тайл масштаба 10, содержащий точку из point_data
+    tile = (10, 598, 298)
+
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+
+    def get_features(self, z, x, y):
+        response = self.client.get('/points/tiles/{}/{}/{}.mvt'.format(z, x, y))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/vnd.mapbox-vector-tile')
+
+        layers = decode_protobuf(response.content).get(3, [])
+        if not layers:
+            return {}
+
+        self.assertEqual(len(layers), 1)
+        layer = decode_protobuf(layers[0])
+        self.assertEqual(layer[1], [b'points'])
+        self.assertEqual(layer[5], [4096])
+        keys = [key.decode() for key in layer[3]]
+        values = [decode_protobuf(value)[1][0].decode() for value in layer[4]]
+
+        features = {}
+        for feature in layer[2]:
+            feature = decode_protobuf(feature)
+            tags = decode_varints(feature[2][0])
+            command, x, y = decode_varints(feature[4][0])
+            self.assertEqual(feature[3], [1])
+            self.assertEqual(command, 9)
+            self.assertTrue(0 <= x // 2 <= 4096 and 0 <= y // 2 <= 4096)
+            features[feature[1][0]] = {keys[k]: values[v] for k, v in zip(tags[::2], tags[1::2])}
+        return features
+
+    def test_tile(self):
+        self.assertEqual(self.get_features(*self.tile), {self.point['id']: {'title': 'My point'}})
+        self.assertEqual(self.get_features(0, 0, 0), {self.point['id']: {'title': 'My point'}})
+        self.assertEqual(self.get_features(10, 598, 297), {})
+
+    def test_invalidation(self):
+        self.assertEqual(len(self.get_features(*self.tile)), 1)
+
+        point = self.alice_client.post(self.point_create_path, data=self.point_data).json()
+        self.assertEqual(len(self.get_features(*self.tile)), 2)
+
+        path = self.point_detail_path.format(id=point['id'])
+        response = self.alice_client.patch(path, {'title': 'Renamed'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_features(*self.tile)[point['id']], {'title': 'Renamed'})
+
+        response = self.alice_client.delete(path)
+        self.assertEqual(response.status_code, 204)
+        self.assertNotIn(point['id'], self.get_features(*self.tile))
+
+        response = self.alice_client.delete(self.point_undelete_path.format(id=point['id']))
+        self.assertEqual(response.status_code, 204)
+        self.assertIn(point['id'], self.get_features(*self.tile))
+
+        response = self.alice_client.patch(path, {'latitude': -10})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(point['id'], self.get_features(*self.tile))
+        self.assertIn(point['id'], self.get_features(0, 0, 0))
+
+    def test_cached(self):
+        self.get_features(*self.tile)
+        Point.objects.update(title='Changed directly')
+        self.assertEqual(self.get_features(*self.tile), {self.point['id']: {'title': 'My point'}})
+
+    def test_invalidation_during_render(self):
+        # Изменение точек между запросом к БД и записью тайла в кэш не оставляет в кэше устаревший тайл
+        encode_layer = mvt.encode_layer
+
+        def change_points(*args):
+            Point.objects.update(title='Changed')
+            tiles.invalidate_tiles((self.point_data['latitude'], self.point_data['longitude']))
+            return encode_layer(*args)
+
+        with mock.patch.object(mvt, 'encode_layer', change_points):
+            self.assertEqual(self.get_features(*self.tile), {self.point['id']: {'title': 'My point'}})
+        self.assertEqual(self.get_features(*self.tile), {self.point['id']: {'title': 'Changed'}})
+
+    @override_settings(SHARED_CACHE=False)
+    def test_process_local_cache(self):
+        self.get_features(*self.tile)
+        Point.objects.update(title='Changed directly')
+        self.assertEqual(self.get_features(*self.tile), {self.point['id']: {'title': 'Changed directly'}})
+
+    def test_unlisted(self):
+        self.alice_client.patch(self.point_detail_path.format(id=self.point['id']), {'unlisted': True})
+        self.assertEqual(self.get_features(*self.tile), {})
+
+    def test_invalid_tile(self):
+        for path in ['/points/tiles/19/0/0.mvt', '/points/tiles/1/2/0.mvt', '/points/tiles/1/0/2.mvt']:
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 404, msg='for {}'.format(path))
+
+
+@skipIf(snapshot.numpy is None, 'numpy is not installed')
+class PointSnapshotTestCase(CreatePointsMixin, PointGenericMixin, MultipleUsersTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'points.npy')
+        self.settings = override_settings(POINTS_SNAPSHOT_PATH=self.path, POINTS_SNAPSHOT_CHECK_SECONDS=0)
+        self.settings.enable()
+        call_command('refresh_points_snapshot', '--full', stdout=open(os.devnull, 'w'))
+
+    def tearDown(self):
+        self.settings.disable()
+        self.tmp_dir.cleanup()
+        super().tearDown()
+
+    def refresh(self):
+        call_command('refresh_points_snapshot', stdout=open(os.devnull, 'w'))
+
+    def get_list(self, query_params):
+        response = self.client.get(self.point_list_path, query_params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_same_results(self):
+        for params in [{'geo': '59.876,30.325,300'}, {'bbox': '59.8765,30,59.8785,31'},
+                       {'bbox': '59,179,61,30.5'}, {'nearest': '59.88,30.33', 'k': 3},
+                       {'nearest': '59.88,30.33', 'k': 3, 'q': 'point 0'},
+                       {'nearest': '59.88,30.33', 'k': 3, 'bbox': '59.8765,30,59.8785,31'},
+                       {'nearest': '59.88,30.33', 'k': 3, 'cell': geohash.encode(59.8764, 30.32522)[:8]}]:
+            with_snapshot = self.get_list(params)
+            with override_settings(POINTS_SNAPSHOT_PATH=None):
+                self.assertEqual(with_snapshot, self.get_list(params), msg='for {}'.format(params))
+
+    def test_nearest_stale_snapshot(self):
+        # Точки, удалённые или скрытые после обновления снимка, не уменьшают выдачу nearest
+        params = {'nearest': '59.88,30.33', 'k': 3}
+        nearest = [point['id'] for point in self.get_list(params)]
+        Point.all_objects.filter(id=nearest[0]).delete()
+        Point.objects.filter(id=nearest[1]).update(unlisted=True)
+
+        with override_settings(POINTS_SNAPSHOT_NEAREST_EXTRA=0, POINTS_LIST_CACHE_SECONDS=0):
+            with_snapshot = self.get_list(params)
+            self.assertEqual(len(with_snapshot), 3)
+            with override_settings(POINTS_SNAPSHOT_PATH=None):
+                self.assertEqual(with_snapshot, self.get_list(params))
+
+    def test_refresh(self):
+        params = {'geo': '59.876,30.325,10000'}
+        ids = [point['id'] for point in self.get_list(params)]
+        self.assertEqual(len(ids), 5)
+
+        point = self.alice_client.post(self.point_create_path, data=self.point_data).json()
+        self.assertNotIn(point['id'], [p['id'] for p in self.get_list(params)])
+
+        self.refresh()
+        self.assertIn(point['id'], [p['id'] for p in self.get_list(params)])
+
+        # Изменение в обход API не сбрасывает кэш выдачи списка
+        Point.objects.filter(id=ids[0]).update(unlisted=True)
+        with override_settings(POINTS_LIST_CACHE_SECONDS=0):
+            self.assertNotIn(ids[0], [p['id'] for p in self.get_list(params)])
+        self.refresh()
+        self.assertNotIn(ids[0], snapshot.get_snapshot().ids)
+        Point.objects.filter(id=ids[0]).update(unlisted=False)
+        self.refresh()
+        self.assertIn(ids[0], [p['id'] for p in self.get_list(params)])
+
+        # Строка, удалённая из БД, убирается из снимка
+        Point.all_objects.filter(id=ids[1]).delete()
+        self.refresh()
+        self.assertNotIn(ids[1], snapshot.get_snapshot().ids)
+
+        response = self.alice_client.delete(self.point_detail_path.format(id=point['id']))
+        self.assertEqual(response.status_code, 204)
+        self.refresh()
+        self.assertNotIn(point['id'], snapshot.get_snapshot().ids)
+
+    def test_too_many_candidates(self):
+        point = self.alice_client.post(self.point_create_path, data=self.point_data).json()
+        with override_settings(POINTS_SNAPSHOT_MAX_IDS=1):
+            self.assertIn(point['id'], [p['id'] for p in self.get_list({'geo': '59.876,30.325,10000'})])
@@ -0,0 +1,75 @@
+from django.conf import settings
+from django.core.cache import cache
+from poim.points.models import Point
+from poim.utils import caches
+from poim_api.utils import mvt
+from poim_api.utils.generations import get_generations, bump_generations
+
+
+LAYER_NAME = 'points'
+
+# Поколения входят в ключи тайлов: смена общего поколения сбрасывает кэш всех тайлов,
+# поколения тайла — кэш одного тайла
+GENERATION_KEY = 'points:tile:generation'
+TILE_GENERATION_KEY = 'points:tile:generation:{}:{}:{}'
+
+
+def _bounds_lookups(z, x, y):
+    # Границы полуоткрытые, как в mvt.tile_for: точка на границе тайлов попадает ровно в один тайл,
+    # и invalidate_tiles сбрасывает именно его. Крайние тайлы включают полюса и долготу 180.
+    south, west, north, east = mvt.tile_bounds(z, x, y)
+    last = 2 ** z - 1
+    lookups = {'longitude__gte': west}
+    lookups['longitude__lte' if x == last else 'longitude__lt'] = east
+    if y != 0:
+        lookups['latitude__lte'] = north
+    if y != last:
+        lookups['latitude__gt'] = south
+    return lookups
+
+
+def render_tile(z, x, y):
+    'MVT-тайл видимых точек; с общим кэшем кэшируется до изменения точек тайла'
+    if not settings.POINTS_TILE_CACHE_SECONDS or not caches.is_shared():
+        return _render_tile(z, x, y)
+
+    # Поколения читаются до запроса к БД: тайл, построенный до изменения точек и записанный
+    # в кэш после сброса, остаётся под ключом прежнего поколения и не выдаётся
+    generations = get_generations([GENERATION_KEY, TILE_GENERATION_KEY.format(z, x, y)])
+    key = 'points:tile:{}:{}:{}:{}'.format('.'.join(str(generation) for generation in generations), z, x, y)
+    tile = cache.get(key)
+    if tile is None:
+        tile = _render_tile(z, x, y)
+        cache.set(key, tile, settings.POINTS_TILE_CACHE_SECONDS)
+    return tile
+
+
+def _render_tile(z, x, y):
+    queryset = Point.objects.filter(unlisted=False, **_bounds_lookups(z, x, y))
+    queryset = queryset.order_by('-id').values_list('id', 'title', 'latitude', 'longitude')
+
+    features = [
+        (id, *mvt.project(latitude, longitude, z, x, y), {'title': title})
+        for id, title, latitude, longitude in queryset[:settings.POINTS_TILE_MAX_FEATURES]
+    ]
+    return mvt.encode_layer(LAYER_NAME, features) if features else b''
+
+
+def invalidate_tiles(*points):
+    'Сброс кэша тайлов всех масштабов, содержащих точки (`Point` или пары координат)'
+    if len(points) > settings.POINTS_TILE_INVALIDATE_MAX_POINTS:
+        invalidate_all_tiles()
+        return
+
+    keys = set()
+    for point in points:
+        if isinstance(point, Point):
+            point = (point.latitude, point.longitude)
+        for z in range(settings.POINTS_TILE_MAX_ZOOM + 1):
+            keys.add(TILE_GENERATION_KEY.format(z, *mvt.tile_for(*point, z)))
+
+    bump_generations(sorted(keys))
+
+
+def invalidate_all_tiles():
+    bump_generations([GENERATION_KEY])
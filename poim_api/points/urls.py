@@ -5,6 +5,12 @@ from poim_api.points.views import *
 
 urlpatterns = [
     path('points', PointListView.as_view()),
+    path('points/export', PointExportView.as_view()),
+    path('points/import', PointImportView.as_view()),
+    path('points/changes', PointChangesView.as_view()),
+    path('points/batch', PointBatchView.as_view()),
+    path('points/clusters', PointClusterView.as_view()),
+    path('points/tiles/<int:z>/<int:x>/<int:y>.mvt', PointTileView.as_view()),
     path('points/<int:pk>', PointDetailView.as_view()),
     path('points/<int:pk>/deleted', PointUndeleteView.as_view()),
 ]
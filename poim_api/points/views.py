@@ -1,25 +1,107 @@
-from django.utils.timezone import now
+import io
+import logging
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models.expressions import RawSQL
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.translation import gettext_lazy as _
 from rest_framework import generics, status
+from rest_framework.fields import empty
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
 # from rest_framework.permissions import IsAuthenticated
-from poim.points.models import Point
-from poim_api.utils import exceptions
+from poim.points.models import Point, PointCluster
+from poim_api.utils import exceptions, mvt
+from poim_api.utils.conditional import ConditionalGetMixin, fingerprint
+from poim_api.utils.pagination import KeysetPagination, ChangesPagination
 from poim_api.utils.permissions import AnonRetrieveOwnerUpdate
+from poim_api.utils.renderers import JSONRenderer, NDJSONRenderer, GeoJSONRenderer, GPXRenderer
 from poim_api.points.serializers import *
-from poim_api.points.filters import PointFilter
+from poim_api.points.filters import PointFilter, PointClusterFilter
+from poim_api.points.tiles import render_tile
+from poim_api.points.caching import get_list_cache_key, get_cached_list, set_cached_list, invalidate_points
+from poim_api.points.imports import READERS, ImportFormatError, PointLoader
 
 
 __all__ = [
     'PointListView',
+    'PointExportView',
+    'PointChangesView',
+    'PointImportView',
     'PointDetailView',
     'PointUndeleteView',
+    'PointBatchView',
+    'PointClusterView',
+    'PointTileView',
 ]
 
+logger = logging.getLogger(__name__)
 
-class PointListView(generics.ListCreateAPIView):
+
+class PointFilterMixin:
+    '''
+    Выборка точек списка с фильтрами PointFilter
+    '''
+    queryset = Point.objects.filter(unlisted=False).order_by('-id')
+    serializer_class = PointSerializer
+    filter_class = PointFilter
+
+    def get_update_permission(self):
+        # Права на изменение точек вычисляются один раз на запрос, см. Point.update_permission
+        if not hasattr(self, '_update_permission'):
+            self._update_permission = Point.update_permission(self.request.user)
+        return self._update_permission
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        # Генератор схемы API создаёт сериализатор без запроса
+        if self.request is not None:
+            context['update_permission'] = self.get_update_permission()
+        return context
+
+    def get_nearest_count(self):
+        # k проверено формой фильтров (например, "5.0" — допустимое целое), как в PointFilter.filter_nearest
+        if not hasattr(self, '_nearest_count'):
+            form = self.filter_class(self.request.query_params, queryset=self.get_queryset()).form
+            self._nearest_count = None
+            if form.is_valid() and form.cleaned_data.get('nearest'):
+                self._nearest_count = form.cleaned_data.get('k') or settings.POINTS_NEAREST_DEFAULT_K
+        return self._nearest_count
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+
+        # k ближайших точек выдаются одной страницей: порядок обхода KNN-индекса
+        # не уникален при равных расстояниях, и курсор по нему не строится
+        k = self.get_nearest_count()
+        if k is not None:
+            queryset = queryset[:k]
+
+        return queryset
+
+
+class PointListView(ConditionalGetMixin, PointFilterMixin, generics.ListCreateAPIView):
     '''
     get:
     Список точек. Аутентификация опциональна.
 
+    Выдача постраничная: ссылка на следующую страницу передаётся в заголовке `Link` с `rel="next"`,
+    размер страницы задаётся параметром `page_size`. Точки отсортированы от новых к старым,
+    при фильтрации по `geo` — по удалённости от центра.
+
+    Выдача по области `bbox` ограничена сервером по общему числу точек во всех страницах.
+
+    При поиске `q` точки отсортированы по релевантности названия; `q` совмещается с остальными
+    фильтрами, например `q=кафе&geo=59.93,30.31,2000` — кафе в радиусе 2 км по удалённости.
+
+    При `nearest` выдаются `k` ближайших точек по возрастанию расстояния одной страницей.
+    Для `geo` и `nearest` у каждой точки есть поле `distance_m` — расстояние от центра в метрах.
+
+    Ответ содержит заголовки `ETag` и `Last-Modified`; при повторном запросе страницы
+    с `If-None-Match` (или `If-Modified-Since`) без изменений в ней выдаётся `304 Not Modified`.
+    Ответы кэшируются сервером до изменения точек в области запроса.
+
     post:
     Добавление точки. Аутентификация обязательна.
 
@@ -31,26 +113,323 @@ class PointListView(generics.ListCreateAPIView):
 
     `403 Forbidden` — у пользователя нет прав на создание объекта
     '''
-    queryset = Point.objects.filter(unlisted=False).order_by('-id')
-    serializer_class = PointSerializer
     permission_classes = [AnonRetrieveOwnerUpdate]
-    filter_class = PointFilter
+    pagination_class = KeysetPagination
+
+    def get_list_queryset(self):
+        # Фильтры применяются один раз на запрос: для валидаторов и для выдачи
+        if not hasattr(self, '_list_queryset'):
+            self._list_queryset = self.filter_queryset(self.get_queryset())
+        return self._list_queryset
+
+    def get(self, request, *args, **kwargs):
+        # Кэш хранит строки и валидаторы страницы без can_edit, см. poim_api.points.caching.
+        # Ключ с поколениями вычисляется до обращений к БД: запись, построенная во время
+        # изменения точек, сохраняется под прежним поколением и не будет выдана.
+        self.cache_key = get_list_cache_key(request)
+        self.cached = get_cached_list(self.cache_key)
+        self.cache_entry = {}
+
+        response = super().get(request, *args, **kwargs)
+
+        if self.cache_key and self.cached is None and 'rows' in self.cache_entry:
+            set_cached_list(self.cache_key, self.cache_entry)
+        return response
+
+    def get_validators(self):
+        if self.cached is not None:
+            digest, last_modified = self.cached['digest'], self.cached['last_modified']
+        else:
+            # Валидаторы по тем же строкам, что попадут в ответ: страница и признак следующей
+            queryset = self.get_list_queryset()
+            if self.get_nearest_count() is None:
+                queryset = self.paginator.get_page_queryset(queryset, self.request, view=self)
+
+            digest, last_modified = fingerprint(queryset, 'id', 'date_modified') if queryset is not None else ('', None)
+            self.cache_entry.update(digest=digest, last_modified=last_modified)
+
+        # От прав и id пользователя зависят значения can_edit
+        can_update_all, user_id = self.get_update_permission()
+        return 'W/"{}-{}"'.format(digest, 'all' if can_update_all else user_id or 0), last_modified
+
+    def list(self, request, *args, **kwargs):
+        # Выдача без экземпляров модели и полей сериализатора, см. PointValuesSerializer
+        serializer = PointValuesSerializer(context=self.get_serializer_context())
+
+        if self.cached is not None:
+            headers = {'Link': self.cached['link']} if self.cached['link'] else None
+            data = serializer.to_representation(self.cached['rows'], self.cached['with_distance'])
+            return Response(data, headers=headers)
+
+        rows = serializer.get_rows(self.get_list_queryset())
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            rows = page
+            response = self.get_paginated_response(serializer.to_representation(rows))
+        else:
+            rows = list(rows)
+            response = Response(serializer.to_representation(rows))
+
+        # Именованные кортежи values_list() не сериализуются pickle
+        self.cache_entry.update(
+            rows=[tuple(row) for row in rows],
+            with_distance=serializer.with_distance,
+            link=response.get('Link'),
+        )
+        return response
+
+    def get_max_results(self):
+        if self.request.query_params.get('bbox'):
+            return settings.POINTS_BBOX_MAX_RESULTS
+
+        return None
+
+    def paginate_queryset(self, queryset):
+        if self.get_nearest_count() is not None:
+            return None
+
+        return super().paginate_queryset(queryset)
 
     def perform_create(self, serializer):
         assert self.request.user.is_authenticated, 'User must be authenticated.'
 
         instance = serializer.save(user=self.request.user)
+        invalidate_points(instance)
 
 
-class PointDetailView(generics.RetrieveUpdateDestroyAPIView):
+class PointExportView(PointFilterMixin, generics.ListAPIView):
+    '''
+    get:
+    Выгрузка точек списка для синхронизации навигаторов. Аутентификация опциональна.
+
+    Форматы выбираются заголовком `Accept` или параметром `format`:
+
+    `ndjson` (`application/x-ndjson`) — по одному JSON-объекту точки на строку, по умолчанию
+
+    `geojson` (`application/geo+json`) — GeoJSON FeatureCollection
+
+    `gpx` (`application/gpx+xml`) — путевые точки GPX 1.1
+
+    Принимает те же фильтры, что и список точек, порядок точек тот же; выдача не постраничная
+    и не ограничивается по `bbox`. Ответ передаётся потоком по мере чтения из БД.
+
+    Коды ответов HTTP:
+
+    `200 OK` — успешное выполнение запроса
+
+    `400 Bad Request` — ошибки параметров
+
+    `404 Not Found` — неизвестный формат
+    '''
+    renderer_classes = [NDJSONRenderer, GeoJSONRenderer, GPXRenderer]
+
+    def perform_content_negotiation(self, request, force=False):
+        # Параметр format важнее заголовка Accept; при неподходящем Accept выгрузка идёт в первом формате
+        format = request.query_params.get(api_settings.URL_FORMAT_OVERRIDE)
+        if not format:
+            return super().perform_content_negotiation(request, force=True)
+
+        for renderer in self.get_renderers():
+            if renderer.format == format:
+                return renderer, renderer.media_type
+        raise exceptions.NotFound()
+
+    def handle_exception(self, exc):
+        # Ошибки выдаются в JSON, а не в формате выгрузки
+        self.request.accepted_renderer = JSONRenderer()
+        self.request.accepted_media_type = JSONRenderer.media_type
+        return super().handle_exception(exc)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(self.stream(queryset, renderer), content_type=renderer.media_type)
+        response['Content-Disposition'] = 'attachment; filename="points.{}"'.format(renderer.format)
+        return response
+
+    def iter_data(self, queryset):
+        # iterator() читает строки серверным курсором порциями и не кэширует их,
+        # поэтому расход памяти не зависит от числа точек
+        serializer = PointValuesSerializer(context=self.get_serializer_context())
+        rows = serializer.get_rows(queryset)
+        yield from map(serializer.get_converter(), rows.iterator(chunk_size=settings.POINTS_EXPORT_CHUNK_SIZE))
+
+    def stream(self, queryset, renderer):
+        # Части ответа отдаются порциями того же размера, что и чтение из БД
+        chunk_size = settings.POINTS_EXPORT_CHUNK_SIZE
+        parts = []
+        for part in renderer.stream(self.iter_data(queryset), self.get_renderer_context()):
+            parts.append(part)
+            if len(parts) >= chunk_size:
+                yield ''.join(parts)
+                parts = []
+
+        if parts:
+            yield ''.join(parts)
+
+
+class PointChangesView(generics.ListAPIView):
+    '''
+    get:
+    Изменения точек для синхронизации копии списка у клиента. Аутентификация опциональна.
+
+    Выдаются добавленные, изменённые, удалённые и восстановленные точки в порядке фиксации
+    изменений, каждая точка один раз в последнем состоянии. Видимая точка выдаётся с полями,
+    как в списке точек, и `deleted: false`; удалённая или скрытая — только `id` и `deleted: true`.
+
+    Выдача постраничная, размер страницы задаётся параметром `page_size`. Ссылка на продолжение
+    передаётся в заголовке `Link` с `rel="next"` в каждом ответе; курсор в параметре `since`.
+    Пустой список означает, что изменений после курсора нет, по той же ссылке новые изменения
+    запрашиваются позже. Без `since` выдаются все точки, включая удалённые.
+
+    Коды ответов HTTP:
+
+    `200 OK` — успешное выполнение запроса
+
+    `404 Not Found` — неверный курсор
+    '''
+    queryset = Point.all_objects.order_by('change_txid', 'id')
+    serializer_class = PointSerializer
+    pagination_class = ChangesPagination
+    filter_backends = []
+
+    def get_queryset(self):
+        # Только изменения завершённых транзакций: транзакции с номером от xmin снимка могут
+        # зафиксироваться позже изменений с большими номерами, уже выданных клиенту,
+        # и курсор пропустил бы их строки
+        return super().get_queryset().filter(
+            change_txid__lt=RawSQL('txid_snapshot_xmin(txid_current_snapshot())', []))
+
+    def list(self, request, *args, **kwargs):
+        serializer = PointChangeValuesSerializer(context=self.get_serializer_context())
+        rows = self.paginate_queryset(serializer.get_rows(self.get_queryset()))
+        return self.get_paginated_response(serializer.to_representation(rows))
+
+
+class PointImportView(generics.GenericAPIView):
+    '''
+    post:
+    Массовая загрузка точек. Аутентификация обязательна.
+
+    Формат тела запроса задаётся заголовком `Content-Type`:
+
+    `text/csv` — CSV в UTF-8 с заголовком `title,latitude,longitude,unlisted`
+
+    `application/x-ndjson` — по одному JSON-объекту точки на строку
+
+    `application/gpx+xml` — путевые точки GPX, название из `name`
+
+    Поля и правила проверки те же, что при добавлении точки; `unlisted` необязательно, по умолчанию `false`.
+    Загрузка выполняется целиком в одной транзакции: при ошибках не загружается ни одна точка,
+    в ответе — список записей с ошибками `{"row": номер записи, "errors": {поле: [ошибки]}}`.
+    Число записей и выдаваемых ошибок ограничено сервером.
+
+    Коды ответов HTTP:
+
+    `201 Created` — точки загружены, в ответе их количество `created`
+
+    `400 Bad Request` — ошибки в записях или в формате файла
+
+    `403 Forbidden` — у пользователя нет прав на создание объектов
+
+    `415 Unsupported Media Type` — неподдерживаемый формат
+    '''
+    queryset = Point.objects.all()
+    serializer_class = PointSerializer
+    permission_classes = [AnonRetrieveOwnerUpdate]
+    import_fields = ['title', 'latitude', 'longitude', 'unlisted']
+    import_defaults = {'unlisted': False}
+
+    def post(self, request, *args, **kwargs):
+        reader = READERS.get(request.content_type.partition(';')[0].strip())
+        if reader is None:
+            raise exceptions.UnsupportedMediaType(request.content_type)
+
+        try:
+            with transaction.atomic():
+                locations, errors = self.import_rows(reader(request.stream or io.BytesIO()))
+                if errors:
+                    transaction.set_rollback(True)
+        except ImportFormatError as e:
+            raise exceptions.ValidationError({'non_field_errors': [str(e)]})
+
+        if errors:
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        invalidate_points(*locations)
+        return Response({'created': len(locations)}, status=status.HTTP_201_CREATED)
+
+    def import_rows(self, rows):
+        '''
+        Проверка записей полями PointSerializer и загрузка пакетами через PointLoader.
+        После первой ошибки записи только проверяются. Возвращает координаты
+        добавленных точек и ошибки записей.
+        '''
+        fields = self.get_serializer().fields
+        fields = {name: fields[name] for name in self.import_fields}
+        loader = PointLoader(self.request.user)
+        batch, locations, errors = [], [], []
+
+        for number, row in enumerate(rows, 1):
+            if number > settings.POINTS_IMPORT_MAX_ROWS:
+                errors.append({'row': number, 'errors': {'non_field_errors': [
+                    _('Превышено максимальное число записей: {}.').format(settings.POINTS_IMPORT_MAX_ROWS)]}})
+                break
+
+            values, row_errors = self.validate_row(row, fields)
+            if row_errors:
+                errors.append({'row': number, 'errors': row_errors})
+                if len(errors) >= settings.POINTS_IMPORT_MAX_ERRORS:
+                    break
+                continue
+
+            if errors:
+                continue
+
+            batch.append(values)
+            locations.append((values['latitude'], values['longitude']))
+            if len(batch) >= settings.POINTS_IMPORT_BATCH_SIZE:
+                loader.copy(batch)
+                batch = []
+
+        if not errors:
+            loader.copy(batch)
+            loader.insert()
+
+        return locations, errors
+
+    def validate_row(self, row, fields):
+        if row is None:
+            return None, {'non_field_errors': [_('Неверный формат записи.')]}
+
+        values, errors = {}, {}
+        for name, field in fields.items():
+            value = row.get(name, empty)
+            if value is empty and name in self.import_defaults:
+                values[name] = self.import_defaults[name]
+                continue
+
+            try:
+                values[name] = field.run_validation(value)
+            except exceptions.ValidationError as e:
+                errors[name] = e.detail
+
+        return values, errors
+
+
+class PointDetailView(ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView):
     '''
     get:
     Получение точки. Аутентификация опциональна.
 
+    Ответ содержит заголовки `ETag` и `Last-Modified` для условных запросов.
+
     Коды ответов HTTP:
 
     `200 OK` — успешное выполнение запроса
 
+    `304 Not Modified` — точка не изменилась с указанных в `If-None-Match` или `If-Modified-Since` версии или времени
+
     `404 Not Found` — объект не сущесвует или удалён
 
     put:
@@ -88,9 +467,26 @@ class PointDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = PointSerializer
     permission_classes = [AnonRetrieveOwnerUpdate]
 
+    def get_object(self):
+        # Точка выбирается один раз на запрос: для валидаторов и для ответа
+        if not hasattr(self, '_object'):
+            self._object = super().get_object()
+        return self._object
+
+    def get_validators(self):
+        instance = self.get_object()
+        modified = int(instance.date_modified.timestamp() * 1000000)
+        etag = '"{}-{}-{:d}"'.format(instance.id, modified, instance.can_update(self.request.user))
+        return etag, instance.date_modified
+
+    def perform_update(self, serializer):
+        old_location = (serializer.instance.latitude, serializer.instance.longitude)
+        instance = serializer.save()
+        invalidate_points(old_location, instance)
+
     def perform_destroy(self, instance):
-        instance.date_deleted = now()
-        instance.save(update_fields=['date_deleted'])
+        instance.soft_delete()
+        invalidate_points(instance)
 
 
 class PointUndeleteView(generics.DestroyAPIView):
@@ -112,5 +508,171 @@ class PointUndeleteView(generics.DestroyAPIView):
         if not instance.date_deleted:
             raise exceptions.NotFound()
 
-        instance.date_deleted = None
-        instance.save(update_fields=['date_deleted'])
+        instance.undelete()
+        invalidate_points(instance)
+
+
+class PointBatchView(generics.GenericAPIView):
+    '''
+    post:
+    Пакет операций над точками в одной транзакции. Аутентификация обязательна.
+
+    Операция — объект `{"op": операция, "id": id точки, "data": поля точки}`:
+
+    `create` — добавление точки, как POST [/points](#points-create); `id` не указывается
+
+    `update`, `partial_update` — обновление точки, как PUT и PATCH [/points/{id}](#points-update)
+
+    `destroy` — удаление точки, как DELETE [/points/{id}](#points-delete)
+
+    `undelete` — отмена удаления, как DELETE [/points/{id}/deleted](#points-deleted-delete)
+
+    Операции выполняются по порядку. Права проверяются для каждой операции так же,
+    как в соответствующем запросе; ошибка операции, в том числе ошибка БД, отменяет
+    только её изменения. В ответе `results` — по результату на операцию:
+    `{"status": код HTTP, "data": точка}` при успехе или `{"status": код HTTP, "errors": ошибки}`
+    при ошибке: 409 — нарушение ограничений БД, 500 — другая ошибка БД.
+
+    Коды ответов HTTP:
+
+    `200 OK` — пакет выполнен, результаты операций в `results`
+
+    `400 Bad Request` — ошибки в описании операций, ни одна операция не выполнена
+    '''
+    queryset = Point.all_objects.all()
+    serializer_class = PointBatchSerializer
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        operations = serializer.validated_data['operations']
+
+        self.locations = []
+        with transaction.atomic():
+            # Точки всех операций — одним запросом, с блокировкой до конца транзакции
+            ids = {operation['id'] for operation in operations if 'id' in operation}
+            instances = self.get_queryset().select_for_update().order_by('id').in_bulk(ids) if ids else {}
+            results = [self.apply(operation, instances) for operation in operations]
+
+        invalidate_points(*self.locations)
+        return Response({'results': results})
+
+    def apply(self, operation, instances):
+        handler = getattr(self, 'batch_{}'.format(operation['op']))
+        locations = len(self.locations)
+        try:
+            # Точка сохранения: ошибка БД откатывает только изменения этой операции
+            with transaction.atomic():
+                return handler(operation, instances)
+        except exceptions.APIException as e:
+            error = e
+        except DatabaseError as e:
+            if isinstance(e, IntegrityError):
+                error = exceptions.Conflict()
+            else:
+                logger.exception('Batch operation %s failed', operation['op'])
+                error = exceptions.InternalServerError()
+            # Поля точки в памяти изменены до отката: следующие операции получат её из БД
+            if operation.get('id') in instances:
+                instances[operation['id']].refresh_from_db()
+
+        # Ячейки кэша сбрасываются только для выполненных операций
+        del self.locations[locations:]
+        errors = error.detail if isinstance(error.detail, (list, dict)) else {'detail': error.detail}
+        return {'status': error.status_code, 'errors': errors}
+
+    def get_instance(self, operation, instances, deleted=False):
+        instance = instances.get(operation['id'])
+        if instance is None or (instance.date_deleted is not None) != deleted:
+            raise exceptions.NotFound()
+
+        if not instance.can_update(self.request.user):
+            raise exceptions.PermissionDenied()
+
+        return instance
+
+    def batch_create(self, operation, instances):
+        if not Point.can_create(self.request.user):
+            raise exceptions.PermissionDenied()
+
+        serializer = PointSerializer(data=operation['data'], context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        instance = serializer.save(user=self.request.user)
+        self.locations.append(instance)
+        return {'status': status.HTTP_201_CREATED, 'data': serializer.data}
+
+    def batch_update(self, operation, instances, partial=False):
+        instance = self.get_instance(operation, instances)
+        old_location = (instance.latitude, instance.longitude)
+
+        serializer = PointSerializer(
+            instance, data=operation['data'], partial=partial, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        self.locations += [old_location, instance]
+        return {'status': status.HTTP_200_OK, 'data': serializer.data}
+
+    def batch_partial_update(self, operation, instances):
+        return self.batch_update(operation, instances, partial=True)
+
+    def batch_destroy(self, operation, instances):
+        instance = self.get_instance(operation, instances)
+        instance.soft_delete()
+        self.locations.append(instance)
+        return {'status': status.HTTP_204_NO_CONTENT}
+
+    def batch_undelete(self, operation, instances):
+        instance = self.get_instance(operation, instances, deleted=True)
+        instance.undelete()
+        self.locations.append(instance)
+        return {'status': status.HTTP_204_NO_CONTENT}
+
+
+class PointClusterView(generics.ListAPIView):
+    '''
+    get:
+    Кластеры точек для отображения карты на мелких масштабах. Аутентификация опциональна.
+
+    Видимые точки списка сгруппированы по ячейкам сетки: 8×8 ячеек на тайл масштаба `zoom`.
+    Для каждой непустой ячейки выдаются количество точек, их средние координаты
+    и `sample_id` — одна из точек ячейки. Агрегаты рассчитываются заранее, поэтому
+    время ответа не зависит от количества точек в области; для масштабов от 0 до 2 они
+    собираются из ячеек масштаба 3.
+
+    Коды ответов HTTP:
+
+    `200 OK` — успешное выполнение запроса
+
+    `400 Bad Request` — ошибки параметров, в том числе слишком большая для масштаба область
+    '''
+    queryset = PointCluster.objects.filter(count__gt=0).order_by('cell_y', 'cell_x')
+    serializer_class = PointClusterSerializer
+    filter_class = PointClusterFilter
+
+
+class PointTileView(generics.GenericAPIView):
+    '''
+    get:
+    Векторный тайл видимых точек в формате Mapbox Vector Tile. Аутентификация опциональна.
+
+    Тайлы в схеме XYZ (Web Mercator), максимальный масштаб `z` ограничен сервером. Слой `points`,
+    у точек есть `id` и атрибут `title`. Число точек в тайле ограничено сервером, выдаются новейшие;
+    для мелких масштабов предназначены [кластеры](#points-clusters-list).
+    Пустой тайл выдаётся с пустым телом.
+
+    Тайлы кэшируются на сервере, кэш сбрасывается при изменении точек тайла.
+
+    Коды ответов HTTP:
+
+    `200 OK` — успешное выполнение запроса
+
+    `404 Not Found` — тайл не существует
+    '''
+    queryset = Point.objects.none()
+
+    def get(self, request, z, x, y):
+        if z > settings.POINTS_TILE_MAX_ZOOM or x >= 2 ** z or y >= 2 ** z:
+            raise exceptions.NotFound()
+
+        return HttpResponse(render_tile(z, x, y), content_type=mvt.CONTENT_TYPE)
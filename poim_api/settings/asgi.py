@@ -0,0 +1,9 @@
+from poim_api.settings import *
+
+
+# Потоки пулов ASGI-приложения живут всё время работы процесса: соединение с БД
+# на каждый запрос не открывается
+DATABASES = {
+    alias: dict(database, CONN_MAX_AGE=ASGI_CONN_MAX_AGE)
+    for alias, database in DATABASES.items()
+}
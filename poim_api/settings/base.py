@@ -7,12 +7,20 @@ ROOT_URLCONF = 'poim_api.urls'
 
 WSGI_APPLICATION = 'poim_api.wsgi.application'
 
+# Пулы потоков ASGI-приложения poim_api.asgi для чтения (GET, HEAD, OPTIONS) и изменения
+ASGI_READ_THREADS = 32
+ASGI_WRITE_THREADS = 8
+# Время жизни соединений с БД потоков пулов ASGI, в секундах (CONN_MAX_AGE в poim_api.settings.asgi)
+ASGI_CONN_MAX_AGE = 300
+
 
 MIDDLEWARE = [
+    'poim_api.utils.middleware.TimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     # 'django.middleware.locale.LocaleMiddleware',
+    'poim_api.utils.middleware.ReplicaMiddleware',
 ]
 
 
@@ -25,28 +33,82 @@ DEFAULT_API_VERSION = (1, 0)
 
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
-        'poim_api.utils.renderers.JSONRenderer',
+        'poim_api.utils.renderers.FastJSONRenderer',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'poim_api.auth.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_METADATA_CLASS': 'poim_api.utils.metadata.EmptyMetadata',
     'DEFAULT_FILTER_BACKENDS': [
-        'django_filters.rest_framework.DjangoFilterBackend',
+        'poim_api.utils.filters.DjangoFilterBackend',
     ],
 }
 
+# Замеры времени обработки запросов (см. poim_api.utils.timing): доля запросов с заголовком
+# Server-Timing и записью в журнал (0 — замеры отключены, 1 — все запросы, в работе — например 0.01)
+# и интервал сводки по представлениям в журнале, в запросах с замерами (0 — не выводится)
+REQUEST_TIMING_SAMPLE_RATE = 0
+REQUEST_TIMING_STATS_INTERVAL = 1000
+
+# Интервал сводки обращений к кэшу токенов в журнале, в обращениях (0 — не выводится)
+AUTH_TOKEN_CACHE_STATS_INTERVAL = 10000
+
+# Максимальное число точек, выдаваемых по области карты (bbox) во всех страницах
+POINTS_BBOX_MAX_RESULTS = 2000
+
+# Количество ближайших точек (nearest) по умолчанию и максимальное
+POINTS_NEAREST_DEFAULT_K = 20
+POINTS_NEAREST_MAX_K = 1000
+
+# Максимальное число ячеек сетки в запросе кластеров точек
+POINTS_CLUSTER_MAX_CELLS = 10000
+
+# Число строк, читаемых за раз серверным курсором при выгрузке точек
+POINTS_EXPORT_CHUNK_SIZE = 2000
+
+# Массовая загрузка точек: максимальное число записей, число выдаваемых ошибок, размер пакета вставки
+POINTS_IMPORT_MAX_ROWS = 100000
+POINTS_IMPORT_MAX_ERRORS = 100
+POINTS_IMPORT_BATCH_SIZE = 1000
+
+# Кэш выдачи списка точек (см. poim_api.points.caching). Время жизни записей: 0 — кэш
+# не используется; используется только с общим кэшем, см. SHARED_CACHE. Размер ячейки сетки
+# поколений в градусах. Максимальное число ячеек в области запроса. Максимальное число ячеек
+# в изменении точек, при большем сбрасывается весь кэш списка.
+POINTS_LIST_CACHE_SECONDS = CACHE_MIDDLEWARE_SECONDS
+POINTS_LIST_CACHE_REGION_DEGREES = 1
+POINTS_LIST_CACHE_MAX_REGIONS = 16
+POINTS_LIST_CACHE_INVALIDATE_MAX_REGIONS = 100
+
+# Максимальное число операций в пакетном запросе /points/batch
+POINTS_BATCH_MAX_OPERATIONS = 100
+
+# Векторные тайлы точек: максимальный масштаб, число точек в тайле и время жизни в кэше
+# (0 — кэш не используется; используется только с общим кэшем, см. SHARED_CACHE)
+POINTS_TILE_MAX_ZOOM = 18
+POINTS_TILE_MAX_FEATURES = 5000
+POINTS_TILE_CACHE_SECONDS = 86400
+# При изменении большего числа точек сбрасывается кэш всех тайлов
+POINTS_TILE_INVALIDATE_MAX_POINTS = 100
+
+
 CORS_ALLOW_HEADERS = [
     'accept',
     'accept-encoding',
     'authorization',
     'content-type',
     'dnt',
+    'if-modified-since',
+    'if-none-match',
     'origin',
     'user-agent',
 ]
 
-CORS_EXPOSE_HEADERS = []
+CORS_EXPOSE_HEADERS = [
+    'etag',
+    'link',
+    'server-timing',
+]
 
 CORS_PREFLIGHT_MAX_AGE = 86400
 
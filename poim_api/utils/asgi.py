@@ -0,0 +1,152 @@
+'''
+ASGI-приложение (спецификация ASGI 3) поверх WSGI-обработчика Django.
+
+Django 2.0 не поддерживает ASGI и асинхронные представления, поэтому запросы выполняются
+синхронными представлениями в пулах потоков, а цикл событий сервера только принимает
+соединения, читает тело запроса и передаёт ответ. Долгий запрос к БД занимает поток пула,
+а не процесс: соединения остальных клиентов, в том числе простаивающие keep-alive, продолжают
+обслуживаться.
+
+Чтение (GET, HEAD, OPTIONS) и изменение выполняются в отдельных пулах размером
+ASGI_READ_THREADS и ASGI_WRITE_THREADS: медленная загрузка точек не занимает потоки выдачи
+списка. У каждого потока своё соединение с БД, число соединений процесса — до суммы пулов;
+время жизни соединений задаётся в настройках poim_api.settings.asgi.
+'''
+import asyncio
+import io
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+
+
+READ_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+
+
+class RequestAborted(Exception):
+    pass
+
+
+class ASGIHandler:
+    def __init__(self):
+        self.wsgi_handler = WSGIHandler()
+        self.read_executor = ThreadPoolExecutor(settings.ASGI_READ_THREADS)
+        self.write_executor = ThreadPoolExecutor(settings.ASGI_WRITE_THREADS)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+
+        if scope['type'] != 'http':
+            raise ValueError('Unsupported ASGI scope type: {}'.format(scope['type']))
+
+        try:
+            body = await self.read_body(receive)
+        except RequestAborted:
+            return
+
+        executor = self.read_executor if scope['method'] in READ_METHODS else self.write_executor
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(executor, self.handle, scope, body, send, loop)
+        except RequestAborted:
+            pass
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.read_executor.shutdown(wait=False)
+                self.write_executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def read_body(self, receive):
+        # Большие тела (массовая загрузка точек) записываются во временный файл
+        body = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                raise RequestAborted()
+
+            body.write(message.get('body', b''))
+            if not message.get('more_body', False):
+                body.seek(0)
+                return body
+
+    def get_environ(self, scope, body):
+        server_name, server_port = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', ''),
+            # Путь WSGI — байты URL в latin-1
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server_name,
+            'SERVER_PORT': str(server_port),
+            'SERVER_PROTOCOL': 'HTTP/{}'.format(scope.get('http_version', '1.1')),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        if scope.get('client'):
+            environ['REMOTE_ADDR'] = scope['client'][0]
+
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                name = 'HTTP_' + name
+            environ[name] = environ[name] + ',' + value if name in environ else value
+
+        # Django читает тело по CONTENT_LENGTH; у тела, переданного частями (chunked), заголовка нет
+        if 'CONTENT_LENGTH' not in environ:
+            body.seek(0, io.SEEK_END)
+            environ['CONTENT_LENGTH'] = str(body.tell())
+            body.seek(0)
+
+        return environ
+
+    def handle(self, scope, body, send, loop):
+        'Выполнение запроса в потоке пула; сообщения ответа передаются в цикл событий с ожиданием отправки'
+        def send_message(message):
+            try:
+                asyncio.run_coroutine_threadsafe(send(message), loop).result()
+            except Exception as e:
+                # Клиент отключился: выгрузка прекращается
+                raise RequestAborted() from e
+
+        start = {}
+
+        def start_response(status, headers, exc_info=None):
+            start['message'] = {
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+            }
+
+        response = self.wsgi_handler(self.get_environ(scope, body), start_response)
+        try:
+            # Выгрузка точек передаётся по частям по мере чтения из БД
+            for chunk in response:
+                if 'message' in start:
+                    send_message(start.pop('message'))
+                if chunk:
+                    send_message({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+
+            if 'message' in start:
+                send_message(start.pop('message'))
+            send_message({'type': 'http.response.body', 'body': b''})
+        finally:
+            # Закрытие ответа отправляет request_finished: устаревшее соединение с БД потока закрывается здесь же
+            response.close()
+            body.close()
@@ -0,0 +1,55 @@
+'''
+Условные GET-запросы (RFC 7232): валидаторы ETag и Last-Modified и ответ `304 Not Modified`
+без выборки и сериализации данных.
+'''
+from django.db import connections
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+
+class ConditionalGetMixin:
+    '''
+    Mixin к представлению: get() сравнивает валидаторы из get_validators() с заголовками
+    If-None-Match и If-Modified-Since запроса и при совпадении отвечает 304 без вызова
+    основного обработчика. Успешные ответы получают заголовки ETag и Last-Modified.
+
+    Last-Modified точен до секунды, поэтому изменения в пределах секунды различает только ETag.
+    '''
+    # Ответ зависит от пользователя (поле can_edit), пользователь определяется по токену
+    vary_headers = ['Authorization']
+
+    def get_validators(self):
+        'Пара (etag, last_modified): ETag в кавычках, с префиксом W/ для слабого, и datetime или None'
+        raise NotImplementedError('{} must implement .get_validators()'.format(type(self).__name__))
+
+    def get(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validators()
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+
+        if response.status_code in (200, 304):
+            if etag:
+                response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+            patch_vary_headers(response, self.vary_headers)
+
+        return response
+
+
+def fingerprint(queryset, key_field, modified_field):
+    '''
+    Хэш пар (ключ, время изменения) всех строк queryset и наибольшее время изменения —
+    одним агрегирующим запросом, без передачи строк. Хэш меняется при изменении, появлении
+    и исчезновении строк; порядок строк не учитывается.
+    '''
+    sql, params = queryset.values_list(key_field, modified_field).query.sql_with_params()
+    sql = 'SELECT md5(coalesce(string_agg(t.{key} || \':\' || t.{modified}, \',\' ORDER BY t.{key}), \'\')), ' \
+        'max(t.{modified}) FROM ({query}) t'.format(key=key_field, modified=modified_field, query=sql)
+
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchone()
@@ -1,10 +1,35 @@
 from django import forms
 from django_filters import rest_framework as filters
+from django_filters.fields import BaseCSVField
+from poim_api.utils.timing import timed
+
+
+class DjangoFilterBackend(filters.DjangoFilterBackend):
+    'Время фильтрации входит в замеры запроса, см. poim_api.utils.timing'
+
+    @timed('filter')
+    def filter_queryset(self, request, queryset, view):
+        return super().filter_queryset(request, queryset, view)
+
+
+class IntegerFilter(filters.NumberFilter):
+    field_class = forms.IntegerField
+
+
+class CSVField(BaseCSVField):
+    'BaseCSVField пропускает отсутствующее значение без проверки required'
+
+    def clean(self, value):
+        if value is None and self.required:
+            raise forms.ValidationError(self.error_messages['required'], code='required')
+        return super().clean(value)
 
 
 class IntegerCSVFilter(filters.BaseCSVFilter):
+    base_field_class = CSVField
     field_class = forms.IntegerField
 
 
 class DecimalCSVFilter(filters.BaseCSVFilter):
+    base_field_class = CSVField
     field_class = forms.DecimalField
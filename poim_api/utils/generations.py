@@ -0,0 +1,35 @@
+'''
+Счётчики поколений в кэше Django для сброса групп записей: поколение входит в ключи записей,
+и его увеличение делает недоступными все записи группы разом, в том числе в общем кэше
+нескольких процессов. Записи прежних поколений вытесняются кэшем по времени жизни.
+'''
+import time
+from django.core.cache import cache
+
+
+def _initial():
+    # Время в миллисекундах в качестве начального значения не повторяет поколения,
+    # вытесненные из кэша, пока счётчик увеличивается реже тысячи раз в секунду
+    return int(time.time() * 1000)
+
+
+def get_generations(keys):
+    'Значения счётчиков в порядке keys; отсутствующие в кэше создаются'
+    values = cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        initial = _initial()
+        for key in missing:
+            cache.add(key, initial, None)
+        values.update(cache.get_many(missing))
+        return [values.get(key, initial) for key in keys]
+
+    return [values[key] for key in keys]
+
+
+def bump_generations(keys):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _initial(), None)
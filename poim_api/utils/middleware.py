@@ -0,0 +1,102 @@
+import logging
+import random
+from django.conf import settings
+from django.db import InterfaceError, OperationalError
+from rest_framework.authentication import get_authorization_header
+from rest_framework.permissions import SAFE_METHODS
+from poim.utils import replicas
+from poim_api.utils import timing
+
+
+logger = logging.getLogger(__name__)
+timing_logger = logging.getLogger('poim_api.timing')
+
+
+class TimingMiddleware:
+    '''
+    Замеры времени обработки доли REQUEST_TIMING_SAMPLE_RATE запросов (см. poim_api.utils.timing):
+    заголовок Server-Timing, запись в журнал poim_api.timing с полями замеров в атрибуте timing
+    и сводка по представлениям.
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = settings.REQUEST_TIMING_SAMPLE_RATE
+        if not rate or random.random() >= rate:
+            return self.get_response(request)
+
+        with timing.measure() as timings:
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        view = match.func.__name__ if match else None
+        response['Server-Timing'] = timings.header()
+        timing.stats.record(view, timings)
+
+        fields = timings.as_dict()
+        fields.update(method=request.method, path=request.path, view=view, status=response.status_code)
+        timing_logger.info('%s %s %s %d %s', request.method, request.path, view, response.status_code,
+            ' '.join('{}={}'.format(name, round(value, 1)) for name, value in timings.as_dict().items()),
+            extra={'timing': fields})
+        return response
+
+
+class ReplicaMiddleware:
+    '''
+    Чтение с реплик БД (см. poim.utils.replicas) в запросах безопасными методами. Клиент,
+    выполнивший запрос другим методом, закрепляется за основной БД по токену.
+    '''
+    keyword = b'token'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        token = self.get_token(request)
+        if request.method not in SAFE_METHODS:
+            response = self.get_response(request)
+            # Закрепление до отправки ответа: следующий запрос клиента его уже застанет
+            if token:
+                replicas.pin(token)
+            return response
+
+        alias = None if token and replicas.is_pinned(token) else replicas.choose_replica()
+        if alias is None:
+            return self.get_response(request)
+
+        with replicas.reading_from(alias):
+            response = self.get_response(request)
+
+        if response.streaming:
+            # Выгрузка точек читается из БД при передаче ответа, после выхода из блока
+            response.streaming_content = self.stream(alias, response.streaming_content)
+        return response
+
+    def process_exception(self, request, exception):
+        alias = replicas.get_read_alias()
+        if alias is None or not isinstance(exception, (OperationalError, InterfaceError)):
+            return None
+
+        # Реплика стала недоступна во время запроса: безопасный запрос повторяется в основной БД
+        logger.warning('Replica %s failed, retrying on the primary', alias, exc_info=exception)
+        replicas.mark_unavailable(alias)
+        with replicas.reading_from(None):
+            return self.get_response(request)
+
+    def get_token(self, request):
+        auth = get_authorization_header(request).split()
+        if len(auth) != 2 or auth[0].lower() != self.keyword:
+            return None
+        try:
+            return auth[1].decode()
+        except UnicodeError:
+            return None
+
+    def stream(self, alias, content):
+        with replicas.reading_from(alias):
+            yield from content
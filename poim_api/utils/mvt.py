@@ -0,0 +1,128 @@
+'''
+Кодирование векторных тайлов Mapbox Vector Tile 2.1 (protobuf) без внешних зависимостей.
+
+Поддерживается только геометрия типа POINT, координаты задаются в системе тайла
+(0..extent, ось y направлена вниз), см. `project()`.
+'''
+import math
+import struct
+
+
+CONTENT_TYPE = 'application/vnd.mapbox-vector-tile'
+
+DEFAULT_EXTENT = 4096
+
+# Ограничение широты в проекции Web Mercator
+MAX_LATITUDE = 85.0511287798
+
+_VARINT = 0
+_FIXED64 = 1
+_BYTES = 2
+
+_GEOM_POINT = 1
+_CMD_MOVE_TO = 1
+
+
+def _varint(value):
+    result = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            result.append(byte | 0x80)
+        else:
+            result.append(byte)
+            return bytes(result)
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _tag(field, wire_type):
+    return _varint(field << 3 | wire_type)
+
+
+def _bytes_field(field, data):
+    return _tag(field, _BYTES) + _varint(len(data)) + data
+
+
+def _packed_field(field, values):
+    return _bytes_field(field, b''.join(_varint(v) for v in values))
+
+
+def _encode_value(value):
+    if isinstance(value, str):
+        return _bytes_field(1, value.encode('utf-8'))
+    if isinstance(value, bool):
+        return _tag(7, _VARINT) + _varint(int(value))
+    if isinstance(value, int):
+        if value >= 0:
+            return _tag(5, _VARINT) + _varint(value)
+        return _tag(6, _VARINT) + _varint(_zigzag(value))
+    if isinstance(value, float):
+        return _tag(3, _FIXED64) + struct.pack('<d', value)
+    raise TypeError('Unsupported MVT value type: {}'.format(type(value).__name__))
+
+
+def tile_bounds(z, x, y):
+    'Границы тайла (south, west, north, east) в градусах'
+    n = 2 ** z
+
+    def latitude(tile_y):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * tile_y / n))))
+
+    return latitude(y + 1), x / n * 360 - 180, latitude(y), (x + 1) / n * 360 - 180
+
+
+def tile_for(latitude, longitude, z):
+    'Тайл (x, y) масштаба z, содержащий точку'
+    n = 2 ** z
+    x, y = _mercator(latitude, longitude)
+    return min(int(x * n), n - 1), min(int(y * n), n - 1)
+
+
+def project(latitude, longitude, z, x, y, extent=DEFAULT_EXTENT):
+    'Координаты точки в системе тайла (z, x, y)'
+    n = 2 ** z
+    mx, my = _mercator(latitude, longitude)
+    return int(round((mx * n - x) * extent)), int(round((my * n - y) * extent))
+
+
+def _mercator(latitude, longitude):
+    # Доли мира от 0 до 1 по x (с запада) и по y (с севера)
+    latitude = math.radians(max(min(latitude, MAX_LATITUDE), -MAX_LATITUDE))
+    return (longitude + 180) / 360, (1 - math.log(math.tan(latitude) + 1 / math.cos(latitude)) / math.pi) / 2
+
+
+def encode_layer(name, features, extent=DEFAULT_EXTENT):
+    '''
+    Слой тайла. `features` — последовательность `(id, x, y, properties)`, где x и y —
+    координаты в системе тайла, properties — словарь атрибутов.
+    '''
+    keys, values = {}, {}
+    encoded_features = []
+
+    for feature_id, x, y, properties in features:
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            tags.append(keys.setdefault(key, len(keys)))
+            # Значения различаются и по типу: 1 и True — разные значения слоя
+            tags.append(values.setdefault((type(value), value), len(values)))
+
+        geometry = [_CMD_MOVE_TO | 1 << 3, _zigzag(x), _zigzag(y)]
+        encoded_features.append(_bytes_field(2,
+            _tag(1, _VARINT) + _varint(feature_id)
+            + _packed_field(2, tags)
+            + _tag(3, _VARINT) + _varint(_GEOM_POINT)
+            + _packed_field(4, geometry)))
+
+    return _bytes_field(3,
+        _tag(15, _VARINT) + _varint(2)
+        + _bytes_field(1, name.encode('utf-8'))
+        + b''.join(encoded_features)
+        + b''.join(_bytes_field(3, key.encode('utf-8')) for key in keys)
+        + b''.join(_bytes_field(4, _encode_value(value)) for value_type, value in values)
+        + _tag(5, _VARINT) + _varint(extent))
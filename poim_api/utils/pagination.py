@@ -0,0 +1,229 @@
+from django.core import signing
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import BooleanField, F, Func, Q, Value
+from django.utils.encoding import force_text
+from django.utils.translation import gettext_lazy as _
+from rest_framework.compat import coreapi, coreschema
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from poim_api.utils import exceptions
+
+
+class RowComparison(Func):
+    '(a, b) > (x, y) или (a, b) < (x, y) при descending; поддерживается B-деревом по (a, b)'
+
+    output_field = BooleanField()
+
+    def __init__(self, columns, values, descending=False):
+        assert len(columns) == len(values), 'RowComparison requires as many values as columns.'
+        self.operator = '<' if descending else '>'
+        super().__init__(*columns, *values)
+
+    def as_sql(self, compiler, connection):
+        sql, params = [], []
+        for expression in self.source_expressions:
+            expression_sql, expression_params = compiler.compile(expression)
+            sql.append(expression_sql)
+            params.extend(expression_params)
+
+        half = len(sql) // 2
+        return '(({}) {} ({}))'.format(', '.join(sql[:half]), self.operator, ', '.join(sql[half:])), params
+
+
+class KeysetPagination(BasePagination):
+    '''
+    Постраничная выдача по ключу сортировки (keyset pagination).
+
+    Курсор хранит значения полей сортировки последнего элемента страницы, следующая
+    страница выбирается условием `(a, b) > (x, y)` без OFFSET, поэтому глубокие страницы
+    стоят столько же, сколько первая. Сортировка берётся из queryset и должна
+    заканчиваться уникальным полем.
+
+    Тело ответа остаётся списком, ссылка на следующую страницу передаётся в заголовке
+    `Link` с `rel="next"`.
+
+    Представление может ограничить общее число элементов во всех страницах методом
+    `get_max_results()`; счётчик выданных элементов также хранится в курсоре.
+    Курсор подписан (django.core.signing), изменённые клиентом курсоры отклоняются.
+    '''
+    cursor_query_param = 'cursor'
+    cursor_query_description = _('Курсор следующей страницы из заголовка Link.')
+    page_size_query_param = 'page_size'
+    page_size_query_description = _('Количество элементов на странице.')
+    page_size = 100
+    max_page_size = 1000
+    invalid_cursor_message = _('Неверный курсор.')
+    cursor_salt = 'poim_api.utils.pagination.KeysetPagination'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        results = list(page_queryset) if page_queryset is not None else []
+        self.page = results[:self.page_size]
+        self.served += len(self.page)
+        self.has_next = len(results) > self.page_size \
+            and (self.max_results is None or self.served < self.max_results)
+        return self.page
+
+    def get_page_queryset(self, queryset, request, view=None):
+        '''
+        Выборка элементов страницы и одного следующего за ней (признак следующей страницы)
+        без выполнения запроса; None, если страница пуста
+        '''
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        self.max_results = self.get_max_results(view)
+
+        position, self.served = self.decode_cursor(request)
+        if position is not None:
+            queryset = self.filter_position(queryset, position)
+
+        if self.max_results is not None:
+            self.page_size = max(min(self.page_size, self.max_results - self.served), 0)
+
+        return queryset[:self.page_size + 1] if self.page_size else None
+
+    def get_max_results(self, view):
+        if hasattr(view, 'get_max_results'):
+            return view.get_max_results()
+        return None
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size,
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_ordering(self, queryset):
+        ordering = [o for o in queryset.query.order_by if isinstance(o, str)]
+        assert ordering and len(ordering) == len(queryset.query.order_by), (
+            '{} requires a queryset ordered by field names.'.format(type(self).__name__)
+        )
+        return [(o.lstrip('-'), o.startswith('-')) for o in ordering]
+
+    def filter_position(self, queryset, position):
+        names = self._row_fields(queryset)
+        if names is None:
+            return queryset.filter(self._position_filter(position))
+
+        # Сравнение строк (a, b) > (x, y) — условие диапазона по составному индексу (a, b),
+        # в отличие от раскрытого в _position_filter()
+        comparison = RowComparison([F(name) for name in names], [Value(v) for v in position], self.ordering[0][1])
+        queryset = queryset.annotate(keyset_position=comparison).filter(keyset_position=True)
+        # Условие не входит в строки выборки, в том числе values_list()
+        queryset.query.set_annotation_mask(set(queryset.query.annotation_select) - {'keyset_position'})
+        return queryset
+
+    def _row_fields(self, queryset):
+        # Сравнение строк возможно для нескольких полей модели с одним направлением сортировки
+        if len(self.ordering) < 2 or len({descending for name, descending in self.ordering}) > 1:
+            return None
+
+        try:
+            for name, descending in self.ordering:
+                queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+
+        return [name for name, descending in self.ordering]
+
+    def _position_filter(self, position):
+        # (a, b) > (x, y)  =>  a > x OR (a = x AND b > y)
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(self.ordering, position):
+            lookup = '{}__{}'.format(name, 'lt' if descending else 'gt')
+            condition |= equal & Q(**{lookup: value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def _get_position(self, item):
+        if isinstance(item, dict):
+            return [item[name] for name, descending in self.ordering]
+        return [getattr(item, name) for name, descending in self.ordering]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, 0
+
+        try:
+            cursor = signing.loads(encoded, salt=self.cursor_salt)
+            position, served = cursor['p'], cursor['n']
+        except (signing.BadSignature, TypeError, ValueError, KeyError):
+            raise exceptions.NotFound(self.invalid_cursor_message)
+
+        if not isinstance(position, list) or len(position) != len(self.ordering) \
+                or not all(self._is_number(v) for v in position) \
+                or not isinstance(served, int) or isinstance(served, bool) or served < 0:
+            raise exceptions.NotFound(self.invalid_cursor_message)
+
+        return position, served
+
+    def _is_number(self, value):
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+    def encode_cursor(self, position, served):
+        return signing.dumps({'p': position, 'n': served}, salt=self.cursor_salt)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+
+        url = self.request.build_absolute_uri()
+        cursor = self.encode_cursor(self._get_position(self.page[-1]), self.served)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        headers = {}
+        next_link = self.get_next_link()
+        if next_link:
+            headers['Link'] = '<{}>; rel="next"'.format(next_link)
+        return Response(data, headers=headers)
+
+    def get_schema_fields(self, view):
+        assert coreapi is not None, 'coreapi must be installed to use `get_schema_fields()`'
+        assert coreschema is not None, 'coreschema must be installed to use `get_schema_fields()`'
+        return [
+            coreapi.Field(
+                name=self.cursor_query_param,
+                required=False,
+                location='query',
+                schema=coreschema.String(
+                    title='Cursor',
+                    description=force_text(self.cursor_query_description),
+                ),
+            ),
+            coreapi.Field(
+                name=self.page_size_query_param,
+                required=False,
+                location='query',
+                schema=coreschema.Integer(
+                    title='Page size',
+                    description=force_text(self.page_size_query_description),
+                ),
+            ),
+        ]
+
+
+class ChangesPagination(KeysetPagination):
+    '''
+    Выдача изменений после курсора `since`: в отличие от KeysetPagination ссылка в заголовке
+    `Link` с `rel="next"` есть в каждом ответе — на продолжение выдачи, а после пустой страницы
+    та же, что в запросе: по ней позже запрашиваются новые изменения.
+    '''
+    cursor_query_param = 'since'
+    cursor_query_description = _('Курсор из заголовка Link предыдущего ответа.')
+
+    def get_next_link(self):
+        url = self.request.build_absolute_uri()
+        if not self.page:
+            return url
+
+        cursor = self.encode_cursor(self._get_position(self.page[-1]), self.served)
+        return replace_query_param(url, self.cursor_query_param, cursor)
@@ -1,4 +1,15 @@
+import json
+import re
+from xml.sax.saxutils import escape, quoteattr
 from rest_framework import renderers
+from rest_framework.utils.encoders import JSONEncoder
+from poim_api.utils.timing import timed
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 class JSONRenderer(renderers.JSONRenderer):
     def get_indent(self, accepted_media_type, renderer_context):
@@ -7,3 +18,123 @@ class JSONRenderer(renderers.JSONRenderer):
         # If 'indent' is provided in the context, then pretty print the result.
         # E.g. If we're being called by the BrowsableAPIRenderer.
         return renderer_context.get('indent', None)
+
+
+class FastJSONRenderer(JSONRenderer):
+    '''
+    JSONRenderer на orjson, если он установлен. Результат побайтно совпадает с JSONRenderer:
+    даты передаются JSONEncoder из DRF, а в остальных случаях расхождений (отступы,
+    ensure_ascii, типы, не поддерживаемые orjson, запись вещественных чисел меньше 1e-4
+    или от 1e16 по модулю) используется JSONRenderer.
+    '''
+    # Числа, которые orjson может записать иначе, чем repr(): 0.00001, 1e-5, 1e+16, а до версии 3.9
+    # и 1e16 без знака. Совпадения в тексте строк только переключают ответ на JSONRenderer.
+    exponent = re.compile(rb'[0-9][eE]')
+    small_fraction = re.compile(rb'0\.0000(?<![0-9]0\.0000)')
+
+    if orjson is not None:
+        orjson_options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+    @timed('render')
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact \
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=JSONEncoder().default, option=self.orjson_options)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if self.exponent.search(ret) or self.small_fraction.search(ret):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Как в JSONRenderer: U+2028 и U+2029 экранируются для совместимости с JavaScript
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+def _dumps(data):
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+class StreamingRenderer(renderers.BaseRenderer):
+    '''
+    Рендерер последовательности объектов, формирующий ответ по частям методом stream():
+    представление передаёт части в StreamingHttpResponse, не собирая ответ в памяти.
+    '''
+    charset = None
+
+    @timed('render')
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return ''.join(self.stream(data, renderer_context)).encode('utf-8')
+
+    def stream(self, items, renderer_context=None):
+        'Части ответа (str) для итератора объектов items'
+        raise NotImplementedError('Renderer class requires .stream() to be implemented')
+
+
+class NDJSONRenderer(StreamingRenderer):
+    'По одному JSON-объекту на строку'
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def stream(self, items, renderer_context=None):
+        for item in items:
+            yield _dumps(item) + '\n'
+
+
+class GeoPointRendererMixin:
+    'Имена полей координат, идентификатора и названия точки в объектах'
+    latitude_field = 'latitude'
+    longitude_field = 'longitude'
+    id_field = 'id'
+    name_field = 'title'
+
+
+class GeoJSONRenderer(GeoPointRendererMixin, StreamingRenderer):
+    'GeoJSON FeatureCollection из точек; остальные поля объекта — properties'
+    media_type = 'application/geo+json'
+    format = 'geojson'
+
+    def stream(self, items, renderer_context=None):
+        yield '{"type":"FeatureCollection","features":['
+        separator = ''
+        for item in items:
+            properties = dict(item)
+            feature = {
+                'type': 'Feature',
+                'id': properties.pop(self.id_field),
+                'geometry': {
+                    'type': 'Point',
+                    'coordinates': [properties.pop(self.longitude_field), properties.pop(self.latitude_field)],
+                },
+                'properties': properties,
+            }
+            yield separator + _dumps(feature)
+            separator = ','
+        yield ']}\n'
+
+
+class GPXRenderer(GeoPointRendererMixin, StreamingRenderer):
+    'Точки как путевые точки (wpt) GPX 1.1'
+    media_type = 'application/gpx+xml'
+    format = 'gpx'
+    creator = 'poi-manager'
+
+    # Символы, недопустимые в XML 1.0
+    invalid_xml_chars = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+    def _text(self, value):
+        return escape(self.invalid_xml_chars.sub('', str(value)))
+
+    def stream(self, items, renderer_context=None):
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+        yield '<gpx version="1.1" creator={} xmlns="http://www.topografix.com/GPX/1/1">\n'.format(
+            quoteattr(self.creator))
+        for item in items:
+            yield '<wpt lat="{!r}" lon="{!r}"><name>{}</name></wpt>\n'.format(
+                float(item[self.latitude_field]),
+                float(item[self.longitude_field]),
+                self._text(item[self.name_field]),
+            )
+        yield '</gpx>\n'
@@ -1,6 +1,9 @@
 import json
-from django.test import Client, TestCase as DjangoTestCase
+from django.core.cache import cache
+from django.db import connections
+from django.test import Client, TestCase as DjangoTestCase, TransactionTestCase as DjangoTransactionTestCase
 from django.test.client import JSON_CONTENT_TYPE_RE
+from poim.utils import replicas, tokens
 
 
 class APIClient(Client):
@@ -57,9 +60,42 @@ class TestCase(DjangoTestCase):
 
     def setUp(self):
         super().setUp()
+        # Кэш не откатывается вместе с БД: записи предыдущих тестов не должны попадать в выдачу
+        cache.clear()
+        tokens.local_cache.clear()
         self.client = APIClient()
 
 
+class TransactionTestCase(DjangoTransactionTestCase):
+    'Для проверок, зависящих от фиксации транзакций: каждый запрос клиента фиксирует свою'
+    maxDiff = None
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        tokens.local_cache.clear()
+        self.client = APIClient()
+
+
+class ReplicaTestMixin:
+    '''
+    Реплика replica — второе соединение с тестовой БД: как и настоящая реплика, она видит
+    только зафиксированные изменения. Используется с TransactionTestCase и DATABASE_REPLICAS.
+    '''
+    replica = 'replica'
+
+    def setUp(self):
+        if self.replica not in connections.databases:
+            connections.databases[self.replica] = dict(connections['default'].settings_dict)
+        replicas.reset()
+        super().setUp()
+
+    def tearDown(self):
+        super().tearDown()
+        connections[self.replica].close()
+        replicas.reset()
+
+
 class MultipleUsersTestMixin:
     usernames = ['alice', 'bob', 'carol']
 
@@ -0,0 +1,153 @@
+'''
+Замеры времени обработки запросов API: число и время запросов к БД (обёртки выполнения
+запросов всех соединений), время этапов фильтрации, сериализации и формирования ответа.
+
+Замеры включает для доли запросов TimingMiddleware (poim_api.utils.middleware), этапы
+отмечаются декоратором timed(). Время этапов включает запросы к БД, выполненные в них.
+Передача потокового ответа (выгрузки точек) в замеры не входит.
+'''
+import functools
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import ExitStack, contextmanager
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+STAGES = ['filter', 'serialize', 'render']
+
+# Значения замеров в журнале и сводке, время в миллисекундах
+FIELDS = ['total_ms', 'db_queries', 'db_ms'] + ['{}_ms'.format(name) for name in STAGES]
+
+_local = threading.local()
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.total = 0.0
+        self.queries = 0
+        self.db = 0.0
+        self.stages = OrderedDict((name, 0.0) for name in STAGES)
+        self.depth = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        'Обёртка выполнения запросов к БД, см. BaseDatabaseWrapper.execute_wrapper()'
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db += time.perf_counter() - started
+
+    @contextmanager
+    def stage(self, name):
+        # Время вложенных вызовов (например, запасного рендерера) учитывается один раз
+        self.depth[name] += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.depth[name] -= 1
+            if not self.depth[name]:
+                self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - started
+
+    def finish(self):
+        self.total = time.perf_counter() - self.started
+
+    def as_dict(self):
+        'Значения FIELDS'
+        values = OrderedDict([('total_ms', self.total * 1000), ('db_queries', self.queries), ('db_ms', self.db * 1000)])
+        values.update(('{}_ms'.format(name), duration * 1000) for name, duration in self.stages.items())
+        return values
+
+    def header(self):
+        'Значение заголовка Server-Timing'
+        metrics = ['total;dur={:.1f}'.format(self.total * 1000),
+            'db;dur={:.1f};desc="{} queries"'.format(self.db * 1000, self.queries)]
+        metrics += ['{};dur={:.1f}'.format(name, duration * 1000) for name, duration in self.stages.items()]
+        return ', '.join(metrics)
+
+
+def get_timings():
+    'Замеры текущего запроса или None'
+    return getattr(_local, 'timings', None)
+
+
+@contextmanager
+def measure():
+    timings = RequestTimings()
+    _local.timings = timings
+    try:
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(timings))
+            yield timings
+    finally:
+        _local.timings = None
+        timings.finish()
+
+
+def timed(name):
+    'Декоратор метода этапа обработки запроса name'
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            timings = get_timings()
+            if timings is None:
+                return func(*args, **kwargs)
+            with timings.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class ViewTimingStats:
+    '''
+    Сводка замеров по представлениям: число запросов, суммы времени и запросов к БД.
+    Выводится в журнал каждые REQUEST_TIMING_STATS_INTERVAL запросов с замерами.
+    '''
+
+    def __init__(self):
+        self.views = {}
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def record(self, view, timings):
+        with self.lock:
+            totals = self.views.setdefault(view, Counter())
+            totals['requests'] += 1
+            totals.update(timings.as_dict())
+            self.count += 1
+            count = self.count
+
+        interval = settings.REQUEST_TIMING_STATS_INTERVAL
+        if interval and count % interval == 0:
+            # Сначала представления с наибольшим суммарным временем
+            views = sorted(self.get().items(), key=lambda item: -item[1]['total_ms'] * item[1]['requests'])
+            for view, averages in views:
+                logger.info('View timing: %s, %d requests, mean %s', view, averages['requests'],
+                    ' '.join('{}={}'.format(name, round(averages[name], 1)) for name in FIELDS))
+
+    def get(self):
+        'Средние значения по представлениям и число запросов'
+        with self.lock:
+            views = {view: Counter(totals) for view, totals in self.views.items()}
+
+        result = {}
+        for view, totals in views.items():
+            result[view] = OrderedDict([('requests', totals['requests'])])
+            result[view].update((name, totals[name] / totals['requests']) for name in FIELDS)
+        return result
+
+    def reset(self):
+        with self.lock:
+            self.views.clear()
+            self.count = 0
+
+
+stats = ViewTimingStats()